@@ -1,8 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from src.qa_service import QAService
+from typing import List, Optional
+from src.admission import CLIENT_DISCONNECTS, Overloaded, admission_from_env
+from src.readiness import Readiness
+from src.resilience import UpstreamUnavailable, request_budget
+from src import metrics
 from dotenv import load_dotenv
+import asyncio
+import contextlib
+import hmac
+import json
 import os
+import threading
+import time
+import weakref
 from fastapi.middleware.cors import CORSMiddleware
 
 load_dotenv()
@@ -17,13 +29,43 @@ app.add_middleware(
 )
 
 qa_service = None
+readiness = Readiness()
+# Bounds concurrent and queued work on the question and message endpoints.
+admission = admission_from_env()
+metrics.REGISTRY.add_collector(admission.collect_metrics)
+
+
+def _load_service():
+    global qa_service
+    # Imported here so the server binds its port before the heavy imports.
+    from src.qa_service import QAService
+    
+    service = QAService(readiness=readiness)
+    metrics.REGISTRY.add_collector(service.collect_metrics)
+    qa_service = service
+    if os.getenv("WARM_INDEXES", "1") == "1":
+        threading.Thread(target=service.warm, name="warm-indexes", daemon=True).start()
+    return service
+
+
+def _report_load_failure(task):
+    if not task.cancelled() and task.exception():
+        print(f"Failed to initialize QA service: {task.exception()}")
 
 
 @app.on_event("startup")
 async def startup_event():
-    global qa_service
+    """
+    STARTUP_MODE=eager (default) loads everything before serving; "background"
+    starts serving at once and loads in a thread, with /ready reporting
+    progress and /question returning 503 until it is done.
+    """
+    if os.getenv("STARTUP_MODE", "eager") == "background":
+        app.state.load_task = asyncio.create_task(asyncio.to_thread(_load_service))
+        app.state.load_task.add_done_callback(_report_load_failure)
+        return
     try:
-        qa_service = QAService()
+        _load_service()
     except Exception as e:
         print(f"Failed to initialize QA service: {e}")
         raise
@@ -31,10 +73,51 @@ async def startup_event():
 
 class QuestionRequest(BaseModel):
     question: str
+    # Follow-ups in the same session inherit the member and earlier retrieval.
+    session_id: Optional[str] = None
 
 
 class AnswerResponse(BaseModel):
     answer: str
+    cached: bool = False
+    prompt_tokens: Optional[int] = None
+    degraded: List[str] = []
+    session_id: Optional[str] = None
+
+
+class BatchQuestionsRequest(BaseModel):
+    questions: List[str]
+
+
+class BatchAnswer(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    cached: bool = False
+    prompt_tokens: Optional[int] = None
+    degraded: List[str] = []
+    error: Optional[str] = None
+
+
+class BatchAnswerResponse(BaseModel):
+    answers: List[BatchAnswer]
+
+
+class MessageRequest(BaseModel):
+    user_name: str
+    message: str
+    user_id: Optional[str] = None
+    timestamp: Optional[str] = None
+    category: Optional[str] = None
+    id: Optional[str] = None
+
+
+class BulkMessagesRequest(BaseModel):
+    messages: List[MessageRequest]
+
+
+class IngestResponse(BaseModel):
+    ids: List[str]
+    generation: int
 
 
 @app.get("/")
@@ -47,20 +130,229 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready():
+    snapshot = readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def _wants_trace(http_request):
+    # Per-request spans, returned in X-Trace (or the stream's "done" event).
+    return os.getenv("DEBUG_TRACE", "0") == "1" or http_request.headers.get("x-debug-trace", "") not in ("", "0")
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def _rejection(e):
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def _unless_disconnected(http_request, endpoint, coro, poll=0.25):
+    """Await `coro`, cancelling it if the client goes away first, so no work is spent on an unread answer."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                CLIENT_DISCONNECTS.inc(endpoint=endpoint)
+                raise ClientDisconnected()
+    finally:
+        task.cancel()
+
+
 @app.post("/question", response_model=AnswerResponse)
-async def answer_question(request: QuestionRequest):
+async def answer_question(request: QuestionRequest, http_request: Request, response: Response):
     if not qa_service:
         raise HTTPException(status_code=503, detail="Service not available")
     
     if not request.question or not request.question.strip():
         raise HTTPException(status_code=400, detail="Question is required")
     
+    trace = metrics.start_trace() if _wants_trace(http_request) else None
+    start = time.perf_counter()
+    status = "500"
     try:
-        answer = qa_service.answer_question(request.question.strip())
-        return AnswerResponse(answer=answer)
+        # Time spent queued counts against the request budget.
+        with request_budget(qa_service.request_budget):
+            async with admission.admit():
+                result = await _unless_disconnected(http_request, "/question",
+                                                    qa_service.answer(request.question.strip(), request.session_id))
+        status = "200"
+        if trace is not None:
+            response.headers["X-Trace"] = json.dumps(trace.spans, separators=(",", ":"))
+        return AnswerResponse(**result, session_id=request.session_id)
+    except Overloaded as e:
+        status = str(e.status_code)
+        raise _rejection(e)
+    except ClientDisconnected:
+        status = "499"
+        return Response(status_code=499)
+    except UpstreamUnavailable as e:
+        status = "503"
+        print(f"Upstream unavailable: {e}")
+        raise HTTPException(status_code=503, detail="Answer model unavailable, please retry")
     except Exception as e:
         print(f"Error processing question: {e}")
         raise HTTPException(status_code=500, detail="Failed to process question")
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="/question", status=status)
+
+
+async def _ingest(messages, endpoint):
+    if not qa_service:
+        raise HTTPException(status_code=503, detail="Service not available")
+    
+    max_batch = int(os.getenv("MAX_INGEST_BATCH", 1000))
+    if len(messages) > max_batch:
+        raise HTTPException(status_code=413, detail=f"At most {max_batch} messages per request")
+    
+    start = time.perf_counter()
+    status = "500"
+    try:
+        with request_budget(qa_service.request_budget):
+            async with admission.admit():
+                ids, generation = await qa_service.ingest([m.model_dump() for m in messages])
+        status = "200"
+        return IngestResponse(ids=ids, generation=generation)
+    except Overloaded as e:
+        status = str(e.status_code)
+        raise _rejection(e)
+    except ValueError as e:
+        status = "400"
+        raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamUnavailable as e:
+        status = "503"
+        print(f"Upstream unavailable: {e}")
+        raise HTTPException(status_code=503, detail="Embedding model unavailable, please retry")
+    except Exception as e:
+        print(f"Error adding messages: {e}")
+        raise HTTPException(status_code=500, detail="Failed to add messages")
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=status)
+
+
+def require_ingest_key(x_api_key: Optional[str] = Header(None)):
+    # Ingestion is off unless INGEST_API_KEY is set; writes feed every member's answers.
+    expected = os.getenv("INGEST_API_KEY", "")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Ingestion is disabled")
+    if not x_api_key or not hmac.compare_digest(x_api_key.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-API-Key",
+                            headers={"WWW-Authenticate": "ApiKey"})
+
+
+@app.post("/messages", response_model=IngestResponse, dependencies=[Depends(require_ingest_key)])
+async def add_message(request: MessageRequest):
+    return await _ingest([request], "/messages")
+
+
+@app.post("/messages/bulk", response_model=IngestResponse, dependencies=[Depends(require_ingest_key)])
+async def add_messages(request: BulkMessagesRequest):
+    return await _ingest(request.messages, "/messages/bulk")
+
+
+@app.post("/questions", response_model=BatchAnswerResponse)
+async def answer_questions(request: BatchQuestionsRequest, http_request: Request):
+    if not qa_service:
+        raise HTTPException(status_code=503, detail="Service not available")
+    
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="At least one question is required")
+    max_batch = int(os.getenv("MAX_BATCH_QUESTIONS", 500))
+    if len(request.questions) > max_batch:
+        raise HTTPException(status_code=413, detail=f"At most {max_batch} questions per request")
+    
+    start = time.perf_counter()
+    status = "500"
+    try:
+        # Only the wait for a slot counts against the request budget; every
+        # question in the batch then gets a budget of its own (answer_batch).
+        with request_budget(qa_service.request_budget):
+            ticket = await admission.acquire()
+        try:
+            # Failures of single questions come back per item; only a failure of the batch as a whole is a 500.
+            answers = await _unless_disconnected(http_request, "/questions", qa_service.answer_batch(request.questions))
+        finally:
+            ticket.release()
+        status = "200"
+        return BatchAnswerResponse(answers=[BatchAnswer(**a) for a in answers])
+    except Overloaded as e:
+        status = str(e.status_code)
+        raise _rejection(e)
+    except ClientDisconnected:
+        status = "499"
+        return Response(status_code=499)
+    except Exception as e:
+        print(f"Error processing batch: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process questions")
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="/questions", status=status)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/question/stream")
+async def stream_question(request: QuestionRequest, http_request: Request):
+    if not qa_service:
+        raise HTTPException(status_code=503, detail="Service not available")
+    
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question is required")
+    
+    trace = _wants_trace(http_request)
+    
+    # Admitted before the response starts, so a rejection is still a 429/503.
+    start = time.perf_counter()
+    try:
+        with request_budget(qa_service.request_budget):
+            ticket = await admission.acquire()
+    except Overloaded as e:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="/question/stream",
+                                        status=str(e.status_code))
+        raise _rejection(e)
+    
+    async def events():
+        if trace:
+            metrics.start_trace()
+        status = "200"
+        try:
+            async with contextlib.aclosing(qa_service.stream_answer(request.question.strip(),
+                                                                    request.session_id)) as answer:
+                async for event, data in answer:
+                    yield _sse(event, data)
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client disconnected, while we awaited (cancelled) or between
+            # events (closed); closing the answer stream closes the LLM stream.
+            status = "499"
+            CLIENT_DISCONNECTS.inc(endpoint="/question/stream")
+            raise
+        except Exception as e:
+            status = "500"
+            print(f"Error streaming answer: {e}")
+            yield _sse("error", {"detail": "Failed to process question"})
+        finally:
+            ticket.release()
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="/question/stream", status=status)
+    
+    stream = events()
+    # Also frees the slot if the stream is dropped before it ever starts.
+    weakref.finalize(stream, ticket.release)
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 if __name__ == "__main__":
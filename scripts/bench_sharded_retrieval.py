@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import build_artifacts, summarize, timed
+
+
+def replay(search, queries, concurrency):
+    """Run `search` over `queries` from `concurrency` client threads; per-query latencies and wall time."""
+    def one(query):
+        start = time.perf_counter()
+        search(query)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as clients:
+        latencies = list(clients.map(one, queries))
+    return latencies, time.perf_counter() - start
+
+
+def report(latencies, seconds):
+    return {**summarize(latencies), "throughput_qps": round(len(latencies) / seconds, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and throughput of BM25 + vector retrieval in process "
+                                                 "and through the sharded process pool, from 1 to N workers.")
+    parser.add_argument("--corpus-dir", default="data/synthetic",
+                        help="output of scripts/generate_corpus.py (e.g. --messages 1000000)")
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--workers", default=None, help="comma-separated worker counts (default 1,2,4,... up to "
+                                                        "the number of cores)")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads issuing queries")
+    parser.add_argument("--queries", type=int, default=400, help="queries per run")
+    parser.add_argument("--unfiltered", type=float, default=0.25,
+                        help="share of queries without a member filter, which go to every shard")
+    parser.add_argument("--embed-dim", type=int, default=64)
+    parser.add_argument("--category-sample", type=int, default=20_000, help="messages to train the classifier on")
+    parser.add_argument("--skip-build", action="store_true", help="reuse indexes already in --corpus-dir")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    from src.bm25_retrieval import BM25Index
+    from src.embedding_provider import HashEmbeddingProvider
+    from src.message_store import MessageStore
+    from src.mmap_vector_index import MmapVectorIndex
+    from src.sharded_retrieval import ShardedRetriever, build_shards
+
+    corpus_dir = os.path.abspath(args.corpus_dir)
+    provider = HashEmbeddingProvider(dim=args.embed_dim)
+    result = {"cores": os.cpu_count(), "settings": {k: v for k, v in vars(args).items() if k != "output"}}
+
+    if not args.skip_build:
+        with open(os.path.join(corpus_dir, "messages_with_categories.json")) as f:
+            messages = json.load(f)
+        with open(os.path.join(corpus_dir, "user_index.json")) as f:
+            user_index = json.load(f)
+        result["build_seconds"] = build_artifacts(corpus_dir, messages, user_index, provider, False,
+                                                  args.category_sample)
+        del messages
+
+    store = MessageStore.load(os.path.join(corpus_dir, "message_store"))
+    bm25 = BM25Index.load(os.path.join(corpus_dir, "bm25_index"), store)
+    vectors = MmapVectorIndex(os.path.join(corpus_dir, "vector_index"), embedder=provider)
+    shards_dir = os.path.join(corpus_dir, "shards")
+    if not args.skip_build or not os.path.exists(os.path.join(shards_dir, "manifest.json")):
+        sizes, seconds = timed(build_shards, vectors, shards_dir, args.shards)
+        result.setdefault("build_seconds", {})["shards"] = seconds
+        result["shard_sizes"] = sizes
+    result["messages"] = len(store)
+
+    with open(os.path.join(corpus_dir, "workload.jsonl")) as f:
+        workload = [json.loads(line) for line in f if line.strip()]
+    rng = random.Random(0)
+    picked = [workload[i % len(workload)] for i in range(args.queries)]
+    embeddings = provider.embed([q["question"] for q in picked], "retrieval_query")
+    queries = [
+        (q["question"], None if rng.random() < args.unfiltered else q["user_name"], q["category"], e)
+        for q, e in zip(picked, embeddings)
+    ]
+
+    def in_process(query):
+        question, user_name, category, embedding = query
+        bm25.search_scored(question, user_name, category)
+        vectors.search(question, user_name, [category], 25, embedding)
+
+    bm25.warm()
+    vectors.warm()
+    in_process(queries[0])
+    result["in_process"] = report(*replay(in_process, queries, args.concurrency))
+
+    if args.workers:
+        worker_counts = [int(n) for n in args.workers.split(",")]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+            worker_counts.append(worker_counts[-1] * 2)
+
+    result["sharded"] = []
+    for workers in worker_counts:
+        engine = ShardedRetriever(shards_dir, bm25, embedder=provider, workers=workers)
+        try:
+            # Maps every shard in at least one worker; the rest map on their first query.
+            engine.warm()
+
+            def sharded(query):
+                question, user_name, category, embedding = query
+                engine.search_scored(question, user_name, category)
+                engine.search(question, user_name, [category], 25, embedding)
+
+            replay(sharded, queries[:args.concurrency * 2], args.concurrency)
+            result["sharded"].append({"workers": workers, **report(*replay(sharded, queries, args.concurrency))})
+        finally:
+            engine.close()
+        print(f"{workers} workers: {result['sharded'][-1]}", file=sys.stderr)
+
+    base = result["sharded"][0]["throughput_qps"]
+    for run in result["sharded"]:
+        run["speedup"] = round(run["throughput_qps"] / base, 2)
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.embedding_cache import CachedEmbedder, EmbeddingCache
+from src.embedding_provider import get_provider
+from src.mmap_vector_index import MmapVectorIndex
+from src.vector_retrieval import VectorRetriever
+
+
+def percentile(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def run(backend, queries, top_k):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        hits = backend.search(q["text"], q["user_name"], q["categories"], top_k, query_embedding=q["embedding"])
+        latencies.append(time.perf_counter() - start)
+        results.append([h["distance"] for h in hits])
+    return latencies, results
+
+
+def recall_at_k(results, truth, tolerance=1e-4):
+    """
+    Share of the exact top-k that a backend found. Hits are matched by
+    distance rather than id, so equally distant duplicates count as hits.
+    """
+    scores = []
+    for found, exact in zip(results, truth):
+        if exact:
+            cutoff = max(exact) + tolerance
+            scores.append(min(sum(d <= cutoff for d in found), len(exact)) / len(exact))
+    return round(float(np.mean(scores)), 4) if scores else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and recall@k of the Chroma and mmap vector backends.")
+    parser.add_argument("--messages", default="data/messages_with_categories.json")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=25)
+    parser.add_argument("--provider", default="gemini", choices=["gemini", "hash"],
+                        help="must match the provider the store was built with")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.messages) as f:
+        messages = json.load(f)
+
+    embedder = CachedEmbedder(EmbeddingCache(db_path="data/embedding_cache.sqlite"), provider=get_provider(args.provider))
+    chroma = VectorRetriever(embedder=embedder)
+
+    exact_dir, int8_dir = "data/bench_vector_index", "data/bench_vector_index_int8"
+    MmapVectorIndex.export_from_chroma(chroma.collection, exact_dir)
+    MmapVectorIndex.export_from_chroma(chroma.collection, int8_dir, quantize=True)
+    backends = {
+        "chroma": chroma,
+        "mmap_f32": MmapVectorIndex(exact_dir, embedder=embedder),
+        "mmap_int8": MmapVectorIndex(int8_dir, embedder=embedder),
+    }
+
+    # Queries are perturbed corpus messages, scoped like real requests:
+    # half to a member and one or two categories, half to categories only.
+    rng = random.Random(args.seed)
+    categories = sorted({m["category"] for m in messages})
+    queries = []
+    for m in rng.sample(messages, min(args.queries, len(messages))):
+        words = m["message"].split()
+        text = " ".join(rng.sample(words, max(1, len(words) * 2 // 3)))
+        cats = rng.sample(categories, rng.choice([1, 2]))
+        queries.append({
+            "text": text,
+            "user_name": m["user_name"] if rng.random() < 0.5 else None,
+            "categories": cats,
+        })
+    for q, emb in zip(queries, embedder.embed([q["text"] for q in queries])):
+        q["embedding"] = emb
+
+    # Exact float32 search is the ground truth for recall.
+    report = {"queries": len(queries), "top_k": args.top_k, "corpus": len(backends["mmap_f32"]), "backends": {}}
+    _, truth = run(backends["mmap_f32"], queries, args.top_k)
+    for name, backend in backends.items():
+        run(backend, queries[:10], args.top_k)
+        latencies, results = run(backend, queries, args.top_k)
+        report["backends"][name] = {
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            f"recall@{args.top_k}": recall_at_k(results, truth),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
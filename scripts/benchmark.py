@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def summarize(samples):
+    if not samples:
+        return None
+    ms = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, round(time.perf_counter() - start, 4)
+
+
+def build_artifacts(corpus_dir, messages, user_index, provider, quantize, category_sample, batch_size=10_000):
+    """Build every index the service loads; returns per-artifact build seconds."""
+    from src.analytics_index import AnalyticsIndex
+    from src.bm25_retrieval import BM25Index
+    from src.local_extractor import train_category_model
+    from src.message_store import MessageStore
+    from src.mmap_vector_index import MmapVectorIndex
+    from src.resolve_name import NameIndex
+
+    seconds = {}
+    store, seconds["message_store"] = timed(MessageStore.build, messages)
+    store.save(os.path.join(corpus_dir, "message_store"))
+    store = MessageStore.load(os.path.join(corpus_dir, "message_store"))
+
+    bm25, seconds["bm25_index"] = timed(BM25Index.build, store)
+    bm25.save(os.path.join(corpus_dir, "bm25_index"))
+
+    analytics, seconds["analytics_index"] = timed(AnalyticsIndex.build, store)
+    analytics.save(os.path.join(corpus_dir, "analytics_index"))
+
+    _, seconds["name_index"] = timed(NameIndex, user_index)
+
+    sample = random.Random(0).sample(messages, min(category_sample, len(messages)))
+    model, seconds["category_model"] = timed(train_category_model, sample)
+    import joblib
+    joblib.dump(model, os.path.join(corpus_dir, "category_model.joblib"))
+
+    start = time.perf_counter()
+    texts = [m["message"] for m in store]
+    embeddings = np.zeros((len(texts), provider.dim), dtype=np.float32)
+    for i in range(0, len(texts), batch_size):
+        embeddings[i:i + batch_size] = provider.embed(texts[i:i + batch_size])
+    metadatas = [{k: m[k] for k in ("user_id", "user_name", "timestamp", "category")} for m in store]
+    MmapVectorIndex.save(os.path.join(corpus_dir, "vector_index"), [m["id"] for m in store], texts, metadatas,
+                         embeddings, quantize=quantize)
+    seconds["vector_index"] = round(time.perf_counter() - start, 4)
+    return seconds
+
+
+def component_latencies(service, workload, provider):
+    """
+    Name resolution, BM25, vector search and merge timed one call at a time,
+    outside the pipeline. Query embeddings are computed up front with the
+    fault-free `provider`, so vector search is timed on its own.
+    """
+    from src.fusion import fuse_results
+
+    embeddings = provider.embed([q["question"] for q in workload], "retrieval_query")
+    samples = {"name_resolution": [], "bm25": [], "vector": [], "merge": []}
+    for query, embedding in zip(workload, embeddings):
+        q, name, cats = query["question"], query["user_name"], [query["category"]]
+        start = time.perf_counter()
+        service.name_index.resolve(name) if name else None
+        samples["name_resolution"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        bm25 = service.bm25_index.search_scored(q, name, cats[0])
+        samples["bm25"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        vector = service.vector_retriever.search(q, name, cats, query_embedding=embedding)
+        samples["vector"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        fuse_results({"bm25": (bm25, "bm25_score", True), "chroma": (vector, "distance", False)},
+                     top_n=service.context_k)
+        samples["merge"].append(time.perf_counter() - start)
+    return {stage: summarize(s) for stage, s in samples.items()}
+
+
+async def load_test(app, workload, concurrency, requests_per_level):
+    """N clients replaying the workload against the ASGI app; per-stage spans come from X-Trace."""
+    import httpx
+
+    latencies, stages, statuses, degraded = [], {}, {}, {}
+    cursor = iter(range(requests_per_level))
+
+    async def client(http):
+        for i in cursor:
+            query = workload[i % len(workload)]
+            start = time.perf_counter()
+            response = await http.post("/question", json={"question": query["question"]},
+                                       headers={"X-Debug-Trace": "1"})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code != 200:
+                continue
+            for upstream in response.json().get("degraded", []):
+                degraded[upstream] = degraded.get(upstream, 0) + 1
+            for span in json.loads(response.headers.get("x-trace", "[]")):
+                stages.setdefault(span["name"], []).append(span["duration_ms"] / 1000)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(n for status, n in statuses.items() if status != 200),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "degraded": degraded,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency": summarize(latencies),
+        "stages": {name: summarize(s) for name, s in sorted(stages.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of index builds and the QA pipeline with "
+                                                 "local LLM and embedding stand-ins.")
+    parser.add_argument("--corpus-dir", default="data/synthetic", help="output of scripts/generate_corpus.py")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="simulated seconds to first token")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="simulated seconds per embedding call")
+    parser.add_argument("--embed-dim", type=int, default=768)
+    parser.add_argument("--quantize", action="store_true", help="int8 vector index")
+    parser.add_argument("--category-sample", type=int, default=20_000, help="messages to train the classifier on")
+    parser.add_argument("--skip-build", action="store_true", help="reuse indexes already in --corpus-dir")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="injected LLM failures")
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="injected LLM stalls")
+    parser.add_argument("--embed-failure-rate", type=float, default=0.0, help="injected embedding failures")
+    parser.add_argument("--embed-slow-rate", type=float, default=0.0, help="injected embedding stalls")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="seconds an injected stall lasts")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["STUB_LLM_LATENCY"] = str(args.llm_latency)
+    os.environ["EMBEDDING_PROVIDER"] = "hash"
+    os.environ["FAULT_LLM_FAILURE_RATE"] = str(args.llm_failure_rate)
+    os.environ["FAULT_LLM_SLOW_RATE"] = str(args.llm_slow_rate)
+    os.environ["FAULT_EMBED_FAILURE_RATE"] = str(args.embed_failure_rate)
+    os.environ["FAULT_EMBED_SLOW_RATE"] = str(args.embed_slow_rate)
+    os.environ["FAULT_SLOW_LATENCY"] = str(args.slow_latency)
+
+    from src.answer_cache import AnswerCache, MemoryBackend
+    from src.embedding_cache import CachedEmbedder, EmbeddingCache
+    from src.embedding_provider import HashEmbeddingProvider
+    from src.fault_injection import faults_from_env
+    from src.mmap_vector_index import MmapVectorIndex
+    from src.qa_service import QAService
+    import app as app_module
+
+    corpus_dir = os.path.abspath(args.corpus_dir)
+    with open(os.path.join(corpus_dir, "messages_with_categories.json")) as f:
+        messages = json.load(f)
+    with open(os.path.join(corpus_dir, "user_index.json")) as f:
+        user_index = json.load(f)
+    with open(os.path.join(corpus_dir, "workload.jsonl")) as f:
+        workload = [json.loads(line) for line in f if line.strip()]
+
+    # No embedding or answer caching, so every request pays the simulated latencies.
+    provider = HashEmbeddingProvider(dim=args.embed_dim, latency=args.embed_latency)
+    embedder = CachedEmbedder(EmbeddingCache(max_entries=0), provider=faults_from_env(provider, "EMBED"))
+    report = {
+        "corpus": {"messages": len(messages), "members": len(user_index), "queries": len(workload)},
+        "settings": {k: v for k, v in vars(args).items() if k != "output"},
+    }
+    if not args.skip_build:
+        report["build_seconds"] = build_artifacts(corpus_dir, messages, user_index,
+                                                  HashEmbeddingProvider(args.embed_dim), args.quantize,
+                                                  args.category_sample)
+    del messages
+    report["peak_rss_mb_after_build"] = peak_rss_mb()
+
+    start = time.perf_counter()
+    service = QAService(
+        messages_path=os.path.join(corpus_dir, "messages_with_categories.json"),
+        user_index_path=os.path.join(corpus_dir, "user_index.json"),
+        bm25_index_path=os.path.join(corpus_dir, "bm25_index"),
+        analytics_index_path=os.path.join(corpus_dir, "analytics_index"),
+        segments_dir=os.path.join(corpus_dir, "segments"),
+        message_store_dir=os.path.join(corpus_dir, "message_store"),
+        category_model_path=os.path.join(corpus_dir, "category_model.joblib"),
+        answer_cache=AnswerCache(MemoryBackend(max_entries=0)),
+        vector_retriever=MmapVectorIndex(os.path.join(corpus_dir, "vector_index"), embedder=embedder),
+        require_artifacts=True,
+    )
+    report["service_load_seconds"] = round(time.perf_counter() - start, 4)
+    report["components"] = component_latencies(service, workload, HashEmbeddingProvider(args.embed_dim))
+
+    app_module.qa_service = service
+    report["load"] = [
+        asyncio.run(load_test(app_module.app, workload, int(c), args.requests))
+        for c in args.concurrency.split(",")
+    ]
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import joblib
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.analytics_index import AnalyticsIndex
+from src.answer_cache import bump_corpus_version
+from src.bm25_retrieval import BM25Index
+from src.local_extractor import train_category_model
+from src.message_store import MessageStore
+from src.mmap_vector_index import MmapVectorIndex
+from src.sharded_retrieval import build_shards
+
+parser = argparse.ArgumentParser(description="Build the read-only indexes the service memory-maps at startup.")
+parser.add_argument("--if-missing", action="store_true",
+                    help="only build artifacts that don't exist yet (used by the Dockerfile before starting workers)")
+parser.add_argument("--shards", type=int, default=int(os.getenv("RETRIEVAL_SHARDS", 0)),
+                    help="also split the vector index into this many member shards for RETRIEVAL_WORKERS")
+args = parser.parse_args()
+
+
+def missing(path):
+    return not args.if_missing or not os.path.exists(path)
+
+
+MESSAGES_PATH = "data/messages_with_categories.json"
+
+with open(MESSAGES_PATH) as f:
+    messages = json.load(f)
+
+built = False
+# A store built from another version of the messages file is rebuilt, and everything over it with it.
+if missing("data/message_store/meta.json") or not MessageStore.load("data/message_store").built_from(MESSAGES_PATH):
+    MessageStore.build(messages, source=MESSAGES_PATH).save("data/message_store")
+    built = True
+store = MessageStore.load("data/message_store")
+
+print(f"Message store over {len(store)} messages ({len(store.user_names)} members).")
+
+# Built over the store so BM25 doc ids are store rows.
+if built or missing("data/bm25_index/tokenizer.npy"):
+    bm25_index = BM25Index.build(store)
+    bm25_index.save("data/bm25_index")
+    print(f"Built BM25 index over {bm25_index.n_docs} messages ({len(bm25_index.vocab)} terms).")
+    built = True
+
+# Entity tables point at store rows too.
+if built or missing("data/analytics_index/meta.json"):
+    analytics_index = AnalyticsIndex.build(store)
+    analytics_index.save("data/analytics_index")
+    print(f"Built analytics index: {len(analytics_index)} mentions of {len(analytics_index.entity_names)} entities.")
+    built = True
+
+if missing("data/category_model.joblib"):
+    category_model = train_category_model(messages)
+    joblib.dump(category_model, "data/category_model.joblib")
+    print(f"Trained category model on {len(messages)} messages.")
+    built = True
+
+if os.path.exists("data/chroma_store") and missing("data/vector_index/records/meta.json"):
+    import chromadb
+
+    collection = chromadb.PersistentClient(path="data/chroma_store").get_collection("member_messages")
+    exported = MmapVectorIndex.export_from_chroma(collection, "data/vector_index")
+    print(f"Exported {exported} embeddings to data/vector_index.")
+    built = True
+
+if args.shards and os.path.exists("data/vector_index/meta.json") and (built or missing("data/shards/manifest.json")):
+    sizes = build_shards(MmapVectorIndex("data/vector_index"), "data/shards", args.shards)
+    print(f"Split {sum(sizes)} messages into {len(sizes)} shards (largest {max(sizes)}).")
+    built = True
+
+if built:
+    print(f"Corpus version is now {bump_corpus_version()}.")
+else:
+    print("All indexes already built.")
@@ -1,27 +1,159 @@
+import argparse
 import requests
 import json
 import os
+import sys
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.answer_cache import bump_corpus_version
 
 load_dotenv()
 
 API_URL = os.getenv('url')
-os.makedirs("data", exist_ok=True)
 
-resp = requests.get(API_URL)
-resp.raise_for_status()
-data = resp.json()
-total = data.get("total", len(data.get("items", [])))
 
-print(f"Total messages available: {total}")
+def make_session(pool_size=4):
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class SourceChanged(RuntimeError):
+    """The source no longer has the last synced record where the offset says it is."""
+
+
+def _fresh_state():
+    return {"offset": 0, "last_timestamp": None, "last_id": None}
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return _fresh_state()
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def fetch_page(session, url, skip, limit, timeout=30):
+    resp = session.get(url, params={"skip": skip, "limit": limit}, timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def sync(url, out_path, state_path, page_size=500, full=False):
+    """
+    Page through the source and append new records to a JSON-lines file.
+
+    The source is expected to be append-only, so the stored offset is the
+    resume point and a delta run only fetches what was added since. The
+    state also keeps the (timestamp, id) of the last record written. Each
+    page is fetched with a one-record overlap, and that record must be the
+    last one written. If it is not, records were inserted or removed below
+    the offset, and the sync starts over as a full one instead of skipping
+    or duplicating messages. Memory stays at one page regardless of corpus
+    size.
+    """
+    state = _fresh_state() if full else load_state(state_path)
+
+    with make_session() as session:
+        first = fetch_page(session, url, 0, 1)
+        total = first.get("total", 0)
+        print(f"Total messages available: {total}")
+
+        if total < state["offset"]:
+            print(f"Source shrank below the saved offset ({state['offset']}); running a full sync.")
+            state, full = _fresh_state(), True
+
+        try:
+            fetched = _fetch_from(session, url, out_path, state_path, state, total, page_size, full)
+        except SourceChanged as e:
+            print(f"{e}; running a full sync.")
+            state = _fresh_state()
+            fetched = _fetch_from(session, url, out_path, state_path, state, total, page_size, True)
+
+    print(f"Fetched {fetched} new messages (last: {state['last_id']} at {state['last_timestamp']}).")
+    return fetched
+
+
+def _fetch_from(session, url, out_path, state_path, state, total, page_size, full):
+    mode = "w" if full or not state["offset"] else "a"
+    fetched = 0
+    with open(out_path, mode) as out:
+        skip = state["offset"]
+        while skip < total:
+            # Start one record early: it must be the last record already written.
+            overlap = 1 if skip else 0
+            items = fetch_page(session, url, skip - overlap, page_size + overlap).get("items", [])
+            if overlap:
+                if not items or str(items[0]["id"]) != str(state["last_id"]):
+                    raise SourceChanged(f"Source changed below offset {skip}")
+                items = items[1:]
+            if not items:
+                break
+
+            for m in items:
+                out.write(json.dumps(m, ensure_ascii=False) + "\n")
+            out.flush()
+
+            skip += len(items)
+            fetched += len(items)
+            state.update(offset=skip, last_timestamp=items[-1]["timestamp"], last_id=items[-1]["id"])
+            save_state(state_path, state)
+    return fetched
+
+
+def iter_messages(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def export_json(jsonl_path, json_path):
+    """Stream the JSON-lines file into the JSON array the categorization step reads."""
+    with open(json_path, "w") as out:
+        out.write("[")
+        for i, m in enumerate(iter_messages(jsonl_path)):
+            out.write(",\n" if i else "\n")
+            out.write(json.dumps(m, ensure_ascii=False))
+        out.write("\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally sync member messages from the source API.")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--out", default="data/messages.jsonl")
+    parser.add_argument("--state", default="data/ingest_state.json")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--full", action="store_true", help="re-download everything instead of a delta sync")
+    parser.add_argument("--export-json", default="data/messages.json",
+                        help="also write a JSON array for the categorization step ('' to skip)")
+    args = parser.parse_args()
+
+    if not args.url:
+        parser.error("set the 'url' environment variable or pass --url")
 
-resp = requests.get(API_URL, params={"limit": total})
-resp.raise_for_status()
-data = resp.json()
-messages = data["items"]
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    fetched = sync(args.url, args.out, args.state, page_size=args.page_size, full=args.full)
+    if fetched:
+        print(f"Corpus version is now {bump_corpus_version()}.")
 
-print(f"Total messages fetched: {len(messages)}")
+    if args.export_json:
+        export_json(args.out, args.export_json)
 
-with open("data/messages.json", "w") as f:
-    json.dump(messages, f, indent=2)
 
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,144 @@
-import google.generativeai as genai
-import chromadb
+import argparse
+import hashlib
 import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.answer_cache import bump_corpus_version
+from src.embedding_cache import CachedEmbedder, EmbeddingCache
+from src.embedding_provider import get_provider
+from src.mmap_vector_index import MmapVectorIndex
+
 load_dotenv()
 
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-
-with open("data/messages_with_categories.json") as f:
-    messages = json.load(f)
-
-texts = [m["message"] for m in messages]
-metadatas = [
-    {
-        "user_id": m["user_id"],
-        "user_name": m["user_name"],
-        "timestamp": m["timestamp"],
-        "category": m["category"]
-    }
-    for m in messages
-]
-ids = [str(m["id"]) for m in messages]
-
-embeddings_list = []
-for text in texts:
-    result = genai.embed_content(
-        model="models/embedding-001",
-        content=text,
-        task_type="retrieval_document"
+
+def content_hash(m):
+    raw = json.dumps([m["message"], m["user_id"], m["user_name"], m["timestamp"], m["category"]])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, indexed):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(indexed, f)
+    os.replace(tmp_path, path)
+
+
+def indexed_hashes(collection, ids, page_size=1000):
+    """Content hashes already stored in Chroma, for runs without a checkpoint file."""
+    indexed = {}
+    for start in range(0, len(ids), page_size):
+        existing = collection.get(ids=ids[start:start + page_size], include=["metadatas"])
+        for i, meta in zip(existing["ids"], existing["metadatas"]):
+            if meta and meta.get("content_hash"):
+                indexed[i] = meta["content_hash"]
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed messages and upsert them into ChromaDB incrementally.")
+    parser.add_argument("--messages", default="data/messages_with_categories.json")
+    parser.add_argument("--chroma-path", default="data/chroma_store")
+    parser.add_argument("--collection", default="member_messages")
+    parser.add_argument("--checkpoint", default="data/embeddings_checkpoint.json")
+    parser.add_argument("--cache", default="data/embedding_cache.sqlite")
+    parser.add_argument("--provider", default="gemini", choices=["gemini", "hash"])
+    parser.add_argument("--batch-size", type=int, default=100, help="texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=4, help="embedding requests in flight")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="messages per Chroma upsert and checkpoint")
+    parser.add_argument("--full", action="store_true", help="ignore the checkpoint and re-index everything")
+    parser.add_argument("--export-mmap", default=None, metavar="DIR",
+                        help="also export the collection as a memory-mapped vector index (VECTOR_BACKEND=mmap)")
+    parser.add_argument("--quantize", action="store_true", help="store the exported index as int8")
+    args = parser.parse_args()
+
+    # Imported here so --help is fast; the Gemini SDK is only loaded by its provider on first use.
+    import chromadb
+
+    with open(args.messages) as f:
+        messages = json.load(f)
+
+    chroma_client = chromadb.PersistentClient(path=args.chroma_path)
+    collection = chroma_client.get_or_create_collection(name=args.collection)
+
+    ids = [str(m["id"]) for m in messages]
+    hashes = [content_hash(m) for m in messages]
+
+    indexed = {} if args.full else load_checkpoint(args.checkpoint)
+    stored = collection.count()
+    if indexed and stored != len(indexed):
+        # The collection was deleted, rebuilt or written without this checkpoint.
+        print(f"Checkpoint lists {len(indexed)} messages but the collection holds {stored}; ignoring it.")
+        indexed = {}
+    if not indexed and not args.full and stored:
+        indexed = indexed_hashes(collection, ids)
+
+    pending = [i for i, (mid, h) in enumerate(zip(ids, hashes)) if indexed.get(mid) != h]
+    print(f"{len(messages)} messages, {len(messages) - len(pending)} already indexed, {len(pending)} to embed.")
+
+    # Document embeddings go through the same persistent cache the service uses,
+    # so re-running ingestion only embeds messages that were never seen before.
+    embedder = CachedEmbedder(
+        EmbeddingCache(max_entries=args.chunk_size * 2, db_path=args.cache),
+        provider=get_provider(args.provider),
+        batch_size=args.batch_size
     )
-    embeddings_list.append(result["embedding"])
 
-print(f"Generated {len(embeddings_list)} embeddings.")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for start in range(0, len(pending), args.chunk_size):
+            chunk = pending[start:start + args.chunk_size]
+            texts = [messages[i]["message"] for i in chunk]
+
+            batches = [texts[b:b + args.batch_size] for b in range(0, len(texts), args.batch_size)]
+            embeddings_list = []
+            for batch_embeddings in pool.map(lambda batch: embedder.embed(batch, task_type="retrieval_document"), batches):
+                embeddings_list += batch_embeddings
+
+            collection.upsert(
+                documents=texts,
+                embeddings=embeddings_list,
+                metadatas=[
+                    {
+                        "user_id": messages[i]["user_id"],
+                        "user_name": messages[i]["user_name"],
+                        "timestamp": messages[i]["timestamp"],
+                        "category": messages[i]["category"],
+                        "content_hash": hashes[i]
+                    }
+                    for i in chunk
+                ],
+                ids=[ids[i] for i in chunk]
+            )
+
+            indexed.update({ids[i]: hashes[i] for i in chunk})
+            save_checkpoint(args.checkpoint, indexed)
+            done = start + len(chunk)
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            print(f"Upserted {done}/{len(pending)} messages ({rate:.0f} msg/s, cache: {embedder.cache.stats()}).")
+
+    print(f"Stored {len(pending)} messages in ChromaDB with {embedder.model} embeddings "
+          f"in {time.perf_counter() - started:.1f}s.")
 
-chroma_client = chromadb.PersistentClient(path="data/chroma_store")
-collection = chroma_client.get_or_create_collection(name="member_messages")
+    if args.export_mmap:
+        exported = MmapVectorIndex.export_from_chroma(collection, args.export_mmap, quantize=args.quantize)
+        print(f"Exported {exported} embeddings to {args.export_mmap}.")
 
-collection.add(
-    documents=texts,
-    embeddings=embeddings_list,
-    metadatas=metadatas,
-    ids=ids
-)
+    if pending:
+        print(f"Corpus version is now {bump_corpus_version()}.")
 
-print(f"Stored {len(ids)} messages in ChromaDB with Gemini embeddings.")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+FIRST_NAMES = [
+    "Vikram", "Layla", "Lorenzo", "Sophia", "Fatima", "Armand", "Hans", "Lily", "Amira", "Thiago", "Mei", "Oliver",
+    "Priya", "Mateo", "Chloe", "Kenji", "Noor", "Elena", "Rafael", "Ingrid", "Omar", "Yuki", "Camille", "Tariq",
+    "Zara", "Felix", "Aisha", "Lucas", "Sienna", "Ravi", "Astrid", "Diego", "Hana", "Julian", "Leila", "Marco",
+]
+LAST_NAMES = [
+    "Desai", "Kawaguchi", "Cavalli", "Al-Farsi", "El-Tahir", "Dupont", "Müller", "O'Sullivan", "Khalil", "Monteiro",
+    "Chen", "Hughes", "Nair", "Rossi", "Laurent", "Tanaka", "Haddad", "Petrova", "Alves", "Lindqvist", "Farouk",
+    "Sato", "Moreau", "Rahman", "Okafor", "Schmidt", "Bello", "Silva", "Marsh", "Iyer", "Berg", "Vargas", "Kim",
+]
+
+PLACES = ["Nobu", "the Ritz Paris", "Aman Tokyo", "Le Bernardin", "Claridge's", "the Four Seasons Bali", "Noma",
+          "the Burj Al Arab", "Villa d'Este", "Soho House"]
+CITIES = ["Paris", "Tokyo", "London", "New York", "Dubai", "Milan", "Bali", "Zurich", "Lisbon", "Cape Town"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October",
+          "November", "December"]
+
+TEMPLATES = {
+    "Travel & Accommodation": [
+        "Book a suite at {place} for {month} {day}",
+        "I need a flight to {city} next {month}",
+        "Find a private villa in {city} for {n} nights",
+        "Please extend my stay in {city} by {n} days",
+        "Upgrade my room to a sea view at {place}",
+    ],
+    "Dining & Experiences": [
+        "Book a table at {place} for {n} on {month} {day}",
+        "Get me tickets to the opera in {city}",
+        "I am vegetarian, please inform the restaurant",
+        "Reserve front row seats for the concert in {city}",
+        "I have a shellfish allergy, let the chef at {place} know",
+    ],
+    "Personal & Wellness": [
+        "Book a spa day with a massage in {city}",
+        "Send flowers to my wife for her birthday on {month} {day}",
+        "I have a feather allergy, arrange hypoallergenic pillows",
+        "Find a personal trainer in {city} for {n} sessions",
+        "Arrange a gift for my son, he turns {n} in {month}",
+    ],
+    "Account & Finance": [
+        "Please update my email to {handle}{n}@example.com",
+        "Refund the last charge on my card ending {card}",
+        "Send me the invoice for {month}",
+        "My new phone number is 555-0{card}",
+        "Update my billing address to {n} Main Street, {city}",
+    ],
+    "Transport & Mobility": [
+        "Arrange a chauffeur to the airport in {city}",
+        "Book a Tesla rental for the weekend in {city}",
+        "I need a driver in {city} on {month} {day}",
+        "Send a limousine to {place} at {n} pm",
+        "Cancel my car service for {month} {day}",
+    ],
+}
+
+QUESTIONS = {
+    "Travel & Accommodation": ["Where is {name} travelling in {month}?", "Which hotel does {name} prefer in {city}?",
+                               "How many nights did {name} book in {city}?"],
+    "Dining & Experiences": ["What are {name}'s dietary restrictions?", "Which restaurants has {name} booked?",
+                             "Does {name} have any food allergies?"],
+    "Personal & Wellness": ["What gifts has {name} asked for?", "Does {name} have a personal trainer?",
+                            "What are {name}'s pillow preferences?"],
+    "Account & Finance": ["What is {name}'s current email address?", "Has {name} asked for any refunds?",
+                          "What is the billing address for {name}?"],
+    "Transport & Mobility": ["Does {name} prefer a chauffeur or a rental car?", "When did {name} need a driver?",
+                             "Which cars has {name} booked?"],
+}
+
+
+def make_members(n, rng):
+    names = [f"{f} {l}" for f in FIRST_NAMES for l in LAST_NAMES]
+    if n > len(names):
+        names += [f"{f} {l}-{i}" for i in range(2, n // len(names) + 2) for f in FIRST_NAMES for l in LAST_NAMES]
+    chosen = rng.sample(names, n)
+    return [{"user_name": name, "user_id": str(rng.randrange(10 ** 7, 10 ** 8))} for name in chosen]
+
+
+def fill(template, member, rng):
+    return template.format(
+        place=rng.choice(PLACES), city=rng.choice(CITIES), month=rng.choice(MONTHS), day=rng.randint(1, 28),
+        n=rng.randint(2, 12), card=rng.randint(1000, 9999), name=member["user_name"],
+        handle=member["user_name"].split()[0].lower(),
+    )
+
+
+def generate_messages(n_messages, members, rng, start=datetime(2024, 1, 1, tzinfo=timezone.utc)):
+    categories = list(TEMPLATES)
+    # Members write at very different rates, like the real corpus.
+    weights = [rng.paretovariate(1.5) for _ in members]
+    authors = rng.choices(members, weights=weights, k=n_messages)
+    for author in authors:
+        category = rng.choice(categories)
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "user_id": author["user_id"],
+            "user_name": author["user_name"],
+            "timestamp": (start + timedelta(minutes=rng.randrange(365 * 24 * 60))).isoformat(),
+            "message": fill(rng.choice(TEMPLATES[category]), author, rng),
+            "category": category,
+        }
+
+
+def misspell(name, rng):
+    i = rng.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1:] if rng.random() < 0.5 else name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def generate_workload(n_queries, members, rng):
+    """Questions with their intended member and category; some use first names, typos or no name."""
+    for _ in range(n_queries):
+        member = rng.choice(members)
+        category = rng.choice(list(QUESTIONS))
+        roll = rng.random()
+        if roll < 0.6:
+            name = member["user_name"]
+        elif roll < 0.8:
+            name = member["user_name"].split()[0]
+        elif roll < 0.9:
+            name = misspell(member["user_name"], rng)
+        else:
+            name = None
+        template = rng.choice(QUESTIONS[category])
+        question = fill(template, {**member, "user_name": name or "the member"}, rng)
+        yield {"question": question, "user_name": member["user_name"] if name else None, "category": category}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic member-message corpus and query workload.")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--members", type=int, default=None, help="defaults to one per 300 messages, at least 10")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--output-dir", default="data/synthetic")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    members = make_members(args.members or max(10, args.messages // 300), rng)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    with open(os.path.join(args.output_dir, "messages_with_categories.json"), "w") as f:
+        json.dump(list(generate_messages(args.messages, members, rng)), f)
+    with open(os.path.join(args.output_dir, "user_index.json"), "w") as f:
+        json.dump([m["user_name"] for m in members], f, indent=2)
+    with open(os.path.join(args.output_dir, "workload.jsonl"), "w") as f:
+        for query in generate_workload(args.queries, members, rng):
+            f.write(json.dumps(query) + "\n")
+
+    print(f"Wrote {args.messages} messages from {len(members)} members and {args.queries} queries "
+          f"to {args.output_dir}.")
+
+
+if __name__ == "__main__":
+    main()
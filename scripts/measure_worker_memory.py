@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def children(pid):
+    """Every descendant of `pid`, from the ppid field of /proc/<pid>/stat."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        parents.setdefault(int(stat.rsplit(")", 1)[1].split()[1]), []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def memory_kb(pid):
+    """Rss, Pss and private/shared totals of one process from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+def index_kb(pid, data_dir):
+    """Rss and Pss of the memory-mapped files under `data_dir`, from /proc/<pid>/smaps."""
+    totals, current = {"rss": 0, "pss": 0}, False
+    with open(f"/proc/{pid}/smaps") as f:
+        for line in f:
+            parts = line.split()
+            if "-" in parts[0] and ":" not in parts[0]:
+                current = len(parts) >= 6 and parts[5].startswith(data_dir)
+            elif current and parts[0] in ("Rss:", "Pss:"):
+                totals[parts[0][:-1].lower()] += int(parts[1])
+    return totals
+
+
+def ready(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def measure(workers, port, env, settle, timeout, data_dir):
+    """Start uvicorn with `workers` workers, wait until every worker has loaded and warmed, and sum its memory."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while not ready(port):
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"uvicorn with {workers} workers did not become ready")
+            time.sleep(0.2)
+
+        # /ready only says one worker is up; wait until total PSS stops moving.
+        previous = None
+        while time.monotonic() < deadline:
+            time.sleep(settle)
+            pids = [server.pid] + children(server.pid)
+            usage = {pid: {**memory_kb(pid), **{f"index_{k}": v for k, v in index_kb(pid, data_dir).items()}}
+                     for pid in pids}
+            total = sum(u["pss"] for u in usage.values())
+            if previous is not None and abs(total - previous) < 0.01 * total:
+                break
+            previous = total
+
+        worker_usage = [usage[pid] for pid in pids[1:]] or list(usage.values())
+        return {
+            "workers": workers,
+            "processes": len(pids),
+            "total_rss_mb": round(sum(u["rss"] for u in usage.values()) / 1024, 1),
+            "total_pss_mb": round(sum(u["pss"] for u in usage.values()) / 1024, 1),
+            "worker_private_mb": round(sum(u["private"] for u in worker_usage) / max(len(worker_usage), 1) / 1024, 1),
+            "worker_shared_mb": round(sum(u["shared"] for u in worker_usage) / max(len(worker_usage), 1) / 1024, 1),
+            # Index pages each worker has mapped, and their total proportional
+            # share: the latter stays flat as workers are added.
+            "index_rss_mb_per_worker": round(max(u["index_rss"] for u in usage.values()) / 1024, 1),
+            "index_pss_mb_total": round(sum(u["index_pss"] for u in usage.values()) / 1024, 1),
+        }
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of the API served by N uvicorn workers over the "
+                                                 "memory-mapped indexes (run scripts/build_indexes.py first).")
+    parser.add_argument("--workers", default="2,4,8",
+                        help="comma-separated worker counts; with 1, uvicorn runs without a supervisor process")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--vector-backend", default="mmap", choices=["mmap", "chroma"])
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds between memory samples")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    # Local LLM and embedding stand-ins: only index memory is being measured.
+    env = {
+        **os.environ,
+        "LLM_PROVIDER": "stub",
+        "EMBEDDING_PROVIDER": "hash",
+        "VECTOR_BACKEND": args.vector_backend,
+        "REQUIRE_ARTIFACTS": "1",
+        "STARTUP_MODE": "eager",
+        "WARM_INDEXES": "1",
+    }
+    data_dir = os.path.realpath(os.path.join(ROOT, "data"))
+    runs = [measure(int(n), args.port, env, args.settle, args.timeout, data_dir) for n in args.workers.split(",")]
+
+    base = runs[0]
+    for run in runs[1:]:
+        added = run["workers"] - base["workers"]
+        run["pss_mb_per_added_worker"] = round((run["total_pss_mb"] - base["total_pss_mb"]) / added, 1)
+        run["rss_mb_per_added_worker"] = round((run["total_rss_mb"] - base["total_rss_mb"]) / added, 1)
+
+    output = json.dumps({"vector_backend": args.vector_backend, "runs": runs}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
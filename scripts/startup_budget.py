@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_APP = """
+import time
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start)
+"""
+
+STARTUP = """
+import json, time
+start = time.perf_counter()
+from src.qa_service import QAService
+imported = time.perf_counter() - start
+service = QAService()
+loaded = time.perf_counter() - start
+service.warm()
+print(json.dumps({"import": imported, "load": loaded, "warm": time.perf_counter() - start - loaded,
+                  "readiness": service.readiness.snapshot()}))
+"""
+
+
+def run_python(code, extra_args=()):
+    result = subprocess.run([sys.executable, *extra_args, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return result
+
+
+def slowest_imports(module, n):
+    """Largest cumulative import time of each top-level package, from `python -X importtime`."""
+    stderr = run_python(f"import {module}", ["-X", "importtime"]).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        parts = [p.strip() for p in line.removeprefix("import time:").split("|")]
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        package = parts[2].split(".")[0]
+        totals[package] = max(totals.get(package, 0), int(parts[1]))
+    top = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:n]
+    return {name: round(us / 1e6, 4) for name, us in top}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and cold-start time against a budget.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=0.5, help="seconds to import app")
+    parser.add_argument("--startup-budget", type=float, default=5.0, help="seconds to import and load QAService")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    app_imports = [float(run_python(IMPORT_APP).stdout.split()[-1]) for _ in range(args.runs)]
+    startups = [json.loads(run_python(STARTUP).stdout.splitlines()[-1]) for _ in range(args.runs)]
+
+    report = {
+        "import_app_seconds": round(statistics.median(app_imports), 4),
+        "import_qa_service_seconds": round(statistics.median(s["import"] for s in startups), 4),
+        "startup_seconds": round(statistics.median(s["load"] for s in startups), 4),
+        "warm_seconds": round(statistics.median(s["warm"] for s in startups), 4),
+        "components": startups[-1]["readiness"]["components"],
+        "slowest_imports": slowest_imports("src.qa_service", args.top),
+        "budget": {"import_app_seconds": args.import_budget, "startup_seconds": args.startup_budget},
+    }
+    report["within_budget"] = (
+        report["import_app_seconds"] <= args.import_budget and report["startup_seconds"] <= args.startup_budget
+    )
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["within_budget"] else 1)
+
+
+if __name__ == "__main__":
+    main()
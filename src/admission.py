@@ -0,0 +1,132 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from src import metrics
+from src.resilience import remaining_budget
+
+ADMISSION_REJECTED = metrics.REGISTRY.counter(
+    "qa_admission_rejected_total", "Requests turned away: queue_full (429) or queue_timeout (503).", ["reason"]
+)
+ADMISSION_WAIT_SECONDS = metrics.REGISTRY.histogram("qa_admission_wait_seconds", "Time admitted requests queued.")
+CLIENT_DISCONNECTS = metrics.REGISTRY.counter(
+    "qa_client_disconnects_total", "Requests whose work was cancelled because the client went away.", ["endpoint"]
+)
+
+
+class Overloaded(RuntimeError):
+    """Rejected at admission; carries the HTTP status and a Retry-After hint in seconds."""
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A held concurrency slot. `release` is idempotent."""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.start = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(time.monotonic() - self.start)
+
+
+class AdmissionController:
+    """
+    At most `max_concurrency` requests run at once and at most `max_queue`
+    wait, first come first served. A request arriving to a full queue is
+    rejected at once (429); one that waits longer than `queue_timeout`, or
+    than its remaining request budget, is rejected then (503). Either way
+    no work is started for an answer that would arrive too late. Retry-After
+    is estimated from recent service times and the queue ahead.
+    """
+
+    def __init__(self, max_concurrency=32, max_queue=64, queue_timeout=5.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = deque()
+        self._service_times = deque(maxlen=200)
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        mean = sum(self._service_times) / len(self._service_times) if self._service_times else 1.0
+        return max(1, math.ceil(mean * (self.queued + 1) / self.max_concurrency))
+
+    async def acquire(self):
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            return Ticket(self)
+
+        if self.queued >= self.max_queue:
+            ADMISSION_REJECTED.inc(reason="queue_full")
+            raise Overloaded("Too many requests queued", 429, self.retry_after())
+
+        budget = remaining_budget()
+        timeout = self.queue_timeout if budget is None else min(self.queue_timeout, budget)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on.
+                self._release(None)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                ADMISSION_REJECTED.inc(reason="queue_timeout")
+                raise Overloaded("Timed out waiting for capacity", 503, self.retry_after()) from None
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+        return Ticket(self)
+
+    def _release(self, seconds):
+        if seconds is not None:
+            self._service_times.append(seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self):
+        ticket = await self.acquire()
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def collect_metrics(self):
+        return [
+            ("qa_admission_in_flight", "gauge", "Requests holding a concurrency slot.", [({}, self.active)]),
+            ("qa_admission_queued", "gauge", "Requests waiting for a slot.", [({}, self.queued)]),
+            ("qa_admission_limit", "gauge", "Configured concurrency and queue limits.",
+             [({"limit": "concurrency"}, self.max_concurrency), ({"limit": "queue"}, self.max_queue)]),
+        ]
+
+
+def admission_from_env():
+    """Limits from MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS and QUEUE_TIMEOUT (seconds)."""
+    return AdmissionController(
+        max_concurrency=int(os.getenv("MAX_CONCURRENT_REQUESTS", 32)),
+        max_queue=int(os.getenv("MAX_QUEUED_REQUESTS", 64)),
+        queue_timeout=float(os.getenv("QUEUE_TIMEOUT", 5)),
+    )
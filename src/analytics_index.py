@@ -0,0 +1,248 @@
+import heapq
+import json
+import os
+import re
+
+import numpy as np
+
+
+def get_data_path(relative_path):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, relative_path)
+
+
+# Stored with the index; changing the rules below makes older indexes stale.
+ENTITY_RULES = "v2"
+KINDS = ["name", "email", "phone", "card"]
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"(?<![\w-])\+?\d[\d ().-]{5,}\d(?![\w-])")
+# Dates and date-times ("2024-05-12", "12/05/2024", "2024-05-12T09:30:00Z") that would otherwise read as phones.
+_DATE_RE = re.compile(r"(?<![\w.+/-])(?:\d{4}([-/.])\d{1,2}\1\d{1,2}|\d{1,2}([-/.])\d{1,2}\2\d{2}(?:\d{2})?)"
+                      r"(?:[T ]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?(?![\w/-]|\.\d)")
+_CARD_RE = re.compile(r"\b(?:card|account)\b[^.\d]{0,20}?\bend(?:ing|s)\s+(?:in\s+)?(\d{4})\b", re.IGNORECASE)
+# A capitalized phrase after a preposition or article: "at Nobu", "the Ritz Paris", "to Tokyo", "a Tesla".
+_NAME_RE = re.compile(r"\b(?:at|to|in|from|the|a|an)\s+([A-Z][\w'&-]*(?:\s+[A-Z][\w'&-]*){0,3})")
+_NOT_NAMES = {
+    "i", "january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+    "november", "december", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+}
+
+# Only explicit phrasing counts: matching an analytics intent cuts the message context down to FACTS_CONTEXT_K.
+TEMPORAL_RE = re.compile(r"\b(latest|newest|most recent(ly)?|recently|current(ly)?|"
+                         r"last (time|trip|stay|visit|booking|reservation|order|request))\b", re.IGNORECASE)
+COUNT_RE = re.compile(r"\b(how many (times|different|distinct)|how often|number of times|"
+                      r"most (often|frequent(ly)?|common(ly)?))\b", re.IGNORECASE)
+
+
+def extract_entities(text):
+    """(kind, key, surface) for each name (venue, hotel, place), email, phone number and card suffix in `text`."""
+    found = []
+    for email in _EMAIL_RE.findall(text):
+        found.append(("email", email.lower(), email))
+    text = _EMAIL_RE.sub(" ", text)
+    for card in _CARD_RE.findall(text):
+        found.append(("card", card, f"ending {card}"))
+    for phone in _PHONE_RE.findall(_DATE_RE.sub(" ", text)):
+        digits = re.sub(r"\D", "", phone)
+        if len(digits) >= 7:
+            found.append(("phone", digits, phone.strip()))
+    for name in _NAME_RE.findall(text):
+        if name.split()[0].lower() not in _NOT_NAMES:
+            found.append(("name", name.casefold(), name))
+    return found
+
+
+def question_intent(question):
+    """Which analytics a question asks for: "temporal" (latest/current) and/or "count" (how many/most often)."""
+    intent = set()
+    if TEMPORAL_RE.search(question or ""):
+        intent.add("temporal")
+    if COUNT_RE.search(question or ""):
+        intent.add("count")
+    return intent
+
+
+class AnalyticsIndex:
+    """
+    Per-member entity tables over a MessageStore, built at ingest time.
+
+    Every mention of an entity (see `extract_entities`) is a store row. Mentions
+    are grouped by (member, entity, category) and sorted by timestamp within
+    each group, so a group's count, first and latest mention are read off its
+    bounds without touching the messages. Groups are sorted by member, and
+    `user_ptr` gives each member's groups as one range. Store rows are already
+    sorted by (member, category, timestamp), so "the latest messages of a
+    member in a category" needs no table of its own: see `recent`.
+    """
+
+    ARRAYS = ["group_user", "group_entity", "group_category", "group_ptr", "mention_rows", "user_ptr"]
+
+    def __init__(self, arrays, meta, store):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.entity_kinds = meta["kinds"]
+        self.entity_names = meta["entities"]
+        self.store = store
+
+    def __len__(self):
+        return len(self.mention_rows)
+
+    @classmethod
+    def build(cls, store):
+        codes, kinds, names = {}, [], []
+        mentions = []
+        for row in range(len(store)):
+            seen = set()
+            for kind, key, surface in extract_entities(store.message_text(row)):
+                code = codes.get((kind, key))
+                if code is None:
+                    code = codes[(kind, key)] = len(names)
+                    kinds.append(KINDS.index(kind))
+                    names.append(surface)
+                if code not in seen:
+                    seen.add(code)
+                    mentions.append((row, code))
+
+        rows = np.array([m[0] for m in mentions], dtype=np.int64)
+        entities = np.array([m[1] for m in mentions], dtype=np.int32)
+        users = np.asarray(store.user_codes)[rows].astype(np.int32)
+        categories = np.asarray(store.category_codes)[rows].astype(np.int16)
+        order = np.lexsort((np.asarray(store.timestamps)[rows], categories, entities, users))
+        rows, entities, users, categories = rows[order], entities[order], users[order], categories[order]
+
+        starts = np.flatnonzero(np.r_[True, (users[1:] != users[:-1]) | (entities[1:] != entities[:-1])
+                                      | (categories[1:] != categories[:-1])]) if len(rows) else np.empty(0, np.int64)
+        group_user = users[starts]
+        user_ptr = np.zeros(len(store.user_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(group_user, minlength=len(store.user_names)), out=user_ptr[1:])
+
+        arrays = {
+            "group_user": group_user,
+            "group_entity": entities[starts],
+            "group_category": categories[starts],
+            "group_ptr": np.r_[starts, len(rows)].astype(np.int64),
+            "mention_rows": rows,
+            "user_ptr": user_ptr,
+        }
+        meta = {"rules": ENTITY_RULES, "store": store.fingerprint, "kinds": [KINDS[k] for k in kinds],
+                "entities": names}
+        return cls(arrays, meta, store)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"rules": ENTITY_RULES, "store": self.store.fingerprint, "kinds": self.entity_kinds,
+                       "entities": self.entity_names}, f)
+
+    @classmethod
+    def load(cls, path, store):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("rules") != ENTITY_RULES:
+            raise ValueError(f"Analytics index at {path} was built with other entity rules; rebuild it")
+        # Mentions are store rows: an index over any other store (even of the same size) points at the wrong ones.
+        if meta.get("store") != store.fingerprint:
+            raise ValueError(f"Analytics index at {path} does not match the message store; rebuild it")
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in cls.ARRAYS}
+        return cls(arrays, meta, store)
+
+    def warm(self):
+        for name in self.ARRAYS:
+            np.asarray(getattr(self, name)).view(np.uint8).sum(dtype=np.int64)
+        return len(self)
+
+    def _timestamp(self, row):
+        return self.store._string(self.store.ts_text, self.store.ts_offsets, int(row))
+
+    def entity_stats(self, user_name, categories=None):
+        """
+        Mention count, first and latest mention of each entity in the member's
+        messages (within `categories`, if given), keyed by (kind, entity).
+        """
+        u = self.store.user_code(user_name)
+        if u is None:
+            return {}
+        wanted = None
+        if categories:
+            wanted = {self.store.category_code(c) for c in categories} - {None}
+        stats = {}
+        for g in range(self.user_ptr[u], self.user_ptr[u + 1]):
+            if wanted is not None and int(self.group_category[g]) not in wanted:
+                continue
+            start, end = int(self.group_ptr[g]), int(self.group_ptr[g + 1])
+            first, last = int(self.mention_rows[start]), int(self.mention_rows[end - 1])
+            code = int(self.group_entity[g])
+            merge_stats(stats, (self.entity_kinds[code], self.entity_names[code]), end - start,
+                        (int(self.store.timestamps[first]), self._timestamp(first)),
+                        (int(self.store.timestamps[last]), self._timestamp(last)))
+        return stats
+
+    def recent(self, user_name, categories=None, n=5, before=None):
+        """
+        The member's `n` latest messages (within `categories`, if given, and
+        before epoch second `before`, if given), newest first, as
+        (epoch, message) pairs. Each (member, category) range of the store is
+        timestamp-sorted, so this is a binary search per category.
+        """
+        u = self.store.user_code(user_name)
+        if u is None:
+            return []
+        n_categories = len(self.store.category_names)
+        codes = ({self.store.category_code(c) for c in categories} - {None} if categories
+                 else set(range(n_categories)))
+        rows = []
+        for c in codes:
+            g = u * n_categories + c
+            start, end = int(self.store.pair_ptr[g]), int(self.store.pair_ptr[g + 1])
+            if before is not None:
+                end = start + int(np.searchsorted(self.store.timestamps[start:end], before, side="left"))
+            rows += [(int(self.store.timestamps[r]), r) for r in range(max(start, end - n), end)]
+        return [(ts, self.store[r]) for ts, r in heapq.nlargest(n, rows)]
+
+
+def merge_stats(stats, key, count, first, last):
+    """Fold one group into `stats`; first and last are (epoch, timestamp string)."""
+    entry = stats.get(key)
+    if entry is None:
+        stats[key] = {"count": count, "first": first, "last": last}
+    else:
+        entry["count"] += count
+        entry["first"] = min(entry["first"], first)
+        entry["last"] = max(entry["last"], last)
+
+
+def format_facts(stats, limit=10, latest_first=False):
+    """
+    Compact prompt lines for the most mentioned entities, most mentioned
+    first and latest first on ties; with `latest_first`, the most recently
+    mentioned entities first, so a "latest" question keeps them under `limit`.
+    """
+    if latest_first:
+        ranked = sorted(stats.items(), key=lambda item: (-item[1]["last"][0], -item[1]["count"]))
+    else:
+        ranked = sorted(stats.items(), key=lambda item: (-item[1]["count"], -item[1]["last"][0]))
+    lines = []
+    for (kind, entity), entry in ranked[:limit]:
+        mentions = "1 message" if entry["count"] == 1 else f"{entry['count']} messages"
+        label = entity if kind == "name" else f"{kind} {entity}"
+        lines.append(f"{label}: {mentions}, first {entry['first'][1]}, latest {entry['last'][1]}")
+    return lines
+
+
+def load_or_build_analytics(store, index_path="data/analytics_index", build=True):
+    abs_path = get_data_path(index_path)
+    if os.path.exists(os.path.join(abs_path, "meta.json")):
+        try:
+            return AnalyticsIndex.load(abs_path, store)
+        except ValueError as e:
+            if not build:
+                raise
+            print(f"{e}; building in memory instead.")
+    elif not build:
+        raise FileNotFoundError(f"{abs_path} not found; run scripts/build_indexes.py")
+    else:
+        print(f"{abs_path} not found, building analytics index in memory.")
+    return AnalyticsIndex.build(store)
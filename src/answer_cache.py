@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def get_data_path(relative_path):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, relative_path)
+
+
+CORPUS_VERSION_PATH = "data/corpus_version"
+
+
+_versions = {}
+
+
+def corpus_version(path=CORPUS_VERSION_PATH):
+    """
+    Current corpus version; ingestion and re-embedding bump it to invalidate
+    caches. The file is re-read only when it has been replaced.
+    """
+    abs_path = get_data_path(path)
+    try:
+        stat = os.stat(abs_path)
+    except FileNotFoundError:
+        return "0"
+    # bump_corpus_version replaces the file, so a new inode or mtime means a new version.
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+    cached = _versions.get(abs_path)
+    if cached is None or cached[0] != stamp:
+        try:
+            with open(abs_path) as f:
+                cached = _versions[abs_path] = (stamp, f.read().strip() or "0")
+        except FileNotFoundError:
+            return "0"
+    return cached[1]
+
+
+def bump_corpus_version(path=CORPUS_VERSION_PATH):
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    abs_path = get_data_path(path)
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    tmp_path = f"{abs_path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, abs_path)
+    return version
+
+
+def normalize_question(question: str):
+    question = " ".join((question or "").lower().split())
+    return re.sub(r"[\s?.!]+$", "", question)
+
+
+class MemoryBackend:
+    """In-process LRU with a per-entry TTL."""
+
+    blocking = False
+
+    def __init__(self, max_entries=1000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SqliteBackend:
+    """
+    Local on-disk store with the same LRU + TTL policy, shared across restarts.
+    A hit refreshes its last-access time only once it is `touch_interval`
+    seconds old, so reads don't turn into a write each.
+    """
+
+    blocking = True
+
+    def __init__(self, path="data/answer_cache.sqlite", max_entries=10000, ttl=3600, touch_interval=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        abs_path = get_data_path(path)
+        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+        self._db = sqlite3.connect(abs_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL, last_access REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires_at, last_access FROM cache WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            if now - row[2] >= self.touch_interval:
+                self._db.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now)
+            )
+            self._db.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+            self._db.commit()
+
+
+class AnswerCache:
+    """
+    Two-level QA cache tagged with the corpus version.
+
+    Level one maps a normalized question to its final answer and metadata, so
+    a hit skips both LLM calls. Level two maps the resolved
+    (source, user_name, categories, query) to retrieval results. Keys embed
+    the current corpus version, so a re-ingest or re-embed makes every older
+    entry unreachable and the LRU/TTL policy evicts it. Callers also pass
+    the index generation they read, so messages added at runtime do the same.
+    The `a*` methods are for the event loop: they run a blocking backend's
+    I/O in a thread.
+    """
+
+    def __init__(self, backend=None, version_fn=corpus_version):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.version_fn = version_fn
+        self.stats = {"answer_hits": 0, "answer_misses": 0, "retrieval_hits": 0, "retrieval_misses": 0}
+
+    def _key(self, level, *parts, generation=0):
+        version = self.version_fn() if not generation else f"{self.version_fn()}+{generation}"
+        raw = json.dumps([version, *parts], sort_keys=True)
+        return f"{level}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    def _get(self, level, key):
+        value = self.backend.get(key)
+        self.stats[f"{level}_{'hits' if value is not None else 'misses'}"] += 1
+        return value
+
+    def get_answer(self, question, generation=0):
+        return self._get("answer", self._key("answer", normalize_question(question), generation=generation))
+
+    def put_answer(self, question, answer, metadata, generation=0):
+        self.backend.set(self._key("answer", normalize_question(question), generation=generation),
+                         {"answer": answer, "metadata": metadata})
+
+    def _retrieval_key(self, source, user_name, categories, query, generation):
+        if isinstance(categories, str):
+            categories = [categories]
+        return self._key("retrieval", source, (user_name or "").lower(), sorted(categories or []),
+                         normalize_question(query), generation=generation)
+
+    def get_retrieval(self, source, user_name, categories, query, generation=0):
+        return self._get("retrieval", self._retrieval_key(source, user_name, categories, query, generation))
+
+    def put_retrieval(self, source, user_name, categories, query, results, generation=0):
+        self.backend.set(self._retrieval_key(source, user_name, categories, query, generation), results)
+
+    async def _io(self, fn, *args):
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def aget_answer(self, question, generation=0):
+        return await self._io(self.get_answer, question, generation)
+
+    async def aput_answer(self, question, answer, metadata, generation=0):
+        await self._io(self.put_answer, question, answer, metadata, generation)
+
+    async def aget_retrieval(self, source, user_name, categories, query, generation=0):
+        return await self._io(self.get_retrieval, source, user_name, categories, query, generation)
+
+    async def aput_retrieval(self, source, user_name, categories, query, results, generation=0):
+        await self._io(self.put_retrieval, source, user_name, categories, query, results, generation)
+
+
+def answer_cache_from_env():
+    ttl = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+    max_entries = int(os.getenv("ANSWER_CACHE_SIZE", 1000))
+    if os.getenv("ANSWER_CACHE_BACKEND", "memory") == "sqlite":
+        backend = SqliteBackend(os.getenv("ANSWER_CACHE_PATH", "data/answer_cache.sqlite"), max_entries, ttl)
+    else:
+        backend = MemoryBackend(max_entries, ttl)
+    return AnswerCache(backend)
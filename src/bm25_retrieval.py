@@ -1,35 +1,310 @@
-from rank_bm25 import BM25Okapi
-from nltk.tokenize import word_tokenize
+import os
+import re
+from collections import Counter
+
 import numpy as np
-import nltk
 
-nltk.download('punkt_tab', quiet=True)
+# Saved with the index, so an index built with another tokenizer is rebuilt.
+TOKENIZER = "regex-v1"
+_TOKEN_RE = re.compile(r"\w+(?:'\w+)*|[^\w\s]")
 
 
-def bm25_search(query, messages, user_name=None, category=None, top_k=30):
-    def filter_messages(u=None, c=None):
-        return [
-            m for m in messages
-            if (not u or m["user_name"].lower().strip() == u.lower().strip())
-            and (not c or m["category"].strip() == c.strip())
-        ]
+def get_data_path(relative_path):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, relative_path)
+
+
+def tokenize(text):
+    """Words (keeping inner apostrophes) and single punctuation marks, lowercased."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _norm_user(name):
+    return (name or "").lower().strip()
+
+
+def _norm_category(category):
+    return (category or "").strip()
+
+
+def _csr(codes, n_groups):
+    """Group doc ids by code: docs of group g are docs[ptr[g]:ptr[g + 1]], ascending."""
+    order = np.argsort(codes, kind="stable").astype(np.int32)
+    counts = np.bincount(codes, minlength=n_groups)
+    ptr = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(counts, out=ptr[1:])
+    return ptr, order
+
+
+class BM25Index:
+    """
+    Build-once BM25 index over the message corpus.
+
+    Okapi BM25 with parameters k1 and b; terms whose idf would be negative
+    get epsilon times the mean idf instead. Document frequencies come from
+    the whole corpus, not the filtered subset.
+    Postings are stored CSR-style per term, and per-user, per-category and
+    per-(user, category) doc lists let a filtered query score only its
+    candidate documents.
+    """
+
+    def __init__(self, arrays, messages=None, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.messages = messages
+
+        # Sorted, so terms are looked up by binary search in the (possibly
+        # memory-mapped) array instead of a per-process dict.
+        self.vocab = arrays["vocab"]
+        self.term_ptr = arrays["term_ptr"]
+        self.term_docs = arrays["term_docs"]
+        self.term_tfs = arrays["term_tfs"]
+        self.doc_lens = arrays["doc_lens"]
+        self.idf = arrays["idf"]
+        self.avgdl = float(arrays["avgdl"])
+
+        self.users = {u: i for i, u in enumerate(arrays["users"].tolist())}
+        self.categories = {c: i for i, c in enumerate(arrays["categories"].tolist())}
+        self.user_ptr, self.user_docs = arrays["user_ptr"], arrays["user_docs"]
+        self.cat_ptr, self.cat_docs = arrays["cat_ptr"], arrays["cat_docs"]
+        self.pair_ptr, self.pair_docs = arrays["pair_ptr"], arrays["pair_docs"]
+        self.doc_ids = arrays["doc_ids"]
+
+        # Length normalisation only depends on the document, so fold it in once.
+        self._norm = (k1 * (1 - b + b * self.doc_lens / self.avgdl)).astype(np.float32)
+        self._arrays = arrays
+
+    @property
+    def n_docs(self):
+        return len(self.doc_lens)
+
+    @classmethod
+    def build(cls, messages, k1=1.5, b=0.75, epsilon=0.25):
+        n_docs = len(messages)
+        vocab = {}
+        doc_lens = np.zeros(n_docs, dtype=np.float32)
+        rows, cols, tfs = [], [], []
+
+        for doc_id, m in enumerate(messages):
+            tokens = tokenize(m["message"])
+            doc_lens[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                rows.append(vocab.setdefault(term, len(vocab)))
+                cols.append(doc_id)
+                tfs.append(tf)
+
+        # Renumber terms in sorted order.
+        terms = sorted(vocab)
+        term_ids = np.empty(len(vocab), dtype=np.int32)
+        term_ids[[vocab[t] for t in terms]] = np.arange(len(terms), dtype=np.int32)
+        rows = term_ids[np.asarray(rows, dtype=np.int64)] if rows else np.empty(0, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+
+        # Entries were appended in doc order, so a stable sort by term keeps
+        # each posting list sorted by doc id.
+        order = np.argsort(rows, kind="stable")
+        term_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(vocab)), out=term_ptr[1:])
+        term_docs = cols[order]
+        term_tfs = tfs[order]
 
-    filtered = filter_messages(user_name, category)
+        # Okapi idf, with very common terms floored at epsilon times the mean idf.
+        df = np.diff(term_ptr).astype(np.float64)
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        average_idf = idf.mean() if len(idf) else 0.0
+        idf[idf < 0] = epsilon * average_idf
 
-    if not filtered and user_name:
-        print("No results for user+category, retrying with user only...")
-        filtered = filter_messages(user_name)
+        user_names = sorted({_norm_user(m["user_name"]) for m in messages})
+        category_names = sorted({_norm_category(m["category"]) for m in messages})
+        users = {u: i for i, u in enumerate(user_names)}
+        categories = {c: i for i, c in enumerate(category_names)}
+        user_codes = np.array([users[_norm_user(m["user_name"])] for m in messages], dtype=np.int64)
+        cat_codes = np.array([categories[_norm_category(m["category"])] for m in messages], dtype=np.int64)
 
-    if not filtered:
-        print("No results found for this user/category combination.")
-        return []
+        user_ptr, user_docs = _csr(user_codes, len(users))
+        cat_ptr, cat_docs = _csr(cat_codes, len(categories))
+        pair_ptr, pair_docs = _csr(user_codes * len(categories) + cat_codes, len(users) * len(categories))
 
-    corpus = [m["message"] for m in filtered]
-    tokenized_corpus = [word_tokenize(doc.lower()) for doc in corpus]
-    bm25 = BM25Okapi(tokenized_corpus)
+        arrays = {
+            "vocab": np.array(terms, dtype=str),
+            "term_ptr": term_ptr,
+            "term_docs": term_docs,
+            "term_tfs": term_tfs,
+            "doc_lens": doc_lens,
+            "idf": idf.astype(np.float32),
+            "avgdl": np.float64(doc_lens.mean() if n_docs else 1.0),
+            "users": np.array(user_names, dtype=str),
+            "categories": np.array(category_names, dtype=str),
+            "user_ptr": user_ptr,
+            "user_docs": user_docs,
+            "cat_ptr": cat_ptr,
+            "cat_docs": cat_docs,
+            "pair_ptr": pair_ptr,
+            "pair_docs": pair_docs,
+            "doc_ids": np.array([str(m.get("id", i)) for i, m in enumerate(messages)], dtype=str),
+            "tokenizer": np.array(TOKENIZER),
+        }
+        return cls(arrays, messages=messages, k1=k1, b=b)
 
-    scores = bm25.get_scores(word_tokenize(query.lower()))
-    top_indices = np.argsort(scores)[::-1][:top_k]
+    def save(self, path):
+        """
+        Save to `path`: a directory of .npy files that `load` memory-maps, so
+        every worker process shares one copy of the postings through the page
+        cache. A path ending in .npz writes a single archive instead,
+        which is read fully into memory.
+        """
+        if path.endswith(".npz"):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            np.savez(path, **self._arrays)
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, array in self._arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(array))
 
-    return [filtered[i] for i in top_indices]
+    @classmethod
+    def load(cls, path, messages=None):
+        if os.path.isdir(path):
+            arrays = {f[:-4]: np.load(os.path.join(path, f), mmap_mode="r")
+                      for f in os.listdir(path) if f.endswith(".npy")}
+        else:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {k: data[k] for k in data.files}
+        if str(arrays.get("tokenizer", "")) != TOKENIZER:
+            raise ValueError(f"BM25 index at {path} was built with another tokenizer; rebuild it")
+        vocab = arrays["vocab"]
+        if len(vocab) > 1 and not np.all(vocab[:-1] < vocab[1:]):
+            raise ValueError(f"BM25 index at {path} has an unsorted vocabulary; rebuild it")
+        index = cls(arrays, messages=messages)
 
+        if messages is not None:
+            ids = messages.doc_ids if hasattr(messages, "doc_ids") else [str(m.get("id", i)) for i, m in enumerate(messages)]
+            if len(ids) != index.n_docs or not np.array_equal(np.asarray(ids, dtype=str), index.doc_ids):
+                raise ValueError(f"BM25 index at {path} does not match the loaded messages; rebuild it")
+        return index
+
+    def term_id(self, term):
+        i = int(np.searchsorted(self.vocab, term))
+        return i if i < len(self.vocab) and self.vocab[i] == term else None
+
+    def warm(self):
+        """Read the postings once so the first queries don't fault pages in."""
+        for array in self._arrays.values():
+            np.asarray(array).reshape(-1).view(np.uint8).sum(dtype=np.int64)
+        return self.n_docs
+
+    def candidates(self, user_name=None, category=None):
+        """Sorted doc ids matching the filters (None means no filter on that field)."""
+        u = self.users.get(_norm_user(user_name)) if user_name else None
+        c = self.categories.get(_norm_category(category)) if category else None
+
+        if (user_name and u is None) or (category and c is None):
+            return np.empty(0, dtype=np.int32)
+        if u is not None and c is not None:
+            g = u * len(self.categories) + c
+            return self.pair_docs[self.pair_ptr[g]:self.pair_ptr[g + 1]]
+        if u is not None:
+            return self.user_docs[self.user_ptr[u]:self.user_ptr[u + 1]]
+        if c is not None:
+            return self.cat_docs[self.cat_ptr[c]:self.cat_ptr[c + 1]]
+        return np.arange(self.n_docs, dtype=np.int32)
+
+    def df(self, term):
+        t = self.term_id(term)
+        return 0 if t is None else int(self.term_ptr[t + 1] - self.term_ptr[t])
+
+    def get_scores(self, query, candidates, idf=None, avgdl=None):
+        """
+        BM25 scores for `candidates` (sorted doc ids), aligned with that array.
+        `idf` (term -> idf) and `avgdl` replace this index's own statistics
+        when it is one segment of a larger corpus.
+        """
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        if not len(candidates):
+            return scores
+
+        full_scan = len(candidates) == self.n_docs
+        for term, q_freq in Counter(tokenize(query)).items():
+            t = self.term_id(term)
+            if t is None:
+                continue
+            docs = self.term_docs[self.term_ptr[t]:self.term_ptr[t + 1]]
+            tfs = self.term_tfs[self.term_ptr[t]:self.term_ptr[t + 1]]
+
+            if full_scan:
+                pos = docs
+            else:
+                pos = np.searchsorted(candidates, docs)
+                hit = pos < len(candidates)
+                hit[hit] = candidates[pos[hit]] == docs[hit]
+                docs, tfs, pos = docs[hit], tfs[hit], pos[hit]
+
+            if avgdl is None:
+                norm = self._norm[docs]
+            else:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[docs] / avgdl)
+            term_idf = self.idf[t] if idf is None else idf[term]
+            contrib = term_idf * tfs * (self.k1 + 1) / (tfs + norm)
+            scores[pos] += q_freq * contrib
+        return scores
+
+    def _filtered_candidates(self, user_name, category):
+        candidates = self.candidates(user_name, category)
+
+        if not len(candidates) and user_name:
+            print("No results for user+category, retrying with user only...")
+            candidates = self.candidates(user_name)
+
+        if not len(candidates):
+            print("No results found for this user/category combination.")
+        return candidates
+
+    def _top_ids(self, query, candidates, top_k, idf=None, avgdl=None):
+        if not len(candidates):
+            return [], np.empty(0, dtype=np.float32)
+        scores = self.get_scores(query, candidates, idf=idf, avgdl=avgdl)
+        k = min(top_k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return candidates[top].tolist(), scores[top]
+
+    def search_ids(self, query, user_name=None, category=None, top_k=30):
+        return self._top_ids(query, self._filtered_candidates(user_name, category), top_k)
+
+    def search(self, query, user_name=None, category=None, top_k=30):
+        doc_ids, _ = self.search_ids(query, user_name, category, top_k)
+        return [self.messages[i] for i in doc_ids]
+
+    def search_scored(self, query, user_name=None, category=None, top_k=30):
+        """Like `search`, but each hit is a copy carrying its "bm25_score"."""
+        doc_ids, scores = self.search_ids(query, user_name, category, top_k)
+        return [{**self.messages[i], "bm25_score": float(s)} for i, s in zip(doc_ids, scores)]
+
+    def search_scored_many(self, queries, user_name=None, category=None, top_k=30):
+        """`search_scored` for several queries sharing the same filters; candidates are looked up once."""
+        candidates = self._filtered_candidates(user_name, category)
+        results = []
+        for query in queries:
+            doc_ids, scores = self._top_ids(query, candidates, top_k)
+            results.append([{**self.messages[i], "bm25_score": float(s)} for i, s in zip(doc_ids, scores)])
+        return results
+
+
+def load_or_build_index(messages, index_path="data/bm25_index", build=True):
+    abs_path = get_data_path(index_path)
+    if os.path.exists(abs_path):
+        try:
+            return BM25Index.load(abs_path, messages)
+        except ValueError as e:
+            if not build:
+                raise
+            print(f"{e}; building in memory instead.")
+    elif not build:
+        raise FileNotFoundError(f"{abs_path} not found; run scripts/build_indexes.py")
+    else:
+        print(f"{abs_path} not found, building BM25 index in memory.")
+    return BM25Index.build(messages)
+
+
+def bm25_search(query, messages, user_name=None, category=None, top_k=30):
+    return BM25Index.build(messages).search(query, user_name, category, top_k)
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.embedding_provider import (DEFAULT_MODEL, GeminiEmbeddingProvider, aembed_with_backoff, embed_with_backoff,
+                                    provider_from_env)
+
+
+def get_data_path(relative_path):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, relative_path)
+
+
+def normalize_text(text: str):
+    return " ".join((text or "").lower().split())
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model, task_type, normalized text).
+
+    The first tier is an in-memory LRU bounded by `max_entries`. The optional
+    second tier is a sqlite file of float32 blobs that survives restarts;
+    disk hits are promoted into the LRU.
+    """
+
+    def __init__(self, max_entries=10000, db_path=None):
+        self.max_entries = max_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, task_type TEXT, vector BLOB)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(text, model, task_type):
+        raw = f"{model}\x00{task_type}\x00{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get_many(self, texts, model=DEFAULT_MODEL, task_type="retrieval_query"):
+        """Cached vectors aligned with `texts`, None where missing."""
+        keys = [self.make_key(t, model, task_type) for t in texts]
+        found = [None] * len(keys)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[i] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing and self._db is not None:
+                key_list = list(missing)
+                for start in range(0, len(key_list), 500):
+                    chunk = key_list[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, vector)
+                        for i in missing.pop(key):
+                            found[i] = vector
+                            self.disk_hits += 1
+
+            self.misses += sum(len(v) for v in missing.values())
+        return found
+
+    def put_many(self, texts, vectors, model=DEFAULT_MODEL, task_type="retrieval_query"):
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(text, model, task_type)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, model, task_type, vector.tobytes()))
+
+            if self._db is not None and rows:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    @property
+    def blocking(self):
+        """Whether lookups may hit the sqlite tier, and so block on disk."""
+        return self._db is not None
+
+    def get(self, text, model=DEFAULT_MODEL, task_type="retrieval_query"):
+        return self.get_many([text], model, task_type)[0]
+
+    def put(self, text, vector, model=DEFAULT_MODEL, task_type="retrieval_query"):
+        self.put_many([text], [vector], model, task_type)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "entries": len(self._lru),
+        }
+
+
+class CachedEmbedder:
+    """Embeds texts through an EmbeddingCache, sending only the misses to the provider."""
+
+    def __init__(self, cache=None, provider=None, batch_size=100, max_retries=6):
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.provider = provider if provider is not None else GeminiEmbeddingProvider()
+        self.model = self.provider.model
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+
+    def _embed_remote(self, texts, task_type):
+        return embed_with_backoff(self.provider.embed, texts, task_type, max_retries=self.max_retries)
+
+    def embed(self, texts, task_type="retrieval_query"):
+        vectors = self.cache.get_many(texts, self.model, task_type)
+
+        # Collapse duplicates so each distinct text is embedded once.
+        pending = {}
+        for i, (text, vector) in enumerate(zip(texts, vectors)):
+            if vector is None:
+                pending.setdefault(normalize_text(text), []).append(i)
+
+        todo = list(pending)
+        for start in range(0, len(todo), self.batch_size):
+            batch = [texts[pending[key][0]] for key in todo[start:start + self.batch_size]]
+            embedded = self._embed_remote(batch, task_type)
+            self.cache.put_many(batch, embedded, self.model, task_type)
+            for key, vector in zip(todo[start:start + self.batch_size], embedded):
+                for i in pending[key]:
+                    vectors[i] = np.asarray(vector, dtype=np.float32)
+
+        return [v.tolist() for v in vectors]
+
+    def embed_query(self, text):
+        return self.embed([text], task_type="retrieval_query")[0]
+
+    async def _cache_io(self, fn, *args):
+        # The sqlite tier blocks on disk; keep it off the event loop.
+        if self.cache.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def aembed_query(self, text):
+        vector = await self._cache_io(self.cache.get, text, self.model, "retrieval_query")
+        if vector is None:
+            embedded = await aembed_with_backoff(self.provider.aembed, [text], "retrieval_query",
+                                                 max_retries=self.max_retries)
+            vector = embedded[0]
+            await self._cache_io(self.cache.put, text, vector, self.model, "retrieval_query")
+        return np.asarray(vector, dtype=np.float32).tolist()
+
+
+def default_embedder(db_path="data/embedding_cache.sqlite", max_entries=10000, provider=None):
+    provider = provider if provider is not None else provider_from_env()
+    return CachedEmbedder(EmbeddingCache(max_entries=max_entries, db_path=get_data_path(db_path)), provider=provider)
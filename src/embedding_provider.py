@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+
+import numpy as np
+
+from src.fault_injection import faults_from_env
+
+DEFAULT_MODEL = "models/embedding-001"
+
+
+class GeminiEmbeddingProvider:
+    """Google Generative AI embeddings; one request per batch of texts."""
+
+    def __init__(self, model=DEFAULT_MODEL):
+        self.model = model
+        self._genai = None
+
+    @property
+    def genai(self):
+        # Imported and configured on first use: the SDK is slow to import.
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            self._genai = genai
+        return self._genai
+
+    def embed(self, texts, task_type="retrieval_document"):
+        result = self.genai.embed_content(model=self.model, content=list(texts), task_type=task_type)
+        return result["embedding"]
+
+    async def aembed(self, texts, task_type="retrieval_document"):
+        result = await self.genai.embed_content_async(model=self.model, content=list(texts), task_type=task_type)
+        return result["embedding"]
+
+
+class HashEmbeddingProvider:
+    """
+    Deterministic local stand-in for benchmarking and offline runs.
+
+    Uses the hashing trick over lowercase word tokens, so similar texts get
+    similar unit vectors. `latency` simulates the remote round trip per batch.
+    """
+
+    def __init__(self, dim=768, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model = f"local/hash-{dim}"
+
+    def _vector(self, text):
+        v = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def embed(self, texts, task_type="retrieval_document"):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(t).tolist() for t in texts]
+
+    async def aembed(self, texts, task_type="retrieval_document"):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(t).tolist() for t in texts]
+
+
+PROVIDERS = {
+    "gemini": GeminiEmbeddingProvider,
+    "hash": HashEmbeddingProvider,
+}
+
+
+def get_provider(name="gemini", **kwargs):
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider '{name}', expected one of {sorted(PROVIDERS)}")
+    return PROVIDERS[name](**kwargs)
+
+
+def provider_from_env():
+    """
+    EMBEDDING_PROVIDER (gemini by default); "hash" takes its latency from
+    STUB_EMBED_LATENCY. FAULT_EMBED_* settings wrap it in a FaultInjector.
+    """
+    name = os.getenv("EMBEDDING_PROVIDER", "gemini")
+    if name == "hash":
+        return faults_from_env(get_provider(name, latency=float(os.getenv("STUB_EMBED_LATENCY", 0.0))), "EMBED")
+    return faults_from_env(get_provider(name), "EMBED")
+
+
+def is_rate_limited(exc):
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(s in text for s in ("429", "resourceexhausted", "resource exhausted", "quota", "rate limit"))
+
+
+def embed_with_backoff(embed_fn, texts, task_type, max_retries=6, base_delay=1.0, max_delay=60.0):
+    """Call `embed_fn`, retrying rate-limit errors with exponential backoff and full jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return embed_fn(texts, task_type)
+        except Exception as e:
+            if attempt == max_retries or not is_rate_limited(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"Rate limited ({e}); retrying batch of {len(texts)} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+async def aembed_with_backoff(embed_fn, texts, task_type, max_retries=6, base_delay=1.0, max_delay=60.0):
+    """Async counterpart of `embed_with_backoff` for coroutine embed functions."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await embed_fn(texts, task_type)
+        except Exception as e:
+            if attempt == max_retries or not is_rate_limited(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"Rate limited ({e}); retrying batch of {len(texts)} in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -1,4 +1,4 @@
-from langchain_groq import ChatGroq
+from functools import lru_cache
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
@@ -41,19 +41,22 @@ Return a JSON object that strictly follows this format:
 Query: {query}
 """)
 
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0
-)
+@lru_cache(maxsize=None)
+def get_llm():
+    # Built on first use so importing this module stays cheap.
+    from src.llm import make_llm
 
+    return make_llm(temperature=0)
 
-def extract_metadata(query: str):
-    formatted_prompt = prompt.format_messages(
+
+def _format(query: str):
+    return prompt.format_messages(
         query=query,
         format_instructions=parser.get_format_instructions()
     )
-    response = llm.invoke(formatted_prompt)
 
+
+def _parse(response):
     try:
         parsed = parser.parse(response.content)
 
@@ -67,3 +70,10 @@ def extract_metadata(query: str):
     except Exception as e:
         return Metadata(user_name=None, category=[])
 
+
+def extract_metadata(query: str):
+    return _parse(get_llm().invoke(_format(query)))
+
+
+async def aextract_metadata(query: str):
+    return _parse(await get_llm().ainvoke(_format(query)))
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import random
+import time
+
+
+class FaultInjector:
+    """
+    Wraps a chat model or embedding provider so a share of calls fail
+    (`failure_rate`, raising ConnectionError) or stall for `slow_latency`
+    seconds (`slow_rate`) before reaching the wrapped object. Used to
+    exercise timeouts, hedging, circuit breakers and fallbacks locally.
+    """
+
+    def __init__(self, target, failure_rate=0.0, slow_rate=0.0, slow_latency=5.0, seed=None):
+        self.target = target
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.rng = random.Random(seed)
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    def _roll(self):
+        r = self.rng.random()
+        if r < self.failure_rate:
+            raise ConnectionError("injected upstream failure")
+        return r < self.failure_rate + self.slow_rate
+
+    def invoke(self, *args, **kwargs):
+        if self._roll():
+            time.sleep(self.slow_latency)
+        return self.target.invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        if self._roll():
+            await asyncio.sleep(self.slow_latency)
+        return await self.target.ainvoke(*args, **kwargs)
+
+    async def astream(self, *args, **kwargs):
+        if self._roll():
+            await asyncio.sleep(self.slow_latency)
+        async for chunk in self.target.astream(*args, **kwargs):
+            yield chunk
+
+    def embed(self, *args, **kwargs):
+        if self._roll():
+            time.sleep(self.slow_latency)
+        return self.target.embed(*args, **kwargs)
+
+    async def aembed(self, *args, **kwargs):
+        if self._roll():
+            await asyncio.sleep(self.slow_latency)
+        return await self.target.aembed(*args, **kwargs)
+
+
+def faults_from_env(target, prefix):
+    """
+    Wrap `target` when FAULT_<prefix>_FAILURE_RATE or FAULT_<prefix>_SLOW_RATE
+    is set (prefix LLM or EMBED); FAULT_SLOW_LATENCY sets the stall.
+    """
+    failure_rate = float(os.getenv(f"FAULT_{prefix}_FAILURE_RATE", 0))
+    slow_rate = float(os.getenv(f"FAULT_{prefix}_SLOW_RATE", 0))
+    if not failure_rate and not slow_rate:
+        return target
+    return FaultInjector(target, failure_rate, slow_rate, float(os.getenv("FAULT_SLOW_LATENCY", 5.0)))
@@ -0,0 +1,102 @@
+import re
+
+
+def result_key(item):
+    return str(item["id"]) if item.get("id") is not None else item["message"]
+
+
+def _rank(results, score_field, higher_is_better=True):
+    """Dedupe one source's results by key and order them best first."""
+    best = {}
+    for item in results:
+        key = result_key(item)
+        score = item.get(score_field)
+        if score is None:
+            continue
+        current = best.get(key)
+        if current is None or (score > current[score_field] if higher_is_better else score < current[score_field]):
+            best[key] = item
+    return sorted(best.values(), key=lambda r: r[score_field], reverse=higher_is_better)
+
+
+def _normalize(values):
+    if not values:
+        return []
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        return [1.0] * len(values)
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+def _tokens(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def fuse_results(sources, weights=None, rrf_k=60, top_n=20, mmr_lambda=0.7, score_weight=0.5):
+    """
+    Fuse ranked retrieval lists into one short, ordered context.
+
+    `sources` maps a source name to (results, score_field, higher_is_better).
+    Each source is deduped and ranked by its own score, and its scores are
+    min-max normalized. Relevance blends weighted reciprocal rank fusion
+    with the weighted sum of normalized scores, `score_weight` being the
+    share of the latter: ranks keep one source's score scale from
+    dominating, scores keep a clear winner ahead of a near miss. An MMR pass
+    over token-set Jaccard similarity then picks `top_n` results that are
+    relevant but not near-duplicates of each other. Each returned item
+    carries its per-source ranks and scores under "scores".
+    """
+    weights = weights or {}
+    fused = {}
+
+    for source, (results, score_field, higher_is_better) in sources.items():
+        ranked = _rank(results, score_field, higher_is_better)
+        raw = [r[score_field] for r in ranked]
+        norm = _normalize(raw if higher_is_better else [-v for v in raw])
+        weight = weights.get(source, 1.0)
+
+        for rank, (item, n) in enumerate(zip(ranked, norm), 1):
+            key = result_key(item)
+            entry = fused.setdefault(key, {"item": item, "rrf": 0.0, "score": 0.0, "scores": {}})
+            entry["rrf"] += weight / (rrf_k + rank)
+            entry["score"] += weight * n
+            entry["scores"][f"{source}_rank"] = rank
+            entry["scores"][f"{source}_score"] = round(float(item[score_field]), 6)
+            entry["scores"][f"{source}_norm"] = round(n, 4)
+
+    if not fused:
+        return []
+
+    top_rrf = max(e["rrf"] for e in fused.values())
+    top_score = max(e["score"] for e in fused.values()) or 1.0
+    for e in fused.values():
+        e["relevance"] = (1 - score_weight) * e["rrf"] / top_rrf + score_weight * e["score"] / top_score
+        e["tokens"] = _tokens(e["item"]["message"])
+    candidates = sorted(fused.values(), key=lambda e: e["relevance"], reverse=True)
+
+    selected = []
+    while candidates and len(selected) < top_n:
+        best_i, best_mmr = 0, None
+        for i, e in enumerate(candidates):
+            redundancy = max((_jaccard(e["tokens"], s["tokens"]) for s in selected), default=0.0)
+            mmr = mmr_lambda * e["relevance"] - (1 - mmr_lambda) * redundancy
+            if best_mmr is None or mmr > best_mmr:
+                best_i, best_mmr = i, mmr
+        chosen = candidates.pop(best_i)
+        chosen["mmr"] = best_mmr
+        selected.append(chosen)
+
+    return [
+        {
+            **e["item"],
+            "scores": {**e["scores"], "rrf": round(e["rrf"], 6), "fused": round(e["relevance"], 4),
+                       "mmr": round(e["mmr"], 4)},
+        }
+        for e in selected
+    ]
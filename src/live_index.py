@@ -0,0 +1,343 @@
+import fcntl
+import heapq
+import json
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+from src import metrics
+from src.analytics_index import AnalyticsIndex, merge_stats
+from src.bm25_retrieval import BM25Index, tokenize
+from src.message_store import MessageStore
+from src.mmap_vector_index import MmapVectorIndex
+from src.resolve_name import NameIndex
+from src.vector_retrieval import _as_category_list
+
+
+INGESTED_MESSAGES = metrics.REGISTRY.counter("qa_ingested_messages_total", "Messages added through /messages.")
+COMPACTIONS = metrics.REGISTRY.counter("qa_segment_compactions_total", "Background merges of small segments.")
+
+
+def get_data_path(relative_path):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, relative_path)
+
+
+class Segment:
+    """
+    An immutable batch of messages added at runtime: a MmapVectorIndex, whose
+    records are the segment's MessageStore, and BM25 and analytics indexes
+    over the same rows. Everything is memory-mapped, so every worker shares
+    one copy.
+    """
+
+    def __init__(self, path, embedder=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.vectors = MmapVectorIndex(os.path.join(path, "vectors"), embedder=embedder)
+        self.messages = self.vectors.records
+        self.bm25 = BM25Index.load(os.path.join(path, "bm25"), self.messages)
+        try:
+            self.analytics = AnalyticsIndex.load(os.path.join(path, "analytics"), self.messages)
+        except (FileNotFoundError, ValueError):
+            # Written before analytics existed, or under other entity rules; segments are small.
+            self.analytics = AnalyticsIndex.build(self.messages)
+
+    def __len__(self):
+        return len(self.messages)
+
+    @staticmethod
+    def write(path, messages, embeddings):
+        metadatas = [{k: m[k] for k in ("user_id", "user_name", "timestamp", "category")} for m in messages]
+        MmapVectorIndex.save(os.path.join(path, "vectors"), [m["id"] for m in messages],
+                             [m["message"] for m in messages], metadatas, embeddings)
+        store = MessageStore.load(os.path.join(path, "vectors", "records"))
+        BM25Index.build(store).save(os.path.join(path, "bm25"))
+        AnalyticsIndex.build(store).save(os.path.join(path, "analytics"))
+
+
+class Generation:
+    """
+    One consistent view of the corpus: the prebuilt indexes plus the segments
+    published so far. Never modified; a request reads a single generation
+    from start to finish while newer ones are published. With an `engine`
+    (a ShardedRetriever), BM25 over the prebuilt corpus is scored there.
+    """
+
+    def __init__(self, number, segments, messages, bm25_index, vector_retriever, user_index, name_index,
+                 local_extractor, epsilon=0.25, analytics=None, engine=None):
+        self.number = number
+        self.segments = tuple(segments)
+        self.messages = messages
+        self.bm25_index = bm25_index
+        self.vector_retriever = vector_retriever
+        self.user_index = user_index
+        self.name_index = name_index
+        self.local_extractor = local_extractor
+        self.epsilon = epsilon
+        self.analytics = analytics
+        self.engine = engine
+
+        self.n_docs = bm25_index.n_docs + sum(s.bm25.n_docs for s in self.segments)
+        self.avgdl = (bm25_index.avgdl * bm25_index.n_docs
+                      + sum(s.bm25.avgdl * s.bm25.n_docs for s in self.segments)) / max(self.n_docs, 1)
+
+    def with_segments(self, number, segments):
+        """The next generation over the same prebuilt indexes; members first seen in a segment become resolvable."""
+        known = {name.lower() for name in self.user_index}
+        new_members = sorted({u for s in segments for u in s.messages.user_names if u.lower() not in known})
+        user_index, name_index, local_extractor = self.user_index, self.name_index, self.local_extractor
+        if new_members:
+            user_index = [*self.user_index, *new_members]
+            name_index = NameIndex(user_index)
+            if local_extractor is not None:
+                local_extractor = type(local_extractor)(user_index, local_extractor.category_model,
+                                                        local_extractor.second_category_min)
+        return Generation(number, segments, self.messages, self.bm25_index, self.vector_retriever,
+                          user_index, name_index, local_extractor, self.epsilon, self.analytics, self.engine)
+
+    def _idf(self, query, parts):
+        # Okapi idf over the whole generation, floored like BM25Index.build.
+        floor = self.epsilon * float(self.bm25_index.idf.mean()) if len(self.bm25_index.idf) else 0.0
+        idf = {}
+        for term in set(tokenize(query)):
+            df = sum(p.df(term) for p in parts)
+            if df:
+                value = math.log(self.n_docs - df + 0.5) - math.log(df + 0.5)
+                idf[term] = value if value >= 0 else floor
+        return idf
+
+    def bm25_search(self, query, user_name=None, category=None, top_k=30):
+        """BM25Index.search_scored over the prebuilt index and every segment, with corpus-wide statistics."""
+        if not self.segments:
+            return (self.engine or self.bm25_index).search_scored(query, user_name, category, top_k)
+
+        parts = [(self.bm25_index, self.messages)] + [(s.bm25, s.messages) for s in self.segments]
+        candidates = [index.candidates(user_name, category) for index, _ in parts]
+        if not any(len(c) for c in candidates) and user_name:
+            candidates = [index.candidates(user_name) for index, _ in parts]
+            category = None
+
+        idf = self._idf(query, [index for index, _ in parts])
+        hits = []
+        if self.engine is not None:
+            # Engine hits are already messages: each is doc 0 of a one-message list.
+            hits = [(hit["bm25_score"], [hit], 0) for hit in self.engine.search_scored(
+                query, user_name, category, top_k, idf=idf, avgdl=self.avgdl, fallback=False)]
+            parts, candidates = parts[1:], candidates[1:]
+        for (index, messages), docs in zip(parts, candidates):
+            if not len(docs):
+                continue
+            scores = index.get_scores(query, docs, idf=idf, avgdl=self.avgdl)
+            hits += [(float(score), messages, int(doc)) for score, doc in zip(scores, docs)]
+        hits.sort(key=lambda hit: -hit[0])
+        return [{**messages[doc], "bm25_score": score} for score, messages, doc in hits[:top_k]]
+
+    def bm25_search_many(self, queries, user_name=None, category=None, top_k=30):
+        if not self.segments:
+            return (self.engine or self.bm25_index).search_scored_many(queries, user_name, category, top_k)
+        return [self.bm25_search(query, user_name, category, top_k) for query in queries]
+
+    def _analytics_parts(self):
+        return ([self.analytics] if self.analytics is not None else []) + [s.analytics for s in self.segments]
+
+    def entity_stats(self, user_name, categories=None):
+        """AnalyticsIndex.entity_stats over the prebuilt index and every segment."""
+        stats = {}
+        for part in self._analytics_parts():
+            for key, entry in part.entity_stats(user_name, categories).items():
+                merge_stats(stats, key, entry["count"], entry["first"], entry["last"])
+        return stats
+
+    def recent(self, user_name, categories=None, n=5):
+        """The member's `n` latest messages across the prebuilt store and every segment, newest first."""
+        hits = [hit for part in self._analytics_parts() for hit in part.recent(user_name, categories, n)]
+        return [message for _, message in heapq.nlargest(n, hits, key=lambda hit: hit[0])]
+
+    def _vector_plan(self, user_name, categories):
+        """
+        (part, user_name, categories) searches for a vector query, with the
+        fallback level decided across the whole generation as in bm25_search:
+        each category the member has messages in is searched in the parts that
+        hold them, other categories fall back to the member's hits in any
+        category, and only a member no part knows falls back to category-only
+        hits. Part 0 is the prebuilt corpus, then each segment.
+        """
+        stores = [self.messages] + [s.messages for s in self.segments]
+        holders = [i for i, store in enumerate(stores) if user_name and store.user_code(user_name) is not None]
+        if not holders:
+            return [(i, None, categories) for i in range(len(stores))]
+        plan, missing = [], not categories
+        for c in categories:
+            found = [i for i in holders if len(stores[i].rows(user_name, c))]
+            plan += [(i, user_name, [c]) for i in found]
+            missing = missing or not found
+        if missing:
+            plan += [(i, user_name, []) for i in holders]
+        return plan
+
+    def vector_search(self, query, user_name=None, category=None, top_k=25, query_embedding=None):
+        embeddings = None if query_embedding is None else [query_embedding]
+        return self.vector_search_many([query], user_name, category, top_k, embeddings)[0]
+
+    def vector_search_many(self, queries, user_name=None, category=None, top_k=25, query_embeddings=None):
+        """`vector_search` for queries sharing the same filters, batched where the backend supports it."""
+        results = [[] for _ in queries]
+        for part, part_user, categories in self._vector_plan(user_name, _as_category_list(category)):
+            backend = self.vector_retriever if part == 0 else self.segments[part - 1].vectors
+            if hasattr(backend, "search_many"):
+                hits = backend.search_many(queries, part_user, categories, top_k, query_embeddings)
+            else:
+                hits = [backend.search(q, part_user, categories, top_k, e)
+                        for q, e in zip(queries, query_embeddings or [None] * len(queries))]
+            for result, h in zip(results, hits):
+                result += h
+        return results
+
+
+class LiveIndex:
+    """
+    Messages added at runtime, layered over the prebuilt indexes.
+
+    Each batch is written as a new Segment under `segments_dir` and published
+    by atomically replacing manifest.json (under a file lock, so any worker
+    process may publish). `current()` returns the newest Generation and
+    picks up generations published by other workers when the manifest
+    changes. Once there are more than `max_segments` segments, a background
+    thread merges those under `merge_below` messages into one.
+    """
+
+    def __init__(self, base, segments_dir="data/segments", max_segments=8, merge_below=50_000):
+        self.segments_dir = get_data_path(segments_dir)
+        self.manifest_path = os.path.join(self.segments_dir, "manifest.json")
+        self.max_segments = max_segments
+        self.merge_below = merge_below
+        self.embedder = getattr(base.vector_retriever, "embedder", None)
+        self.generation = base
+        self._base = base
+        self._segments = {}
+        self._manifest_version_seen = None
+        self._lock = threading.Lock()
+        self._compacting = threading.Lock()
+        self.refresh()
+
+    @contextmanager
+    def _exclusive(self):
+        os.makedirs(self.segments_dir, exist_ok=True)
+        with open(os.path.join(self.segments_dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"generation": 0, "segments": []}
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _load(self, manifest):
+        with self._lock:
+            if manifest["generation"] == self.generation.number:
+                return self.generation
+            segments = [self._segments.get(name) or Segment(os.path.join(self.segments_dir, name), self.embedder)
+                        for name in manifest["segments"]]
+            self._segments = {s.name: s for s in segments}
+            self.generation = self._base.with_segments(manifest["generation"], segments)
+            return self.generation
+
+    def _manifest_version(self):
+        # The manifest is replaced, never rewritten, so a new inode means a new generation.
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def refresh(self):
+        for attempt in range(3):
+            version = self._manifest_version()
+            if version is None:
+                return self.generation
+            try:
+                generation = self._load(self._read_manifest())
+            except FileNotFoundError:
+                # A compaction removed a segment between reading the manifest and loading it.
+                time.sleep(0.05)
+                continue
+            self._manifest_version_seen = version
+            return generation
+        raise RuntimeError(f"could not load a consistent generation from {self.manifest_path}")
+
+    def current(self):
+        if self._manifest_version() != self._manifest_version_seen:
+            return self.refresh()
+        return self.generation
+
+    def _new_segment_path(self):
+        return os.path.join(self.segments_dir, f"{time.time_ns()}-{uuid.uuid4().hex[:8]}")
+
+    def publish(self, messages, embeddings):
+        """Write `messages` (with their embeddings) as a segment and make it visible; returns the new Generation."""
+        path = self._new_segment_path()
+        Segment.write(path, messages, embeddings)
+        with self._exclusive():
+            manifest = self._read_manifest()
+            manifest = {"generation": manifest["generation"] + 1,
+                        "segments": [*manifest["segments"], os.path.basename(path)]}
+            self._write_manifest(manifest)
+            generation = self._load(manifest)
+        INGESTED_MESSAGES.inc(len(messages))
+        if len(generation.segments) > self.max_segments:
+            threading.Thread(target=self.compact, name="compact-segments", daemon=True).start()
+        return generation
+
+    def compact(self):
+        """Merge the small segments of the current generation into one; returns the number merged."""
+        if not self._compacting.acquire(blocking=False):
+            return 0
+        try:
+            victims = [s for s in self.current().segments if len(s) < self.merge_below]
+            if len(victims) < 2:
+                return 0
+
+            messages = [m for segment in victims for m in segment.messages]
+            embeddings = np.concatenate([segment.vectors.embeddings for segment in victims])
+            path = self._new_segment_path()
+            Segment.write(path, messages, embeddings)
+
+            names = [s.name for s in victims]
+            with self._exclusive():
+                manifest = self._read_manifest()
+                if not set(names) <= set(manifest["segments"]):
+                    # Another worker compacted them first.
+                    shutil.rmtree(path, ignore_errors=True)
+                    return 0
+                first = manifest["segments"].index(names[0])
+                remaining = [n for n in manifest["segments"] if n not in names]
+                manifest = {"generation": manifest["generation"] + 1,
+                            "segments": remaining[:first] + [os.path.basename(path)] + remaining[first:]}
+                self._write_manifest(manifest)
+                self._load(manifest)
+            # Requests still reading the old segments keep their mappings.
+            for name in names:
+                shutil.rmtree(os.path.join(self.segments_dir, name), ignore_errors=True)
+            COMPACTIONS.inc()
+            print(f"Compacted {len(names)} segments ({len(messages)} messages) into {os.path.basename(path)}.")
+            return len(names)
+        finally:
+            self._compacting.release()
@@ -0,0 +1,39 @@
+import os
+from functools import lru_cache
+
+from src.fault_injection import faults_from_env
+
+
+@lru_cache(maxsize=None)
+def http_clients():
+    """One pooled keep-alive HTTP client pair shared by every ChatGroq instance."""
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=30.0,
+    )
+    return httpx.Client(limits=limits), httpx.AsyncClient(limits=limits)
+
+
+def make_llm(**kwargs):
+    """
+    ChatGroq with the given settings, or a StubChatModel when LLM_PROVIDER=stub
+    (simulated latency from STUB_LLM_LATENCY and STUB_LLM_TOKEN_LATENCY).
+    Either can be wrapped in a FaultInjector through FAULT_LLM_* settings.
+    """
+    if os.getenv("LLM_PROVIDER", "groq") == "stub":
+        from src.testing import StubChatModel
+
+        llm = StubChatModel(
+            latency=float(os.getenv("STUB_LLM_LATENCY", 0.0)),
+            token_latency=float(os.getenv("STUB_LLM_TOKEN_LATENCY", 0.0)),
+        )
+    else:
+        from langchain_groq import ChatGroq
+
+        http_client, http_async_client = http_clients()
+        llm = ChatGroq(model="llama-3.3-70b-versatile", http_client=http_client,
+                       http_async_client=http_async_client, **kwargs)
+    return faults_from_env(llm, "LLM")
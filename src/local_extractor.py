@@ -0,0 +1,120 @@
+import os
+import re
+
+import joblib
+import numpy as np
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+
+from src.extractor import Metadata
+from src.resolve_name import normalize
+
+CATEGORIES = [
+    "Travel & Accommodation",
+    "Dining & Experiences",
+    "Personal & Wellness",
+    "Account & Finance",
+    "Transport & Mobility",
+]
+
+# Capitalized words that start questions or are otherwise not member names.
+_NOT_NAMES = {
+    "what", "which", "who", "whom", "whose", "when", "where", "why", "how", "does", "did", "do", "is", "are",
+    "was", "were", "can", "could", "should", "would", "has", "have", "had", "tell", "list", "show", "give",
+    "find", "i", "the", "a", "an", "any", "and", "or", "in", "on", "for", "of", "to", "please", "summarize",
+}
+
+
+def get_data_path(relative_path):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, relative_path)
+
+
+def train_category_model(messages):
+    """TF-IDF + calibrated logistic regression over the five message categories."""
+    texts = [m["message"] for m in messages]
+    labels = [m["category"].strip() for m in messages]
+    model = make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2),
+        CalibratedClassifierCV(LogisticRegression(max_iter=1000, C=4.0), method="sigmoid", cv=3)
+    )
+    model.fit(texts, labels)
+    return model
+
+
+class LocalExtractor:
+    """
+    Extracts the same Metadata as `extract_metadata` without an LLM call.
+
+    Names come from a gazetteer over the user index (full names, then unique
+    first or last names). Categories come from a classifier trained on the
+    categorized messages. `extract` returns the metadata together with a
+    confidence, and callers fall back to the LLM below their threshold.
+    """
+
+    def __init__(self, user_index, category_model, second_category_min=0.25):
+        self.category_model = category_model
+        self.second_category_min = second_category_min
+
+        self.full_names = {}
+        parts = {}
+        for name in user_index:
+            tokens = normalize(name).split()
+            if not tokens:
+                continue
+            self.full_names[" ".join(tokens)] = name
+            for token in {tokens[0], tokens[-1]}:
+                parts.setdefault(token, set()).add(name)
+        self.parts = parts
+        self.max_name_len = max((len(k.split()) for k in self.full_names), default=1)
+
+    @classmethod
+    def load(cls, user_index, model_path="data/category_model.joblib"):
+        abs_path = get_data_path(model_path)
+        if not os.path.exists(abs_path):
+            print(f"{abs_path} not found, local extractor disabled.")
+            return None
+        # Memory-mapped, so worker processes share the model arrays.
+        return cls(user_index, joblib.load(abs_path, mmap_mode="r"))
+
+    def match_name(self, query):
+        """Return (canonical name or None, confidence)."""
+        text = re.sub(r"['’]s\b", "", query)
+        tokens = normalize(re.sub(r"[^\w\s'’-]", " ", text)).split()
+
+        for n in range(min(self.max_name_len, len(tokens)), 1, -1):
+            for i in range(len(tokens) - n + 1):
+                name = self.full_names.get(" ".join(tokens[i:i + n]))
+                if name:
+                    return name, 1.0
+
+        matches = set()
+        for token in tokens:
+            matches |= self.parts.get(token, set())
+        if len(matches) == 1:
+            return matches.pop(), 0.9
+        if len(matches) > 1:
+            return None, 0.3
+
+        # A capitalized word we don't know may be a misspelled or unknown member.
+        words = re.findall(r"\b[A-Z][a-z'’-]+", text)
+        if any(w.lower() not in _NOT_NAMES for w in words[1:] if w.lower() not in self.parts):
+            return None, 0.4
+        return None, 0.9
+
+    def classify(self, query):
+        """Return (categories, confidence of the top category)."""
+        probs = self.category_model.predict_proba([query])[0]
+        classes = self.category_model.classes_
+        order = np.argsort(-probs)
+        categories = [classes[order[0]]]
+        if len(order) > 1 and probs[order[1]] >= self.second_category_min:
+            categories.append(classes[order[1]])
+        return categories, float(probs[order[0]])
+
+    def extract(self, query):
+        user_name, name_conf = self.match_name(query)
+        categories, cat_conf = self.classify(query)
+        return Metadata(user_name=user_name, category=categories), min(name_conf, cat_conf)
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+
+def get_data_path(relative_path):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, relative_path)
+
+
+def epoch_seconds(timestamp):
+    try:
+        return int(datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return 0
+
+
+def file_fingerprint(path):
+    """Size, mtime and sha256 of the file a store is built from (recorded in its meta.json)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+
+
+def _pack(strings):
+    """UTF-8 encode `strings` into one buffer plus int64 offsets."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class MessageStore:
+    """
+    Read-only columnar store of the categorized messages.
+
+    Rows are sorted by (user, category, timestamp), so the messages of a
+    member, or of a member within a category, are one contiguous row range
+    found through `user_ptr` / `pair_ptr`. Category-only postings are kept
+    in `cat_rows`. User, user_id and category are interned integer codes,
+    timestamps are an int64 epoch column, and message text and raw
+    timestamp strings live in contiguous UTF-8 buffers with offsets. Every
+    array is memory-mapped on load, and rows decode to dicts on access.
+    """
+
+    ARRAYS = [
+        "ids", "user_codes", "user_id_codes", "category_codes", "timestamps",
+        "text", "text_offsets", "ts_text", "ts_offsets",
+        "user_ptr", "pair_ptr", "cat_ptr", "cat_rows",
+    ]
+
+    def __init__(self, arrays, meta):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.user_names = meta["users"]
+        self.user_ids = meta["user_ids"]
+        self.category_names = meta["categories"]
+        # The messages file the store was built from (see `built_from`), when known.
+        self.source = meta.get("source")
+        self._fingerprint = meta.get("fingerprint")
+        self._users = {u.lower().strip(): i for i, u in enumerate(self.user_names)}
+        self._categories = {c.strip(): i for i, c in enumerate(self.category_names)}
+
+    def __len__(self):
+        return len(self.user_codes)
+
+    def __getitem__(self, row):
+        row = int(row)
+        return {
+            "id": self.ids[row].decode("utf-8"),
+            "user_id": self.user_ids[self.user_id_codes[row]],
+            "user_name": self.user_names[self.user_codes[row]],
+            "timestamp": self._string(self.ts_text, self.ts_offsets, row),
+            "message": self._string(self.text, self.text_offsets, row),
+            "category": self.category_names[self.category_codes[row]],
+        }
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @staticmethod
+    def _string(buffer, offsets, row):
+        return bytes(buffer[offsets[row]:offsets[row + 1]]).decode("utf-8")
+
+    @property
+    def doc_ids(self):
+        return np.char.decode(np.asarray(self.ids), "utf-8")
+
+    def message_text(self, row):
+        return self._string(self.text, self.text_offsets, int(row))
+
+    def user_code(self, user_name):
+        return self._users.get((user_name or "").lower().strip())
+
+    def category_code(self, category):
+        return self._categories.get((category or "").strip())
+
+    def rows(self, user_name=None, category=None):
+        """Row ids (ascending) matching the filters; None means no filter on that field."""
+        u = self.user_code(user_name) if user_name else None
+        c = self.category_code(category) if category else None
+        if (user_name and u is None) or (category and c is None):
+            return np.empty(0, dtype=np.int64)
+        if u is not None and c is not None:
+            g = u * len(self.category_names) + c
+            return np.arange(self.pair_ptr[g], self.pair_ptr[g + 1])
+        if u is not None:
+            return np.arange(self.user_ptr[u], self.user_ptr[u + 1])
+        if c is not None:
+            return np.asarray(self.cat_rows[self.cat_ptr[c]:self.cat_ptr[c + 1]])
+        return np.arange(len(self))
+
+    @property
+    def fingerprint(self):
+        """
+        Hash of the store's rows, recorded by the indexes built over it so a
+        load can tell they point at the same rows. Saved with the store, so
+        a loaded store doesn't hash its columns again.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for name in ("ids", "user_codes", "category_codes", "timestamps", "text_offsets", "text"):
+                digest.update(np.ascontiguousarray(getattr(self, name)).view(np.uint8))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def built_from(self, messages_path):
+        """
+        Whether the store was built from the file at `messages_path` as it is
+        now. The file is only hashed again when its size matches but its
+        mtime moved (e.g. a fresh copy of the same corpus).
+        """
+        if not self.source:
+            return False
+        stat = os.stat(messages_path)
+        if stat.st_size != self.source["size"]:
+            return False
+        if stat.st_mtime_ns == self.source["mtime_ns"]:
+            return True
+        return file_fingerprint(messages_path)["sha256"] == self.source["sha256"]
+
+    def warm(self):
+        """Read every column once so the first queries don't fault pages in."""
+        for name in self.ARRAYS:
+            getattr(self, name).view(np.uint8).sum(dtype=np.int64)
+        return len(self)
+
+    @classmethod
+    def build(cls, messages, source=None):
+        """Build from message dicts; `source` is the file they were read from, to record its fingerprint."""
+        users = sorted({m["user_name"].strip() for m in messages}, key=str.lower)
+        categories = sorted({m["category"].strip() for m in messages})
+        user_ids = sorted({str(m["user_id"]) for m in messages})
+        user_map = {u: i for i, u in enumerate(users)}
+        category_map = {c: i for i, c in enumerate(categories)}
+        user_id_map = {u: i for i, u in enumerate(user_ids)}
+
+        user_codes = np.array([user_map[m["user_name"].strip()] for m in messages], dtype=np.int32)
+        category_codes = np.array([category_map[m["category"].strip()] for m in messages], dtype=np.int16)
+        timestamps = np.array([epoch_seconds(m["timestamp"]) for m in messages], dtype=np.int64)
+
+        order = np.lexsort((timestamps, category_codes, user_codes))
+        ordered = [messages[i] for i in order]
+        user_codes, category_codes, timestamps = user_codes[order], category_codes[order], timestamps[order]
+
+        n_users, n_categories = len(users), len(categories)
+        user_ptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(user_codes, minlength=n_users), out=user_ptr[1:])
+        pair_codes = user_codes.astype(np.int64) * n_categories + category_codes
+        pair_ptr = np.zeros(n_users * n_categories + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pair_codes, minlength=n_users * n_categories), out=pair_ptr[1:])
+        cat_rows = np.argsort(category_codes, kind="stable").astype(np.int64)
+        cat_ptr = np.zeros(n_categories + 1, dtype=np.int64)
+        np.cumsum(np.bincount(category_codes, minlength=n_categories), out=cat_ptr[1:])
+
+        text, text_offsets = _pack([m["message"] for m in ordered])
+        ts_text, ts_offsets = _pack([str(m["timestamp"]) for m in ordered])
+
+        arrays = {
+            "ids": np.array([str(m["id"]).encode("utf-8") for m in ordered], dtype=bytes),
+            "user_codes": user_codes,
+            "user_id_codes": np.array([user_id_map[str(m["user_id"])] for m in ordered], dtype=np.int32),
+            "category_codes": category_codes,
+            "timestamps": timestamps,
+            "text": text,
+            "text_offsets": text_offsets,
+            "ts_text": ts_text,
+            "ts_offsets": ts_offsets,
+            "user_ptr": user_ptr,
+            "pair_ptr": pair_ptr,
+            "cat_ptr": cat_ptr,
+            "cat_rows": cat_rows,
+        }
+        meta = {"users": users, "user_ids": user_ids, "categories": categories,
+                "source": file_fingerprint(source) if source else None}
+        return cls(arrays, meta)
+
+    def save(self, store_dir="data/message_store"):
+        store_dir = get_data_path(store_dir)
+        os.makedirs(store_dir, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(store_dir, f"{name}.npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(store_dir, "meta.json"), "w") as f:
+            json.dump({"users": self.user_names, "user_ids": self.user_ids, "categories": self.category_names,
+                       "source": self.source, "fingerprint": self.fingerprint}, f)
+
+    @classmethod
+    def load(cls, store_dir="data/message_store"):
+        store_dir = get_data_path(store_dir)
+        with open(os.path.join(store_dir, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode="r") for name in cls.ARRAYS}
+        return cls(arrays, meta)
+
+
+def load_or_build_store(messages_path, store_dir="data/message_store", build=True):
+    """
+    The saved store, unless it was built from another version of
+    `messages_path`; then, or when there is none, a store built in memory
+    (or FileNotFoundError when `build` is False).
+    """
+    if os.path.exists(os.path.join(get_data_path(store_dir), "meta.json")):
+        store = MessageStore.load(store_dir)
+        # Without the messages file (an image shipping only artifacts) there is nothing to compare against.
+        if not os.path.exists(messages_path) or store.built_from(messages_path):
+            return store
+        reason = f"{get_data_path(store_dir)} doesn't match {messages_path}"
+    else:
+        reason = f"{get_data_path(store_dir)} not found"
+    if not build:
+        raise FileNotFoundError(f"{reason}; run scripts/build_indexes.py")
+    print(f"{reason}, building message store from {messages_path}.")
+    with open(messages_path) as f:
+        return MessageStore.build(json.load(f), source=messages_path)
@@ -0,0 +1,198 @@
+import json
+import os
+
+import numpy as np
+
+from src.embedding_cache import default_embedder
+from src.message_store import MessageStore, epoch_seconds
+from src.vector_retrieval import _as_category_list, get_data_path
+
+
+class MmapVectorIndex:
+    """
+    In-process vector backend with the same `search` contract as VectorRetriever.
+
+    Embeddings are unit-normalized float32 (or int8 with per-row scales) in a
+    memory-mapped .npy, next to integer-coded user_name/category columns and
+    epoch timestamps. A search masks the candidate rows, runs one matmul
+    against them and takes the top-k with argpartition. "distance" is
+    squared L2 between unit vectors (2 - 2 cos), so it ranks like Chroma's
+    default l2 space.
+
+    Records are a MessageStore in the same row order, so a loaded index holds
+    no per-process copy of the corpus and worker processes share every page.
+    """
+
+    def __init__(self, index_dir="data/vector_index", embedder=None):
+        self.index_dir = get_data_path(index_dir)
+        self.embedder = embedder if embedder is not None else default_embedder()
+
+        with open(os.path.join(self.index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if os.path.isdir(os.path.join(self.index_dir, "records")):
+            self.records = MessageStore.load(os.path.join(self.index_dir, "records"))
+        else:
+            # Exports from before the records store.
+            with open(os.path.join(self.index_dir, "records.json")) as f:
+                self.records = json.load(f)
+
+        self.quantized = meta["quantized"]
+        self.users = {u: i for i, u in enumerate(meta["users"])}
+        self.categories = {c: i for i, c in enumerate(meta["categories"])}
+
+        def load(name):
+            return np.load(os.path.join(self.index_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.embeddings = load("embeddings")
+        self.scales = load("scales") if self.quantized else None
+        self.user_codes = load("user_codes")
+        self.category_codes = load("category_codes")
+        self.timestamps = load("timestamps")
+
+    def __len__(self):
+        return len(self.records)
+
+    def warm(self):
+        """Read the embedding and filter columns once so the first queries don't fault pages in."""
+        for array in (self.embeddings, self.scales, self.user_codes, self.category_codes, self.timestamps):
+            if array is not None:
+                array.view(np.uint8).sum(dtype=np.int64)
+        return len(self)
+
+    @staticmethod
+    def save(index_dir, ids, documents, metadatas, embeddings, quantize=False):
+        index_dir = get_data_path(index_dir)
+        os.makedirs(index_dir, exist_ok=True)
+
+        # Store rows are sorted by (user, category, timestamp); lay the
+        # embeddings out in the same order.
+        records = MessageStore.build([{"message": d, "id": i, **m} for i, d, m in zip(ids, documents, metadatas)])
+        position = {str(i): n for n, i in enumerate(ids)}
+        order = np.array([position[i] for i in records.doc_ids], dtype=np.int64)
+        metadatas = [metadatas[i] for i in order]
+
+        matrix = np.asarray(embeddings, dtype=np.float32)[order]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        users = sorted({m["user_name"].strip() for m in metadatas})
+        categories = sorted({m["category"].strip() for m in metadatas})
+        user_ids = {u: i for i, u in enumerate(users)}
+        category_ids = {c: i for i, c in enumerate(categories)}
+
+        columns = {
+            "user_codes": np.array([user_ids[m["user_name"].strip()] for m in metadatas], dtype=np.int32),
+            "category_codes": np.array([category_ids[m["category"].strip()] for m in metadatas], dtype=np.int16),
+            "timestamps": np.array([epoch_seconds(m.get("timestamp")) for m in metadatas], dtype=np.int64),
+        }
+        if quantize:
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            columns["embeddings"] = np.round(matrix / scales[:, None]).astype(np.int8)
+            columns["scales"] = scales.astype(np.float32)
+        else:
+            columns["embeddings"] = matrix
+
+        for name, array in columns.items():
+            np.save(os.path.join(index_dir, f"{name}.npy"), array)
+
+        records.save(os.path.join(index_dir, "records"))
+        if os.path.exists(os.path.join(index_dir, "records.json")):
+            os.remove(os.path.join(index_dir, "records.json"))
+        with open(os.path.join(index_dir, "meta.json"), "w") as f:
+            json.dump({"quantized": quantize, "dim": int(matrix.shape[1]), "users": users,
+                       "categories": categories}, f)
+
+    @classmethod
+    def export_from_chroma(cls, collection, index_dir="data/vector_index", quantize=False, page_size=5000):
+        """Copy every embedding and its metadata out of a Chroma collection."""
+        ids, documents, metadatas, embeddings = [], [], [], []
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+            ids += page["ids"]
+            documents += page["documents"]
+            metadatas += [{k: v for k, v in m.items() if k != "content_hash"} for m in page["metadatas"]]
+            embeddings += list(page["embeddings"])
+        cls.save(index_dir, ids, documents, metadatas, embeddings, quantize=quantize)
+        return len(ids)
+
+    def embed_query(self, query):
+        return self.embedder.embed_query(query)
+
+    def _rows(self, user_name=None, category=None, since=None):
+        if isinstance(self.records, MessageStore):
+            # Row order is the store's, so its member/category postings are our candidate rows.
+            rows = self.records.rows(user_name.strip() if user_name else None, category)
+            return rows[self.timestamps[rows] >= since] if since is not None else rows
+        mask = np.ones(len(self.records), dtype=bool)
+        if user_name is not None:
+            code = self.users.get(user_name.strip().title())
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.user_codes == code
+        if category is not None:
+            code = self.categories.get(category)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.category_codes == code
+        if since is not None:
+            mask &= self.timestamps >= since
+        return np.flatnonzero(mask)
+
+    def _top(self, query_embs, rows, top_k):
+        """Top-k hits among `rows` for each row of `query_embs`, from one matmul."""
+        if not len(rows):
+            return [[] for _ in query_embs]
+        if self.quantized:
+            sims = (self.embeddings[rows].astype(np.float32) @ query_embs.T) * self.scales[rows][:, None]
+        else:
+            sims = self.embeddings[rows] @ query_embs.T
+
+        k = min(top_k, len(rows))
+        hits = []
+        for column in sims.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top], kind="stable")]
+            hits.append([{**self.records[rows[i]], "distance": float(2 - 2 * column[i])} for i in top])
+        return hits
+
+    def search(self, query, user_name=None, category=None, top_k=25, query_embedding=None, since=None):
+        """Same levels as VectorRetriever.search, evaluated exactly."""
+        embeddings = None if query_embedding is None else [query_embedding]
+        return self.search_many([query], user_name, category, top_k, embeddings, since)[0]
+
+    def search_many(self, queries, user_name=None, category=None, top_k=25, query_embeddings=None, since=None):
+        """`search` for several queries sharing the same filters; candidate rows are found once."""
+        categories = _as_category_list(category)
+        if not user_name and not categories:
+            return [[] for _ in queries]
+
+        if query_embeddings is None:
+            query_embeddings = [self.embed_query(q) for q in queries]
+        query_embs = np.asarray(query_embeddings, dtype=np.float32).reshape(len(queries), -1)
+        norms = np.linalg.norm(query_embs, axis=1, keepdims=True)
+        query_embs = query_embs / np.where(norms == 0, 1, norms)
+
+        results = [[] for _ in queries]
+        if user_name:
+            user_rows = self._rows(user_name, since=since)
+            if len(user_rows):
+                user_hits = None
+                for cat in categories:
+                    rows = self._rows(user_name, cat, since)
+                    if len(rows):
+                        hits = self._top(query_embs, rows, top_k)
+                    else:
+                        user_hits = user_hits or self._top(query_embs, user_rows, top_k)
+                        hits = user_hits
+                    for result, h in zip(results, hits):
+                        result += h
+                if all(results):
+                    return results
+                user_hits = user_hits or self._top(query_embs, user_rows, top_k)
+                return [result or h for result, h in zip(results, user_hits)]
+
+        for cat in categories:
+            for result, h in zip(results, self._top(query_embs, self._rows(category=cat, since=since), top_k)):
+                result += h
+        return results
@@ -1,31 +1,22 @@
-def build_strong_prompt(final_results: list[dict], metadata: dict, user_query: str, top_k: int = 10):
-    user_name = metadata.get("user_name") or "Unknown"
-    category = metadata.get("category") or "Unknown"
-
-    if not final_results:
-        context_block = "(No retrieved messages available.)"
-    else:
-        context_entries = []
-        for idx, item in enumerate(final_results[:top_k], 1):
-            msg_user = item.get("user_name", "Unknown")
-            msg_category = item.get("category", "Unknown")
-            msg_timestamp = item.get("timestamp", "N/A")
-            msg_text = item.get("message", "")
-            context_entries.append(
-                f"[{idx}] [{msg_user}] ({msg_category}, timestamp: {msg_timestamp}): {msg_text}"
-            )
-        context_block = "\n".join(context_entries)
-
-    prompt = f"""
-You are a highly reliable, safety-aware reasoning assistant with strong analytical capabilities.
+import math
+import re
+from typing import NamedTuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
 
-You are given:
-- A user query: "{user_query}"
-- Extracted metadata: user_name = "{user_name}", category = "{category}"
-- Retrieved message context from memory (numbered for reference).
+# Static instructions, rendered once at import. Everything request-specific
+# goes after them in the user message, so the prefix is byte-identical across
+# requests and providers can reuse their prompt-prefix cache.
+SYSTEM_PROMPT = """
+You are a highly reliable, safety-aware reasoning assistant with strong analytical capabilities.
 
-CONTEXT:
-{context_block}
+Each request gives you:
+- A user query
+- Extracted metadata: user_name and category
+- Retrieved message context from memory (numbered for reference). A message marked
+  "(repeated N times ...)" stands for N near-identical messages; count it N times.
+- Sometimes FACTS: exact message counts and first/latest dates for names, emails,
+  phone numbers and cards across ALL of the member's messages, not just the context.
 
 CORE INSTRUCTIONS:
 
@@ -55,7 +46,7 @@ CORE INSTRUCTIONS:
 5. Temporal Reasoning & "Current" Information
    - Higher timestamps = more recent messages
    - When asked for "current" or "latest" information:
-     a) Identify ALL mentions of that information type
+     a) Identify ALL mentions of that information type (FACTS give each one's latest date)
      b) Compare timestamps
      c) Explicitly state which is most recent and why
    - If updates contain suspicious patterns (e.g., name mismatches), flag them!
@@ -66,6 +57,7 @@ CORE INSTRUCTIONS:
 
 7. Counting & Aggregation
    - When asked "most frequent," "how many," or "all instances," provide exact counts in natural language
+   - When FACTS are given, take counts from them rather than counting the context messages
    - Example: "X appears 7 times in the data" rather than listing message numbers
 
 8. Distinguish Between Services and Ownership
@@ -127,10 +119,119 @@ BAD: "**Answer:** I don't have enough information. **Evidence:** Messages [2], [
 BAD: Using technical structure with sections like "Answer:", "Evidence:", "Confidence Level:"
 BAD: Listing message numbers in the user-facing answer
 
-Now answer the query: "{user_query}"
-
 Remember: Your response should be a clean, natural paragraph (or two) that directly answers the user's question. No technical references, no message numbers, no structured sections - just a clear, conversational answer.
-    """.strip()
+""".strip()
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str):
+    """Local BPE-style estimate: about one token per 4 characters of each word, one per symbol."""
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _TOKEN_RE.findall(text))
+
+
+def _shingles(text: str, n: int = 3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < n:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+class CompiledPrompt(NamedTuple):
+    system: str
+    user: str
+    tokens: int
+    context_messages: int
+    duplicates_collapsed: int
+
+    def messages(self):
+        return [SystemMessage(content=self.system), HumanMessage(content=self.user)]
+
+    def text(self):
+        return f"{self.system}\n\n{self.user}"
+
+
+class PromptCompiler:
+    """
+    Compiles the answer prompt as a stable system prefix plus a per-request tail.
+
+    Near-duplicate messages (word 3-gram Jaccard >= `dedup_threshold` within
+    the same member and category) collapse into one entry carrying the
+    repeat count and the first and latest timestamps. Context is packed
+    greedily, in retrieval order, until `token_budget` is reached.
+    """
+
+    def __init__(self, token_budget=3000, dedup_threshold=0.85):
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.system_tokens = estimate_tokens(SYSTEM_PROMPT)
+
+    def _collapse(self, results):
+        groups = []
+        for item in results:
+            shingles = _shingles(item.get("message", ""))
+            for group in groups:
+                head = group["items"][0]
+                if head.get("user_name") != item.get("user_name") or head.get("category") != item.get("category"):
+                    continue
+                overlap = len(shingles & group["shingles"]) / max(len(shingles | group["shingles"]), 1)
+                if overlap >= self.dedup_threshold:
+                    group["items"].append(item)
+                    break
+            else:
+                groups.append({"items": [item], "shingles": shingles})
+        return [g["items"] for g in groups]
+
+    @staticmethod
+    def _entry(idx, items):
+        latest = max(items, key=lambda m: str(m.get("timestamp", "")))
+        msg_user = latest.get("user_name", "Unknown")
+        msg_category = latest.get("category", "Unknown")
+        msg_timestamp = latest.get("timestamp", "N/A")
+        msg_text = latest.get("message", "")
+        if len(items) > 1:
+            first = min(str(m.get("timestamp", "")) for m in items)
+            return (f"[{idx}] [{msg_user}] ({msg_category}, repeated {len(items)} times, "
+                    f"first: {first}, latest: {msg_timestamp}): {msg_text}")
+        return f"[{idx}] [{msg_user}] ({msg_category}, timestamp: {msg_timestamp}): {msg_text}"
+
+    def compile(self, final_results: list[dict], metadata: dict, user_query: str, max_messages=None, facts=None):
+        user_name = metadata.get("user_name") or "Unknown"
+        category = metadata.get("category") or "Unknown"
+
+        header = f'User query: "{user_query}"\nExtracted metadata: user_name = "{user_name}", category = "{category}"\n\n'
+        if facts:
+            header += "FACTS:\n" + "\n".join(f"- {fact}" for fact in facts) + "\n\n"
+        header += "CONTEXT:\n"
+        footer = f'\n\nNow answer the query: "{user_query}"'
+        used = self.system_tokens + estimate_tokens(header) + estimate_tokens(footer)
+
+        groups = self._collapse(final_results[:max_messages] if max_messages else final_results)
+        entries = []
+        for items in groups:
+            entry = self._entry(len(entries) + 1, items)
+            cost = estimate_tokens(entry) + 1
+            if used + cost > self.token_budget and entries:
+                break
+            entries.append(entry)
+            used += cost
+
+        context_block = "\n".join(entries) if entries else "(No retrieved messages available.)"
+        if not entries:
+            used += estimate_tokens(context_block)
+        packed = sum(len(g) for g in groups[:len(entries)])
+
+        return CompiledPrompt(
+            system=SYSTEM_PROMPT,
+            user=header + context_block + footer,
+            tokens=used,
+            context_messages=packed,
+            duplicates_collapsed=packed - len(entries)
+        )
+
+
+_default_compiler = PromptCompiler()
 
-    return prompt
 
+def build_strong_prompt(final_results: list[dict], metadata: dict, user_query: str, top_k: int = 10):
+    return _default_compiler.compile(final_results, metadata, user_query, max_messages=top_k).text()
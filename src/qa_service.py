@@ -1,50 +1,180 @@
-import json
+import asyncio
+import operator
 import os
-from typing import TypedDict, List, Dict, Any
-from langgraph.graph import StateGraph, END
-from langchain_groq import ChatGroq
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import Annotated, TypedDict, List, Dict, Any
 
-from src.extractor import extract_metadata
-from src.vector_retrieval import chroma_search
-from src.bm25_retrieval import bm25_search
-from src.resolve_name import load_user_index, resolve_user_name
-from src.prompt_builder import build_strong_prompt
+from src.extractor import Metadata, aextract_metadata
+from src.vector_retrieval import make_vector_retriever
+from src.bm25_retrieval import load_or_build_index
+from src.analytics_index import format_facts, load_or_build_analytics, question_intent
+from src.message_store import load_or_build_store
+from src.resolve_name import load_user_index, NameIndex
+from src.prompt_builder import PromptCompiler, estimate_tokens
+from src.fusion import fuse_results
+from src.answer_cache import answer_cache_from_env, normalize_question
+from src.readiness import Readiness
+from src.resilience import (UpstreamError, UpstreamUnavailable, budget_deadline, clients_from_env, iterate_by_deadline,
+                            request_budget, request_deadline)
+from src.single_flight import SingleFlight
+from src.sessions import SESSION_CANDIDATES, SESSION_TURNS, category_key, session_store_from_env
+from src.live_index import Generation, LiveIndex
+from src.sharded_retrieval import sharded_retriever_from_env
+from src import metrics
 
 
 class QAState(TypedDict, total=False):
     query: str
+    # The index generation this request reads from start to finish.
+    generation: Any
     metadata: dict
+    query_embedding: List[float]
     chroma_results: List[Dict[str, Any]]
     bm25_results: List[Dict[str, Any]]
     final_results: List[Dict[str, Any]]
+    # Exact per-member counts and the newest messages, for "latest" and "how many" questions.
+    facts: List[str]
+    recent_results: List[Dict[str, Any]]
+    # Upstreams that failed and were replaced by a fallback; written by parallel nodes.
+    degraded: Annotated[List[str], operator.add]
 
 
 class QAService:
-    def __init__(self, messages_path="data/messages_with_categories.json", user_index_path="data/user_index.json"):
+    COMPONENTS = ["user_index", "llm", "message_store", "bm25_index", "analytics_index", "local_extractor",
+                  "vector_retriever", "retrieval_engine", "segments", "pipeline"]
+    
+    def __init__(self, messages_path="data/messages_with_categories.json", user_index_path="data/user_index.json",
+                 bm25_index_path="data/bm25_index", message_store_dir="data/message_store", max_workers=4, answer_cache=None,
+                 category_model_path="data/category_model.joblib", local_extractor_threshold=None,
+                 context_k=None, fusion_weights=None, readiness=None, require_artifacts=None, vector_retriever=None,
+                 segments_dir="data/segments", analytics_index_path="data/analytics_index"):
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         
         messages_path = os.path.join(base_dir, messages_path)
         user_index_path = os.path.join(base_dir, user_index_path)
         
-        self.user_index = load_user_index(user_index_path)
+        # With REQUIRE_ARTIFACTS=1 every index must come prebuilt by
+        # scripts/build_indexes.py; nothing is built or downloaded at startup.
+        if require_artifacts is None:
+            require_artifacts = os.getenv("REQUIRE_ARTIFACTS", "0") == "1"
+        self.readiness = readiness if readiness is not None else Readiness()
+        self.readiness.register(self.COMPONENTS)
+        track = self.readiness.track
+        
+        with track("user_index"):
+            self.user_index = load_user_index(user_index_path)
+            self.name_index = NameIndex(self.user_index)
+        
+        with track("llm"):
+            from src.llm import make_llm
+            
+            self.llm = make_llm(temperature=0.2, max_tokens=500)
+        
+        with track("message_store"):
+            self.messages = load_or_build_store(messages_path, message_store_dir, build=not require_artifacts)
+        
+        with track("bm25_index"):
+            self.bm25_index = load_or_build_index(self.messages, bm25_index_path, build=not require_artifacts)
         
-        self.llm = ChatGroq(
-            model="llama-3.3-70b-versatile",
-            temperature=0.2,
-            max_tokens=500
+        with track("analytics_index"):
+            self.analytics_index = load_or_build_analytics(self.messages, analytics_index_path,
+                                                           build=not require_artifacts)
+        
+        with track("local_extractor"):
+            from src.local_extractor import LocalExtractor
+            
+            self.local_extractor = LocalExtractor.load(self.user_index, category_model_path)
+            if self.local_extractor is None and require_artifacts:
+                raise FileNotFoundError(f"{category_model_path} not found; run scripts/build_indexes.py")
+        self.local_extractor_threshold = (
+            local_extractor_threshold if local_extractor_threshold is not None
+            else float(os.getenv("LOCAL_EXTRACTOR_THRESHOLD", 0.6))
         )
         
-        with open(messages_path) as f:
-            self.messages = json.load(f)
+        with track("vector_retriever"):
+            self.vector_retriever = vector_retriever if vector_retriever is not None else make_vector_retriever()
+        
+        # With RETRIEVAL_WORKERS > 0, BM25 and vector scoring over the prebuilt
+        # corpus runs in worker processes over member shards (data/shards).
+        with track("retrieval_engine"):
+            self.retrieval_engine = sharded_retriever_from_env(self.bm25_index, self.vector_retriever.embedder)
+        
+        # Messages added through `ingest` since the indexes were built.
+        with track("segments"):
+            base = Generation(0, (), self.messages, self.bm25_index, self.retrieval_engine or self.vector_retriever,
+                              self.user_index, self.name_index, self.local_extractor, analytics=self.analytics_index,
+                              engine=self.retrieval_engine)
+            self.live_index = LiveIndex(base, segments_dir, max_segments=int(os.getenv("MAX_SEGMENTS", 8)))
+        
+        # Blocking work (BM25 scoring, fuzzy matching, Chroma queries) runs here
+        # so the event loop stays free to serve other requests.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qa")
+        # The event loop behind the blocking `answer_question`, started on first use.
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self.cache = answer_cache if answer_cache is not None else answer_cache_from_env()
+        
+        self.context_k = context_k or int(os.getenv("CONTEXT_K", 20))
+        self.fusion_weights = fusion_weights or {"bm25": 1.0, "chroma": 1.0}
+        self.prompt_compiler = PromptCompiler(token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", 3000)))
+        # With facts in the prompt, fewer raw messages are needed as evidence.
+        self.facts_context_k = int(os.getenv("FACTS_CONTEXT_K", 8))
+        self.facts_limit = int(os.getenv("FACTS_LIMIT", 10))
+        self.recent_k = int(os.getenv("RECENT_K", 5))
         
-        self.pipeline = self._build_pipeline()
+        # Deadlines, hedging and circuit breakers for the Groq and Gemini calls.
+        self.clients = clients_from_env()
+        self.request_budget = float(os.getenv("REQUEST_BUDGET", 30))
+        # Concurrent identical questions share one pipeline run.
+        self.single_flight = SingleFlight()
+        # Follow-up questions reuse the member and candidates of earlier turns.
+        self.sessions = session_store_from_env()
+        self.session_context_k = int(os.getenv("SESSION_CONTEXT_K", 10))
+        
+        with track("pipeline"):
+            self.pipeline = self._build_pipeline()
+    
+    def warm(self):
+        """
+        Touch the loaded indexes so first queries don't pay for page faults or
+        lazy initialisation. Safe to run in a background thread while serving.
+        """
+        steps = {
+            "message_store": self.messages.warm,
+            "vector_retriever": getattr(self.vector_retriever, "warm", None),
+            "local_extractor": self.local_extractor and (lambda: self.local_extractor.extract("warm up")),
+            "bm25_index": self.bm25_index.warm,
+            "analytics_index": self.analytics_index.warm,
+            "retrieval_engine": self.retrieval_engine and self.retrieval_engine.warm,
+        }
+        for name, step in steps.items():
+            if not step:
+                continue
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                print(f"Warming {name} failed: {e}")
+                continue
+            self.readiness.mark_warm(name, time.perf_counter() - start)
+    
+    async def _run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
     
-    def _extractor_node(self, state):
-        query = state["query"]
-        meta = extract_metadata(query)
+    def _resolve_name(self, name_index, meta, threshold=85, ambiguity_margin=5):
+        candidates = name_index.candidates(meta.user_name, 5, threshold) if meta.user_name else ()
+        resolved_name = candidates[0][0] if candidates and candidates[0][1] >= threshold else None
         
-        resolved_name = resolve_user_name(meta.user_name, self.user_index)
-        resolved_name = resolved_name[0]
+        # Other members scoring within the margin of the best match are surfaced.
+        ambiguous = [
+            {"user_name": name, "score": score} for name, score in candidates
+            if score >= threshold and resolved_name and candidates[0][1] - score <= ambiguity_margin
+        ]
         
         if resolved_name and resolved_name.lower() != (meta.user_name or "").lower():
             meta.user_name = resolved_name.lower()
@@ -52,63 +182,587 @@ class QAService:
             meta.user_name = None
         elif resolved_name:
             meta.user_name = resolved_name.lower()
+        return meta, (ambiguous if len(ambiguous) > 1 else [])
+    
+    async def _extractor_node(self, state):
+        query, generation = state["query"], state["generation"]
+        source = "llm"
+        meta = local_meta = None
+        degraded = []
+        
+        if generation.local_extractor is not None:
+            with metrics.stage("extractor_local"):
+                local_meta, confidence = await self._run_blocking(generation.local_extractor.extract, query)
+            if confidence >= self.local_extractor_threshold:
+                meta, source = local_meta, "local"
+        
+        if meta is None:
+            try:
+                with metrics.stage("extractor_llm"):
+                    meta = await self.clients["extractor"].call(lambda: aextract_metadata(query))
+            except Exception as e:
+                # Low-confidence local metadata beats none at all.
+                print(f"Extractor LLM unavailable ({e}); falling back to the local extractor.")
+                meta = local_meta or Metadata(user_name=None, category=[])
+                source, degraded = "local_fallback", ["extractor"]
+        with metrics.stage("name_resolution"):
+            meta, name_candidates = await self._run_blocking(self._resolve_name, generation.name_index, meta)
 
-        return {"query": query, "metadata": meta.model_dump()}
+        metadata = {**meta.model_dump(), "extractor": source}
+        if name_candidates:
+            metadata["name_candidates"] = name_candidates
+        return {"query": query, "metadata": metadata, "degraded": degraded}
+    
+    async def _embed_node(self, state):
+        # Only needs the raw query, so it runs alongside the extractor.
+        embedder = self.vector_retriever.embedder
+        try:
+            with metrics.stage("embed"):
+                embedding = await self.clients["embedding"].call(lambda: embedder.aembed_query(state["query"]))
+        except Exception as e:
+            print(f"Embeddings unavailable ({e}); answering from BM25 only.")
+            return {"query_embedding": None, "degraded": ["embedding"]}
+        return {"query_embedding": embedding}
     
-    def _chroma_node(self, state):
+    async def _cached_retrieval(self, source, q, m, generation, fn, *args):
+        with metrics.stage(source):
+            cached = await self.cache.aget_retrieval(source, m.get("user_name"), m.get("category"), q,
+                                                     generation.number)
+            metrics.CACHE_REQUESTS.inc(cache=f"retrieval_{source}", result="miss" if cached is None else "hit")
+            if cached is not None:
+                results = cached
+            else:
+                results = await self._run_blocking(fn, *args)
+                await self.cache.aput_retrieval(source, m.get("user_name"), m.get("category"), q, results,
+                                                generation.number)
+        metrics.RETRIEVED_DOCUMENTS.observe(len(results), source=source)
+        return results
+    
+    async def _chroma_node(self, state):
         q, m = state["query"], state["metadata"]
-        categories = m.get("category", [])
-        if isinstance(categories, str):
-            categories = [categories]
-
-        results = []
-        for cat in categories or [None]:
-            results += chroma_search(q, m.get("user_name"), cat)
+        if state.get("query_embedding") is None:
+            return {"chroma_results": []}
+        generation = state["generation"]
+        results = await self._cached_retrieval(
+            "chroma", q, m, generation,
+            generation.vector_search, q, m.get("user_name"), m.get("category", []), 25, state["query_embedding"]
+        )
         return {"chroma_results": results}
     
-    def _bm25_node(self, state):
-        q, m = state["query"], state["metadata"]
+    def _bm25_search(self, generation, q, m):
         categories = m.get("category", [])
         if isinstance(categories, str):
             categories = [categories]
 
         results = []
         for cat in categories or [None]:
-            results += bm25_search(q, self.messages, m.get("user_name"), cat)
+            results += generation.bm25_search(q, m.get("user_name"), cat)
+        return results
+    
+    async def _bm25_node(self, state):
+        q, m, generation = state["query"], state["metadata"], state["generation"]
+        results = await self._cached_retrieval("bm25", q, m, generation, self._bm25_search, generation, q, m)
         return {"bm25_results": results}
     
-    def _merge_node(self, state):
-        bm25 = state.get("bm25_results", [])
-        chroma = state.get("chroma_results", [])
-        combined = {r["message"]: r for r in (bm25 + chroma)}.values()
-        return {"final_results": list(combined)}
+    def _analytics(self, generation, question, metadata):
+        """
+        For a question about the latest or the most frequent, exact facts about
+        the member: entity mention counts with first and latest dates, and for
+        "latest" questions the member's newest messages in its categories.
+        """
+        user_name = metadata.get("user_name")
+        intent = question_intent(question)
+        if not user_name or not intent:
+            return {}
+        categories = metadata.get("category") or []
+        categories = [categories] if isinstance(categories, str) else list(categories)
+        with metrics.stage("analytics"):
+            # A misjudged category shouldn't hide the member's facts altogether.
+            stats = generation.entity_stats(user_name, categories) or generation.entity_stats(user_name)
+            result = {"facts": format_facts(stats, self.facts_limit, latest_first="temporal" in intent)}
+            if "temporal" in intent:
+                result["recent_results"] = generation.recent(user_name, categories, self.recent_k)
+        return result
+    
+    def _analytics_node(self, state):
+        return self._analytics(state["generation"], state["query"], state["metadata"])
+    
+    def _merge_node(self, state, top_n=None):
+        with metrics.stage("merge"):
+            final_results = fuse_results(
+                {
+                    "bm25": (state.get("bm25_results", []), "bm25_score", True),
+                    "chroma": (state.get("chroma_results", []), "distance", False),
+                },
+                weights=self.fusion_weights,
+                top_n=top_n or self.context_k
+            )
+            recent = state.get("recent_results") or []
+            if recent:
+                # The newest messages lead the context, whatever their retrieval score.
+                ids = {m["id"] for m in recent}
+                final_results = recent + [r for r in final_results if r.get("id") not in ids]
+                final_results = final_results[:top_n or self.context_k]
+        metrics.RETRIEVED_DOCUMENTS.observe(len(final_results), source="merged")
+        return {"final_results": final_results}
     
     def _build_pipeline(self):
+        from langgraph.graph import StateGraph, START, END
+        
         graph = StateGraph(QAState)
         
         graph.add_node("extractor", self._extractor_node)
+        graph.add_node("embed", self._embed_node)
         graph.add_node("chroma", self._chroma_node)
         graph.add_node("bm25", self._bm25_node)
+        graph.add_node("analytics", self._analytics_node)
         graph.add_node("merge", self._merge_node)
         
-        graph.add_edge("extractor", "chroma")
+        graph.add_edge(START, "extractor")
+        graph.add_edge(START, "embed")
+        graph.add_edge(["extractor", "embed"], "chroma")
         graph.add_edge("extractor", "bm25")
-        graph.add_edge("chroma", "merge")
-        graph.add_edge("bm25", "merge")
+        graph.add_edge("extractor", "analytics")
+        graph.add_edge(["chroma", "bm25", "analytics"], "merge")
         graph.add_edge("merge", END)
         
-        graph.set_entry_point("extractor")
         return graph.compile()
     
-    def answer_question(self, question: str) -> str:
-        result = self.pipeline.invoke({"query": question})
+    def _build_prompt(self, result, question):
+        facts = result.get("facts")
+        with metrics.stage("prompt"):
+            return self.prompt_compiler.compile(
+                final_results=result["final_results"],
+                metadata=result["metadata"],
+                user_query=question,
+                max_messages=self.facts_context_k if facts else self.context_k,
+                facts=facts
+            )
+    
+    @staticmethod
+    def _count_tokens(prompt, completion, usage=None):
+        # Provider usage when the response carries it, the local estimate otherwise.
+        usage = usage or {}
+        metrics.LLM_TOKENS.inc(usage.get("input_tokens") or prompt.tokens, call="answer", kind="prompt")
+        metrics.LLM_TOKENS.inc(usage.get("output_tokens") or estimate_tokens(completion), call="answer",
+                               kind="completion")
+    
+    async def _cached_answer(self, question, generation):
+        cached = await self.cache.aget_answer(question, generation.number)
+        metrics.CACHE_REQUESTS.inc(cache="answer", result="miss" if cached is None else "hit")
+        return cached
+    
+    def collect_metrics(self):
+        """Scrape-time metrics for the registry: circuit states, index generation and embedding cache counters."""
+        collected = [(
+            "qa_circuit_open", "gauge", "1 while an upstream's circuit breaker rejects calls.",
+            [({"client": name}, int(client.breaker.state == "open")) for name, client in self.clients.items()],
+        )]
+        generation = self.live_index.generation
+        collected.append(("qa_index_generation", "gauge", "Index generation this worker is serving.",
+                          [({}, generation.number)]))
+        collected.append(("qa_index_segments", "gauge", "Segments of messages added since the last full build.",
+                          [({}, len(generation.segments))]))
+        collected.append(("qa_single_flight_inflight", "gauge", "Distinct questions being answered right now.",
+                          [({}, len(self.single_flight))]))
+        embedding_cache = getattr(self.vector_retriever.embedder, "cache", None)
+        if embedding_cache is not None:
+            stats = embedding_cache.stats()
+            collected.append((
+                "qa_embedding_cache_lookups_total", "counter", "Query embedding cache lookups by result.",
+                [({"result": label}, stats[key]) for label, key in (("hit", "hits"), ("disk_hit", "disk_hits"),
+                                                                  ("miss", "misses"))],
+            ))
+        return collected
+    
+    @staticmethod
+    def _prepare_message(message, generation, members):
+        user_name = (message.get("user_name") or "").strip()
+        text = (message.get("message") or "").strip()
+        if not user_name or not text:
+            raise ValueError("Each message needs a user_name and message text")
+        category = (message.get("category") or "").strip()
+        if category and category not in generation.messages.category_names:
+            raise ValueError(f"Unknown category '{category}'")
+        return {
+            "id": str(message.get("id") or uuid.uuid4()),
+            "user_id": str(message.get("user_id") or ""),
+            "user_name": members.get(user_name.lower(), user_name),
+            "timestamp": message.get("timestamp") or datetime.now(timezone.utc).isoformat(),
+            "message": text,
+            "category": category,
+        }
+    
+    def _categorize(self, generation, messages):
+        pending = [m for m in messages if not m["category"]]
+        if not pending:
+            return
+        if generation.local_extractor is None:
+            raise ValueError("Category is required while no category model is loaded")
+        predicted = generation.local_extractor.category_model.predict([m["message"] for m in pending])
+        for m, category in zip(pending, predicted):
+            m["category"] = str(category)
+    
+    async def ingest(self, messages):
+        """
+        Add `messages` (dicts with user_name and message, optionally id,
+        user_id, timestamp and category) without a rebuild: uncategorized
+        ones go through the category model, all are embedded, and they are
+        published together as one new index generation. Returns the ids and
+        the generation number. Raises ValueError for messages that can't be
+        indexed and UpstreamUnavailable when embedding fails.
+        """
+        generation = self.live_index.current()
+        members = {name.lower(): name for name in generation.user_index}
+        prepared = [self._prepare_message(m, generation, members) for m in messages]
+        if not prepared:
+            raise ValueError("No messages to add")
         
-        prompt = build_strong_prompt(
-            final_results=result["final_results"],
-            metadata=result["metadata"],
-            user_query=question,
-            top_k=80
-        )
+        with metrics.stage("ingest_categorize"):
+            await self._run_blocking(self._categorize, generation, prepared)
+        embedder = self.vector_retriever.embedder
+        try:
+            with metrics.stage("ingest_embed"):
+                embeddings = await self._run_blocking(embedder.embed, [m["message"] for m in prepared],
+                                                      "retrieval_document")
+        except Exception as e:
+            raise UpstreamError(f"embedding new messages failed: {e!r}") from e
+        with metrics.stage("ingest_publish"):
+            generation = await self._run_blocking(self.live_index.publish, prepared, embeddings)
+        return [m["id"] for m in prepared], generation.number
+    
+    @staticmethod
+    def _cacheable(result):
+        # Degraded answers are not cached, so recovery shows up immediately; nor
+        # are answers about a member the question itself doesn't name.
+        return not result.get("degraded") and not result["metadata"].get("inherited_user_name")
+    
+    def _session_fetch(self, generation, question, user_name, categories, embedding):
+        """
+        BM25 and vector candidates for each of `categories` (None for any), by
+        category key. Each category is searched on its own, so one the member
+        has no messages in keeps the member-wide fallback hits, as in the
+        pipeline.
+        """
+        return {
+            category_key(cat): {
+                "bm25": generation.bm25_search(question, user_name, cat),
+                "chroma": [] if embedding is None else generation.vector_search(question, user_name,
+                                                                                  [cat] if cat else [], 25, embedding),
+            }
+            for cat in categories
+        }
+    
+    async def _session_retrieve(self, question, session_id, generation):
+        """
+        The pipeline for a turn of session `session_id`. A question that names
+        no member is about the session's member, and only categories not
+        retrieved by an earlier turn are fetched; the others reuse that
+        turn's candidates and scores. Follow-ups get a shorter context
+        (SESSION_CONTEXT_K).
+        """
+        session = await self.sessions.aget(session_id, generation.number)
+        state = await self._extractor_node({"query": question, "generation": generation})
+        metadata, degraded = state["metadata"], list(state["degraded"])
+        if not metadata.get("user_name") and session["user_name"]:
+            metadata["user_name"] = session["user_name"]
+            metadata["inherited_user_name"] = True
+        elif metadata.get("user_name") != session["user_name"]:
+            session = {**session, "user_name": metadata.get("user_name"), "candidates": {}}
+        
+        categories = metadata.get("category") or []
+        wanted = [categories] if isinstance(categories, str) else list(categories) or [None]
+        missing = [cat for cat in wanted if category_key(cat) not in session["candidates"]]
+        SESSION_TURNS.inc(turn="followup" if session["turns"] else "first")
+        SESSION_CANDIDATES.inc(len(wanted) - len(missing), result="reused")
+        SESSION_CANDIDATES.inc(len(missing), result="fetched")
+        
+        candidates = dict(session["candidates"])
+        if missing:
+            embedded = await self._embed_node({"query": question})
+            degraded += embedded.get("degraded", [])
+            with metrics.stage("session_retrieval"):
+                fetched = await self._run_blocking(self._session_fetch, generation, question,
+                                                   metadata.get("user_name"), missing, embedded["query_embedding"])
+            candidates.update(fetched)
+            if embedded["query_embedding"] is not None:
+                # Candidates without vector hits are used for this turn only.
+                session = {**session, "candidates": candidates}
+        
+        result = {
+            "query": question,
+            "metadata": metadata,
+            "degraded": degraded,
+            "bm25_results": [hit for cat in wanted for hit in candidates[category_key(cat)]["bm25"]],
+            "chroma_results": [hit for cat in wanted for hit in candidates[category_key(cat)]["chroma"]],
+        }
+        result.update(self._analytics(generation, question, metadata))
+        result.update(self._merge_node(result, self.session_context_k if session["turns"] else None))
+        await self.sessions.aput(session_id, {**session, "turns": session["turns"] + 1})
+        return result
+    
+    async def answer(self, question: str, session_id=None) -> dict:
+        """
+        Answer a question, reporting whether it was served from the answer cache
+        and which upstreams were replaced by fallbacks ("degraded"). With a
+        `session_id` the question is a turn of that conversation (see
+        `_session_retrieve`) and bypasses the answer cache. Raises
+        UpstreamUnavailable when the answer LLM is down or out of budget.
+        """
+        generation = self.live_index.current()
+        if session_id:
+            with request_budget(self.request_budget):
+                with metrics.stage("retrieval"):
+                    result = await self._session_retrieve(question, session_id, generation)
+                return await self._complete(question, generation, result)
+        
+        cached = await self._cached_answer(question, generation)
+        if cached is not None:
+            return {"answer": cached["answer"], "cached": True}
+        
+        key = (normalize_question(question), generation.number)
+        return await self.single_flight.do(key, lambda: self._answer(question, generation))
+    
+    async def _answer(self, question, generation):
+        with request_budget(self.request_budget):
+            with metrics.stage("retrieval"):
+                result = await self.pipeline.ainvoke({"query": question, "generation": generation})
+            return await self._complete(question, generation, result)
+    
+    async def _complete(self, question, generation, result):
+        prompt = self._build_prompt(result, question)
+        
+        with metrics.stage("llm"):
+            response = await self.clients["llm"].call(lambda: self.llm.ainvoke(prompt.messages()))
+        
+        self._count_tokens(prompt, response.content, getattr(response, "usage_metadata", None))
+        degraded = result.get("degraded", [])
+        if self._cacheable(result):
+            await self.cache.aput_answer(question, response.content, result["metadata"], generation.number)
+        return {"answer": response.content, "cached": False, "prompt_tokens": prompt.tokens, "degraded": degraded}
+    
+    async def _embed_batch(self, queries):
+        """Query embeddings in provider-sized batches; None where embedding failed."""
+        embedder = self.vector_retriever.embedder
+        size = getattr(embedder, "batch_size", 100)
+        embeddings = []
+        for start in range(0, len(queries), size):
+            chunk = queries[start:start + size]
+            try:
+                with metrics.stage("embed"):
+                    embeddings += await self.clients["embedding"].call(
+                        lambda: self._run_blocking(embedder.embed, chunk, "retrieval_query")
+                    )
+            except Exception as e:
+                print(f"Embeddings unavailable ({e}); answering {len(chunk)} questions from BM25 only.")
+                embeddings += [None] * len(chunk)
+        return embeddings
+    
+    def _retrieve_group(self, generation, user_name, categories, queries, embeddings):
+        """BM25 and vector results for queries sharing (user, categories), with candidates found once."""
+        bm25 = [[] for _ in queries]
+        for cat in categories or [None]:
+            for results, hits in zip(bm25, generation.bm25_search_many(queries, user_name, cat)):
+                results += hits
+        
+        chroma = [[] for _ in queries]
+        embedded = [i for i, e in enumerate(embeddings) if e is not None]
+        if embedded:
+            hits = generation.vector_search_many([queries[i] for i in embedded], user_name, categories, 25,
+                                                 [embeddings[i] for i in embedded])
+            for i, h in zip(embedded, hits):
+                chroma[i] = h
+        return list(zip(bm25, chroma))
+    
+    @staticmethod
+    def _batch_error(e):
+        if isinstance(e, UpstreamUnavailable):
+            print(f"Upstream unavailable: {e}")
+            return {"error": "Answer model unavailable, please retry"}
+        print(f"Error processing question: {e!r}")
+        return {"error": "Failed to process question"}
+    
+    async def answer_batch(self, questions, max_concurrency=None):
+        """
+        Answer many questions together, returning one dict per question in
+        order; a failed item carries "error" instead of "answer". Identical
+        questions are answered once. Metadata is resolved for the whole batch
+        up front, query embeddings are requested in batches, retrieval runs
+        once per (user, categories) group, and at most `max_concurrency`
+        (BATCH_LLM_CONCURRENCY) extractor or answer LLM calls run at a time.
+        """
+        generation = self.live_index.current()
+        unique = {}
+        for question in questions:
+            if question and question.strip():
+                unique.setdefault(normalize_question(question), question.strip())
         
-        response = self.llm.invoke(prompt)
-        return response.content
+        answers = {}
+        pending = []
+        for key, question in unique.items():
+            cached = await self._cached_answer(question, generation)
+            if cached is not None:
+                answers[key] = {"answer": cached["answer"], "cached": True}
+            else:
+                pending.append((key, question))
+        
+        # Extractor and answer LLM calls share one bound, each with a budget of its own.
+        limit = asyncio.Semaphore(max_concurrency or int(os.getenv("BATCH_LLM_CONCURRENCY", 8)))
+        
+        async def extract(question):
+            async with limit:
+                with request_budget(self.request_budget):
+                    return await self._extractor_node({"query": question, "generation": generation})
+        
+        extracted = await asyncio.gather(*(extract(q) for _, q in pending), return_exceptions=True)
+        with request_budget(self.request_budget):
+            embeddings = await self._embed_batch([q for _, q in pending])
+        
+        groups = {}
+        for (key, question), state, embedding in zip(pending, extracted, embeddings):
+            if isinstance(state, Exception):
+                answers[key] = self._batch_error(state)
+                continue
+            categories = state["metadata"].get("category") or []
+            categories = [categories] if isinstance(categories, str) else list(categories)
+            degraded = state["degraded"] + (["embedding"] if embedding is None else [])
+            item = (key, question, {"metadata": state["metadata"], "degraded": degraded}, embedding)
+            groups.setdefault((state["metadata"].get("user_name"), tuple(categories)), []).append(item)
+        
+        with metrics.stage("batch_retrieval"):
+            retrieved = await asyncio.gather(
+                *(self._run_blocking(self._retrieve_group, generation, user_name, list(categories),
+                                     [q for _, q, _, _ in items], [e for _, _, _, e in items])
+                  for (user_name, categories), items in groups.items()),
+                return_exceptions=True
+            )
+        
+        async def complete(key, question, result):
+            async with limit:
+                try:
+                    with request_budget(self.request_budget):
+                        answers[key] = await self._complete(question, generation, result)
+                except Exception as e:
+                    answers[key] = self._batch_error(e)
+        
+        completions = []
+        for items, hits in zip(groups.values(), retrieved):
+            if isinstance(hits, Exception):
+                for key, *_ in items:
+                    answers[key] = self._batch_error(hits)
+                continue
+            for (key, question, result, _), (bm25_results, chroma_results) in zip(items, hits):
+                result.update(self._analytics(generation, question, result["metadata"]))
+                result["final_results"] = self._merge_node(
+                    {"bm25_results": bm25_results, "chroma_results": chroma_results,
+                     "recent_results": result.get("recent_results")}
+                )["final_results"]
+                completions.append(complete(key, question, result))
+        await asyncio.gather(*completions)
+        
+        return [
+            {"question": q, **answers[normalize_question(q)]} if q and q.strip()
+            else {"question": q, "error": "Question is required"}
+            for q in questions
+        ]
+    
+    @staticmethod
+    def _retrieval_counts(result):
+        return {
+            "bm25": len(result.get("bm25_results", [])),
+            "chroma": len(result.get("chroma_results", [])),
+            "merged": len(result["final_results"]),
+        }
+    
+    async def answer_question_async(self, question: str) -> str:
+        return (await self.answer(question))["answer"]
+    
+    async def stream_answer(self, question: str, session_id=None):
+        """
+        Yield (event, data) pairs as the pipeline progresses: "metadata" once the
+        extractor finishes, "retrieval" with result counts, one "token" per LLM
+        chunk, then "done" with elapsed seconds at each stage. An answer-cache
+        hit replays the stored metadata and answer without running the pipeline.
+        Session turns (`session_id`) are answered as in `answer`.
+        """
+        start = time.perf_counter()
+        timings = {}
+        result = {}
+        degraded = []
+        
+        generation = self.live_index.current()
+        cached = None if session_id else await self._cached_answer(question, generation)
+        if cached is not None:
+            yield "metadata", cached["metadata"]
+            yield "token", cached["answer"]
+            yield "done", {"timings": {"total": round(time.perf_counter() - start, 4)}, "cached": True}
+            return
+        
+        # One deadline for the whole stream, set only around each await: a token
+        # held across the yields below can't be reset once the client has gone.
+        deadline = budget_deadline(self.request_budget)
+        if session_id:
+            with request_deadline(deadline):
+                result = await self._session_retrieve(question, session_id, generation)
+            degraded = result["degraded"]
+            timings["retrieval"] = round(time.perf_counter() - start, 4)
+            yield "metadata", result["metadata"]
+            yield "retrieval", self._retrieval_counts(result)
+        else:
+            updates = self.pipeline.astream({"query": question, "generation": generation}, stream_mode="updates")
+            async with aclosing(iterate_by_deadline(updates, deadline)) as updates:
+                async for update in updates:
+                    for node, values in update.items():
+                        timings[node] = round(time.perf_counter() - start, 4)
+                        values = dict(values or {})
+                        degraded += values.pop("degraded", [])
+                        result.update(values)
+                        
+                        if node == "extractor":
+                            yield "metadata", result["metadata"]
+                        elif node == "merge":
+                            yield "retrieval", self._retrieval_counts(result)
+        
+        prompt = self._build_prompt(result, question)
+        
+        answer = []
+        usage = None
+        llm_start = time.perf_counter()
+        chunks = self.clients["llm"].stream(lambda: self.llm.astream(prompt.messages()))
+        with metrics.stage("llm"):
+            async with aclosing(iterate_by_deadline(chunks, deadline)) as chunks:
+                async for chunk in chunks:
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.content:
+                        if "first_token" not in timings:
+                            timings["first_token"] = round(time.perf_counter() - start, 4)
+                            metrics.STAGE_SECONDS.observe(time.perf_counter() - llm_start, stage="llm_first_token")
+                        answer.append(chunk.content)
+                        yield "token", chunk.content
+        
+        self._count_tokens(prompt, "".join(answer), usage)
+        if self._cacheable({**result, "degraded": degraded}):
+            await self.cache.aput_answer(question, "".join(answer), result["metadata"], generation.number)
+        timings["total"] = round(time.perf_counter() - start, 4)
+        done = {"timings": timings, "cached": False, "prompt_tokens": prompt.tokens, "degraded": degraded}
+        trace = metrics.current_trace()
+        if trace is not None:
+            done["trace"] = trace.spans
+        yield "done", done
+    
+    def answer_question(self, question: str) -> str:
+        """
+        Blocking wrapper for scripts (main.py). Every call runs on the same
+        event loop, in a background thread: the pooled async HTTP client
+        (`src.llm.http_clients`) is bound to the loop that first used it, so a
+        loop per call (asyncio.run) would break it from the second call on.
+        """
+        future = asyncio.run_coroutine_threadsafe(self.answer_question_async(question), self._sync_loop())
+        return future.result()
+    
+    def _sync_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="qa-sync", daemon=True).start()
+            return self._loop
@@ -0,0 +1,59 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Reference point for cold-start time: as early as the process imports us.
+PROCESS_START = time.time()
+
+
+class Readiness:
+    """
+    Load state of each service component: "pending", "loading", "ready" or
+    "failed", with the seconds each took to load and, once warmed, to
+    warm. `ready` is true once every registered component is loaded, and
+    `cold_start_seconds` is the time from process start until that happened.
+    """
+
+    def __init__(self, components=()):
+        self._lock = threading.Lock()
+        self._components = {name: {"state": "pending"} for name in components}
+        self.cold_start_seconds = None
+
+    def register(self, components):
+        with self._lock:
+            for name in components:
+                self._components.setdefault(name, {"state": "pending"})
+
+    @contextmanager
+    def track(self, name):
+        start = time.perf_counter()
+        self._set(name, {"state": "loading"})
+        try:
+            yield
+        except Exception as e:
+            self._set(name, {"state": "failed", "error": str(e), "seconds": round(time.perf_counter() - start, 4)})
+            raise
+        self._set(name, {"state": "ready", "seconds": round(time.perf_counter() - start, 4)})
+
+    def mark_warm(self, name, seconds):
+        with self._lock:
+            self._components[name]["warm_seconds"] = round(seconds, 4)
+
+    def _set(self, name, status):
+        with self._lock:
+            self._components[name] = status
+            if self.cold_start_seconds is None and all(c["state"] == "ready" for c in self._components.values()):
+                self.cold_start_seconds = round(time.time() - PROCESS_START, 4)
+
+    @property
+    def ready(self):
+        return self.cold_start_seconds is not None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "cold_start_seconds": self.cold_start_seconds,
+                "uptime_seconds": round(time.time() - PROCESS_START, 4),
+                "components": {name: dict(c) for name, c in self._components.items()},
+            }
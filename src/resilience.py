@@ -0,0 +1,282 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from src import metrics
+
+UPSTREAM_CALLS = metrics.REGISTRY.counter(
+    "qa_upstream_calls_total", "Outbound calls by client and outcome (ok, error, timeout, rejected).",
+    ["client", "outcome"]
+)
+UPSTREAM_HEDGES = metrics.REGISTRY.counter("qa_upstream_hedges_total", "Hedged duplicate calls sent.", ["client"])
+
+_deadline = ContextVar("request_deadline", default=None)
+
+
+class UpstreamUnavailable(RuntimeError):
+    """An outbound call failed fast: circuit open or deadline exceeded."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    pass
+
+
+class UpstreamError(UpstreamUnavailable):
+    """The upstream call raised; the original exception is chained as __cause__."""
+
+
+def budget_deadline(seconds):
+    """The time.monotonic() deadline `seconds` from now, or an earlier one already in effect."""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    return deadline if current is None else min(current, deadline)
+
+
+@contextmanager
+def request_deadline(deadline):
+    """Bound every outbound call in this context to the absolute `deadline` (see `budget_deadline`)."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def request_budget(seconds):
+    """Bound every outbound call in this context to `seconds` from now (or an earlier enclosing budget)."""
+    with request_deadline(budget_deadline(seconds)):
+        yield
+
+
+async def iterate_by_deadline(iterator, deadline):
+    """
+    Iterate `iterator` with `deadline` in effect only while each item is
+    produced. A generator that yields must not hold the context token across
+    its yields: it can be resumed or closed from another context, where the
+    reset fails and the upstream under it is left open. Closing this
+    iterator closes `iterator`.
+    """
+    iterator = iterator.__aiter__()
+    try:
+        while True:
+            with request_deadline(deadline):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+def remaining_budget():
+    deadline = _deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single probe through (half-open): a
+    success closes it again, a failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release(self):
+        """Give up a probe that neither succeeded nor failed, e.g. a cancelled call."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class ResilientClient:
+    """
+    Wraps one upstream (extractor LLM, embeddings, answer LLM).
+
+    Each call gets a timeout of `timeout` seconds, capped by the remaining
+    request budget, and goes through a circuit breaker. When `max_hedges`
+    is set, a duplicate request is sent if the first has not answered within
+    the `hedge_percentile` latency of recent calls; the first success wins
+    and the others are cancelled. Only hedge idempotent, cheap calls. A
+    failed attempt is retried up to `retries` times within the same timeout.
+    Every failure surfaces as an UpstreamUnavailable.
+    """
+
+    def __init__(self, name, timeout=10.0, max_hedges=0, retries=1, hedge_percentile=95, min_hedge_delay=0.05,
+                 min_samples=20, window=500, breaker=None):
+        self.name = name
+        self.timeout = timeout
+        self.max_hedges = max_hedges
+        self.retries = retries
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+
+    def hedge_delay(self):
+        if not self.max_hedges or len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return max(self.min_hedge_delay, ordered[index])
+
+    def _begin(self):
+        # Budget first: a half-open breaker's probe must not be taken by a call that never runs.
+        budget = remaining_budget()
+        timeout = self.timeout if budget is None else min(self.timeout, budget)
+        if timeout <= 0:
+            UPSTREAM_CALLS.inc(client=self.name, outcome="timeout")
+            raise DeadlineExceeded(f"no request budget left for {self.name}")
+        if not self.breaker.allow():
+            UPSTREAM_CALLS.inc(client=self.name, outcome="rejected")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        return timeout
+
+    def _failed(self, error, timeout):
+        self.breaker.record_failure()
+        if isinstance(error, asyncio.TimeoutError):
+            UPSTREAM_CALLS.inc(client=self.name, outcome="timeout")
+            return DeadlineExceeded(f"{self.name} call exceeded {timeout:.2f}s")
+        UPSTREAM_CALLS.inc(client=self.name, outcome="error")
+        return UpstreamError(f"{self.name} call failed: {error!r}")
+
+    def _succeeded(self, seconds):
+        self.breaker.record_success()
+        self.latencies.append(seconds)
+        UPSTREAM_CALLS.inc(client=self.name, outcome="ok")
+
+    async def call(self, factory):
+        """Await `factory()` (a coroutine function) under the deadline, breaker and hedging policy."""
+        timeout = self._begin()
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self._hedged(factory), timeout)
+        except Exception as e:
+            raise self._failed(e, timeout) from e
+        except BaseException:
+            self.breaker.release()
+            raise
+        self._succeeded(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, factory):
+        pending = {asyncio.ensure_future(factory())}
+        hedges, retries, delay = 0, 0, self.hedge_delay()
+        error = None
+        try:
+            while pending:
+                wait = delay if delay is not None and hedges < self.max_hedges else None
+                done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    UPSTREAM_HEDGES.inc(client=self.name)
+                    pending.add(asyncio.ensure_future(factory()))
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending and retries < self.retries:
+                    retries += 1
+                    pending.add(asyncio.ensure_future(factory()))
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, factory):
+        """Iterate `factory()` (an async iterator) with the call's deadline applied to the whole stream."""
+        timeout = self._begin()
+        start = time.monotonic()
+        iterator = None
+        try:
+            iterator = factory().__aiter__()
+            while True:
+                left = timeout - (time.monotonic() - start)
+                if left <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), left)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except Exception as e:
+            raise self._failed(e, timeout) from e
+        except BaseException:
+            self.breaker.release()
+            raise
+        finally:
+            if iterator is not None and hasattr(iterator, "aclose"):
+                await iterator.aclose()
+        self._succeeded(time.monotonic() - start)
+
+
+def clients_from_env():
+    """
+    Clients for the three upstreams. Timeouts come from EXTRACTOR_TIMEOUT,
+    EMBED_TIMEOUT and LLM_TIMEOUT, and failed attempts are retried
+    UPSTREAM_RETRIES times. The extractor and embedding calls are also
+    hedged (HEDGE_PERCENTILE); the answer LLM is not, since a duplicate
+    generation doubles its cost.
+    """
+    percentile = float(os.getenv("HEDGE_PERCENTILE", 95))
+    retries = int(os.getenv("UPSTREAM_RETRIES", 1))
+
+    def breaker():
+        return CircuitBreaker(int(os.getenv("BREAKER_FAILURES", 5)), float(os.getenv("BREAKER_RESET_SECONDS", 30)))
+
+    return {
+        "extractor": ResilientClient("extractor", float(os.getenv("EXTRACTOR_TIMEOUT", 5)), max_hedges=1,
+                                     retries=retries, hedge_percentile=percentile, breaker=breaker()),
+        "embedding": ResilientClient("embedding", float(os.getenv("EMBED_TIMEOUT", 3)), max_hedges=1,
+                                     retries=retries, hedge_percentile=percentile, breaker=breaker()),
+        "llm": ResilientClient("llm", float(os.getenv("LLM_TIMEOUT", 20)), retries=retries, breaker=breaker()),
+    }
@@ -1,7 +1,9 @@
 import json
 import os
+from functools import lru_cache
 from pathlib import Path
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
+import numpy as np
 import re
 
 
@@ -64,3 +66,108 @@ def resolve_user_name(query_name: str, known_names: list[str], threshold: int =
             best_match = candidate
 
     return (best_match, round(best_score, 2)) if best_score >= threshold else (None, best_score)
+
+
+_SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(["aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"]) for c in letters}
+
+
+def soundex(token: str):
+    token = re.sub(r"[^a-z]", "", token.lower())
+    if not token:
+        return ""
+    code = token[0].upper()
+    last = _SOUNDEX_CODES.get(token[0], "")
+    for c in token[1:]:
+        digit = _SOUNDEX_CODES.get(c, "")
+        if digit and digit != "0" and digit != last:
+            code += digit
+        if c not in "hw":
+            last = digit
+    return (code + "000")[:4]
+
+
+class NameIndex:
+    """
+    Pre-tokenized index over the known names, scored in batch.
+
+    Scores are the same as `resolve_user_name`: fuzz.ratio on first names,
+    averaged with the last name and middle names when both sides have them.
+    Candidates are first narrowed by blocking keys (soundex and first letter
+    of the first and last name); a full vectorized scan runs only when no
+    blocked candidate clears the threshold.
+    """
+
+    def __init__(self, known_names: list[str], cache_size=4096):
+        self.names = []
+        firsts, mids, lasts, n_tokens = [], [], [], []
+        for name in known_names:
+            tokens = tokenize(name)
+            if not tokens:
+                continue
+            self.names.append(name)
+            firsts.append(tokens[0])
+            lasts.append(tokens[-1] if len(tokens) > 1 else "")
+            mids.append(" ".join(tokens[1:-1]) if len(tokens) > 2 else "")
+            n_tokens.append(len(tokens))
+
+        self.firsts, self.mids, self.lasts = firsts, mids, lasts
+        self.n_tokens = np.array(n_tokens, dtype=np.int32)
+
+        self.blocks = {}
+        for i, (first, last) in enumerate(zip(firsts, lasts)):
+            for token in filter(None, (first, last)):
+                for key in (f"s:{soundex(token)}", f"l:{token[0]}"):
+                    self.blocks.setdefault(key, []).append(i)
+
+        self.candidates = lru_cache(maxsize=cache_size)(self._candidates)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _score(self, q_tokens, rows):
+        def ratios(query, column):
+            choices = [column[i] for i in rows]
+            return process.cdist([query], choices, scorer=fuzz.ratio, dtype=np.float32, workers=1)[0]
+
+        n_tokens = self.n_tokens[rows]
+        first = ratios(q_tokens[0], self.firsts)
+        scores = first
+        if len(q_tokens) > 1:
+            last = ratios(q_tokens[-1], self.lasts)
+            scores = np.where(n_tokens > 1, (first + last) / 2, first)
+            if len(q_tokens) > 2:
+                mid = ratios(" ".join(q_tokens[1:-1]), self.mids)
+                scores = np.where(n_tokens > 2, (first + mid + last) / 3, scores)
+        return scores
+
+    def _block(self, q_tokens):
+        rows = set()
+        for token in {q_tokens[0], q_tokens[-1]}:
+            rows.update(self.blocks.get(f"s:{soundex(token)}", ()))
+            rows.update(self.blocks.get(f"l:{token[0]}", ()))
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def _candidates(self, query_name: str, k: int = 5, threshold: int = 85):
+        """Top-k (name, score) pairs, best first; memoized per query."""
+        q_tokens = tokenize(query_name)
+        if not q_tokens or not self.names:
+            return ()
+
+        rows = self._block(q_tokens)
+        scores = self._score(q_tokens, rows) if len(rows) else np.empty(0, dtype=np.float32)
+        if not len(rows) or scores.max() < threshold:
+            rows = np.arange(len(self.names))
+            scores = self._score(q_tokens, rows)
+
+        # Stable sort keeps the earlier known name on ties, as the linear scan did.
+        order = np.argsort(-scores, kind="stable")[:k]
+        return tuple((self.names[rows[i]], round(float(scores[i]), 2)) for i in order)
+
+    def resolve(self, query_name: str, threshold: int = 85):
+        if not query_name:
+            return None, 0
+        top = self.candidates(query_name, 1, threshold)
+        if not top:
+            return None, 0
+        best_match, best_score = top[0]
+        return (best_match, best_score) if best_score >= threshold else (None, best_score)
@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+from src import metrics
+from src.answer_cache import MemoryBackend, SqliteBackend
+
+SESSION_TURNS = metrics.REGISTRY.counter(
+    "qa_session_turns_total", "Questions asked in a session: first turn or follow-up.", ["turn"]
+)
+SESSION_CANDIDATES = metrics.REGISTRY.counter(
+    "qa_session_candidates_total", "Per-category candidate sets reused from the session or fetched.", ["result"]
+)
+
+
+def category_key(category):
+    # Candidate sets are stored by category; "" stands for "any category".
+    return category or ""
+
+
+class SessionStore:
+    """
+    Conversation state by session id, on the answer cache's LRU + TTL
+    backends: each write renews the TTL, and the least recently used
+    sessions are evicted past `max_entries`.
+
+    A session remembers the member it is about and, per category, the BM25
+    and vector candidates already fetched for that member in the index
+    generation they came from. `aget`/`aput` keep a blocking backend's I/O
+    off the event loop.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryBackend(max_entries=10000, ttl=1800)
+
+    def get(self, session_id, generation):
+        """The session's state, or a new one; candidates from an older generation are dropped."""
+        session = self.backend.get(f"session:{session_id}")
+        if session is None:
+            return {"user_name": None, "generation": generation, "candidates": {}, "turns": 0}
+        if session["generation"] != generation:
+            session = {**session, "generation": generation, "candidates": {}}
+        return session
+
+    def put(self, session_id, session):
+        self.backend.set(f"session:{session_id}", session)
+
+    async def aget(self, session_id, generation):
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(self.get, session_id, generation)
+        return self.get(session_id, generation)
+
+    async def aput(self, session_id, session):
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(self.put, session_id, session)
+        return self.put(session_id, session)
+
+
+def session_store_from_env():
+    ttl = float(os.getenv("SESSION_TTL", 1800))
+    max_entries = int(os.getenv("MAX_SESSIONS", 10000))
+    if os.getenv("SESSION_BACKEND", "memory") == "sqlite":
+        # Shared by every worker, so a follow-up may land on any of them.
+        backend = SqliteBackend(os.getenv("SESSION_PATH", "data/sessions.sqlite"), max_entries, ttl)
+    else:
+        backend = MemoryBackend(max_entries, ttl)
+    return SessionStore(backend)
@@ -0,0 +1,216 @@
+import heapq
+import json
+import multiprocessing
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from src import metrics
+from src.bm25_retrieval import tokenize
+from src.live_index import Segment
+
+SHARD_CALLS = metrics.REGISTRY.counter(
+    "qa_shard_calls_total", "Retrieval calls by how many shards they were scattered to.", ["fanout"]
+)
+
+
+def get_data_path(relative_path):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, relative_path)
+
+
+def shard_of(user_name, n_shards):
+    # crc32 rather than hash(): every process must agree, whatever PYTHONHASHSEED is.
+    return zlib.crc32((user_name or "").lower().strip().encode("utf-8")) % n_shards
+
+
+def build_shards(source, shards_dir="data/shards", n_shards=8):
+    """
+    Split a MmapVectorIndex (its records and embeddings) into `n_shards`
+    Segments by member hash, and write manifest.json last. Returns the
+    number of messages in each shard.
+    """
+    shards_dir = get_data_path(shards_dir)
+    shutil.rmtree(shards_dir, ignore_errors=True)
+    os.makedirs(shards_dir)
+
+    records = source.records
+    codes = np.array([shard_of(name, n_shards) for name in records.user_names], dtype=np.int32)
+    row_shards = codes[np.asarray(records.user_codes)]
+    sizes = []
+    for shard in range(n_shards):
+        rows = np.flatnonzero(row_shards == shard)
+        embeddings = np.asarray(source.embeddings[rows], dtype=np.float32)
+        if source.quantized:
+            embeddings = embeddings * np.asarray(source.scales[rows])[:, None]
+        Segment.write(os.path.join(shards_dir, f"shard-{shard:03d}"), [records[r] for r in rows], embeddings)
+        sizes.append(len(rows))
+
+    with open(os.path.join(shards_dir, "manifest.json"), "w") as f:
+        json.dump({"shards": [f"shard-{shard:03d}" for shard in range(n_shards)], "messages": len(records)}, f)
+    return sizes
+
+
+# Worker process state: shards are memory-mapped on first use. Queries
+# arrive already embedded, so workers get no embedder of their own.
+_shards_dir = None
+_shards = {}
+_NO_EMBEDDER = object()
+
+
+def _init_worker(shards_dir):
+    global _shards_dir
+    _shards_dir = shards_dir
+
+
+def _shard(name):
+    shard = _shards.get(name)
+    if shard is None:
+        shard = _shards[name] = Segment(os.path.join(_shards_dir, name), embedder=_NO_EMBEDDER)
+    return shard
+
+
+def _warm_shard(name):
+    shard = _shard(name)
+    shard.messages.warm()
+    shard.bm25.warm()
+    shard.vectors.warm()
+    return name
+
+
+def _bm25_shard(name, queries, user_name, category, top_k, idf, avgdl, fallback):
+    index = _shard(name).bm25
+    candidates = index._filtered_candidates(user_name, category) if fallback else index.candidates(user_name, category)
+    results = []
+    for query, query_idf in zip(queries, idf):
+        doc_ids, scores = index._top_ids(query, candidates, top_k, idf=query_idf, avgdl=avgdl)
+        results.append([{**index.messages[i], "bm25_score": float(s)} for i, s in zip(doc_ids, scores)])
+    return results
+
+
+def _vector_shard(name, queries, user_name, categories, top_k, embeddings):
+    vectors = _shard(name).vectors
+    # One list per category, so the gather can keep the per-category top-k; a
+    # member query without categories is a single list of the member's hits.
+    groups = [[cat] for cat in categories] or [[]]
+    per_group = [vectors.search_many(queries, user_name, cats, top_k, embeddings) for cats in groups]
+    return [[hits[i] for hits in per_group] for i in range(len(queries))]
+
+
+def _merge(lists, key, top_k):
+    """k-way merge of lists already sorted by `key`, keeping the first `top_k`."""
+    return list(islice(heapq.merge(*lists, key=key), top_k))
+
+
+class ShardedRetriever:
+    """
+    BM25 and vector search over the prebuilt corpus split into shards by
+    member hash (see `build_shards`), scored in a pool of worker processes
+    so scoring does not hold the request process's GIL.
+
+    A query for one member goes to that member's shard only; any other
+    query is scattered to every shard. Each shard returns its own top-k,
+    sorted, and the results are combined with a k-way merge. BM25 uses the
+    whole corpus's idf and average length (from `bm25_index`), so scores
+    and rankings match the unsharded index. Every worker may serve any
+    shard: the shards are memory-mapped, so their pages are shared through
+    the page cache rather than copied into each process.
+
+    Implements `search_scored`/`search_scored_many` like BM25Index and
+    `search`/`search_many` like MmapVectorIndex, so a Generation can use it
+    in place of either.
+    """
+
+    def __init__(self, shards_dir, bm25_index, embedder=None, workers=None):
+        self.shards_dir = get_data_path(shards_dir)
+        with open(os.path.join(self.shards_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest["messages"] != bm25_index.n_docs:
+            raise ValueError(f"Shards at {self.shards_dir} do not match the BM25 index; rebuild them")
+        self.shards = manifest["shards"]
+        self.bm25_index = bm25_index
+        self.embedder = embedder
+        self.workers = workers or min(len(self.shards), os.cpu_count() or 1)
+        # Not forked: the serving process has threads and an event loop running.
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(self.shards_dir,))
+
+    def _route(self, user_name):
+        shards = [self.shards[shard_of(user_name, len(self.shards))]] if user_name else self.shards
+        SHARD_CALLS.inc(fanout="one" if len(shards) == 1 else "all")
+        return shards
+
+    def _scatter(self, fn, user_name, *args):
+        futures = [self.pool.submit(fn, name, *args) for name in self._route(user_name)]
+        return [future.result() for future in futures]
+
+    def _idf(self, query):
+        idf = {}
+        for term in set(tokenize(query)):
+            t = self.bm25_index.term_id(term)
+            if t is not None:
+                idf[term] = float(self.bm25_index.idf[t])
+        return idf
+
+    def warm(self):
+        for future in [self.pool.submit(_warm_shard, name) for name in self.shards]:
+            future.result()
+        return len(self.shards)
+
+    def search_scored_many(self, queries, user_name=None, category=None, top_k=30, idf=None, avgdl=None,
+                           fallback=True):
+        """
+        BM25Index.search_scored_many across the shards. `idf` (term -> idf,
+        for all the queries) and `avgdl` override the corpus statistics, as in
+        BM25Index.get_scores; with `fallback` off, no shard falls back to
+        the member's messages in other categories.
+        """
+        idf = [idf if idf is not None else self._idf(q) for q in queries]
+        avgdl = avgdl if avgdl is not None else self.bm25_index.avgdl
+        partials = self._scatter(_bm25_shard, user_name, queries, user_name, category, top_k, idf, avgdl, fallback)
+        return [_merge([partial[i] for partial in partials], lambda hit: -hit["bm25_score"], top_k)
+                for i in range(len(queries))]
+
+    def search_scored(self, query, user_name=None, category=None, top_k=30, idf=None, avgdl=None, fallback=True):
+        return self.search_scored_many([query], user_name, category, top_k, idf, avgdl, fallback)[0]
+
+    def search_many(self, queries, user_name=None, category=None, top_k=25, query_embeddings=None):
+        """MmapVectorIndex.search_many across the shards."""
+        categories = [category] if isinstance(category, str) else list(category or [])
+        if not user_name and not categories:
+            return [[] for _ in queries]
+        if user_name and self.bm25_index.users.get(user_name.lower().strip()) is None:
+            # Not in the prebuilt corpus: category-only hits, as MmapVectorIndex gives.
+            user_name = None
+        if query_embeddings is None:
+            query_embeddings = [self.embedder.embed_query(q) for q in queries]
+        embeddings = np.asarray(query_embeddings, dtype=np.float32).reshape(len(queries), -1)
+        partials = self._scatter(_vector_shard, user_name, queries, user_name, categories, top_k, embeddings)
+
+        results = []
+        for i in range(len(queries)):
+            groups = zip(*(partial[i] for partial in partials))
+            results.append([hit for group in groups for hit in _merge(group, lambda hit: hit["distance"], top_k)])
+        return results
+
+    def search(self, query, user_name=None, category=None, top_k=25, query_embedding=None):
+        embeddings = None if query_embedding is None else [query_embedding]
+        return self.search_many([query], user_name, category, top_k, embeddings)[0]
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def sharded_retriever_from_env(bm25_index, embedder=None):
+    """A ShardedRetriever when RETRIEVAL_WORKERS > 0 and shards exist under RETRIEVAL_SHARDS_DIR, else None."""
+    workers = int(os.getenv("RETRIEVAL_WORKERS", 0))
+    shards_dir = os.getenv("RETRIEVAL_SHARDS_DIR", "data/shards")
+    if workers <= 0:
+        return None
+    if not os.path.exists(os.path.join(get_data_path(shards_dir), "manifest.json")):
+        raise FileNotFoundError(f"{get_data_path(shards_dir)} not found; run scripts/build_indexes.py --shards N")
+    return ShardedRetriever(shards_dir, bm25_index, embedder=embedder, workers=workers)
@@ -0,0 +1,45 @@
+import asyncio
+
+from src import metrics
+
+SINGLE_FLIGHT_CALLS = metrics.REGISTRY.counter(
+    "qa_single_flight_calls_total", "Calls that started work (leader) or joined one in flight (follower).", ["role"]
+)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one in-flight task.
+
+    The first caller starts `factory()`; callers arriving before it finishes
+    await the same task and get the same result or exception. A cancelled
+    caller does not cancel the others: the task is only cancelled once
+    every caller waiting on it has gone.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key, factory):
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = {"task": asyncio.ensure_future(factory()), "waiters": 0}
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+            SINGLE_FLIGHT_CALLS.inc(role="leader")
+        else:
+            SINGLE_FLIGHT_CALLS.inc(role="follower")
+
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(call["task"])
+        finally:
+            call["waiters"] -= 1
+            if not call["waiters"] and not call["task"].done():
+                call["task"].cancel()
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from src.prompt_builder import estimate_tokens
+
+CATEGORY_KEYWORDS = {
+    "Travel & Accommodation": ("hotel", "flight", "villa", "trip", "travel", "suite", "stay", "book", "itinerary"),
+    "Dining & Experiences": ("restaurant", "dinner", "table", "diet", "allerg", "concert", "tickets", "eat", "food"),
+    "Personal & Wellness": ("spa", "massage", "trainer", "gift", "wellness", "doctor", "pillow", "family"),
+    "Account & Finance": ("invoice", "payment", "refund", "card", "billing", "email", "phone", "address"),
+    "Transport & Mobility": ("car", "driver", "chauffeur", "limo", "pickup", "airport transfer", "ride"),
+}
+
+_QUESTION_WORDS = {"What", "Which", "Who", "When", "Where", "Why", "How", "Does", "Did", "Do", "Is", "Are", "Can",
+                   "Tell", "List", "Show", "Give", "Summarize", "I"}
+
+
+def _stub_metadata(query):
+    """Name and categories the extractor LLM would plausibly return, from simple rules."""
+    names = [n for n in re.findall(r"\b[A-Z][\w'’-]+(?:\s+[A-Z][\w'’-]+)*", re.sub(r"['’]s\b", "", query))
+             if n.split()[0] not in _QUESTION_WORDS]
+    lowered = query.lower()
+    scores = {c: sum(k in lowered for k in keys) for c, keys in CATEGORY_KEYWORDS.items()}
+    ranked = [c for c, s in sorted(scores.items(), key=lambda kv: -kv[1]) if s]
+    return {"user_name": names[0] if names else None, "category": ranked[:2] or ["Personal & Wellness"]}
+
+
+class StubChatModel:
+    """
+    Deterministic local stand-in for ChatGroq with the invoke/ainvoke/astream
+    surface the service uses. Extraction prompts get rule-based JSON metadata;
+    answer prompts get a fixed-length answer derived from a hash of the
+    prompt. `latency` is the time to first token and `token_latency` the
+    delay between streamed tokens.
+    """
+
+    def __init__(self, latency=0.0, token_latency=0.0, answer_tokens=60):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+
+    @staticmethod
+    def _prompt_text(prompt):
+        if isinstance(prompt, str):
+            return prompt
+        return "\n".join(getattr(m, "content", str(m)) for m in prompt)
+
+    def _content(self, text):
+        if "information extractor" in text:
+            query = text.rsplit("Query:", 1)[-1].strip()
+            return json.dumps(_stub_metadata(query))
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        words = [digest[i % 40:i % 40 + 6] for i in range(self.answer_tokens)]
+        return "Based on the messages, " + " ".join(words) + "."
+
+    @staticmethod
+    def _usage(text, content):
+        prompt_tokens, completion_tokens = estimate_tokens(text), estimate_tokens(content)
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def invoke(self, prompt):
+        text = self._prompt_text(prompt)
+        content = self._content(text)
+        time.sleep(self.latency + self.token_latency * len(content.split()))
+        return AIMessage(content=content, usage_metadata=self._usage(text, content))
+
+    async def ainvoke(self, prompt):
+        text = self._prompt_text(prompt)
+        content = self._content(text)
+        await asyncio.sleep(self.latency + self.token_latency * len(content.split()))
+        return AIMessage(content=content, usage_metadata=self._usage(text, content))
+
+    async def astream(self, prompt):
+        text = self._prompt_text(prompt)
+        content = self._content(text)
+        await asyncio.sleep(self.latency)
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield AIMessageChunk(content=word if i == len(words) - 1 else word + " ")
+        yield AIMessageChunk(content="", usage_metadata=self._usage(text, content))
@@ -1,10 +1,9 @@
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-import chromadb
+
+from src.embedding_cache import default_embedder
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 
 def get_data_path(relative_path):
@@ -12,56 +11,118 @@ def get_data_path(relative_path):
     return os.path.join(base_dir, relative_path)
 
 
-def chroma_search(query, user_name=None, category=None, top_k=25):
-    query_emb = genai.embed_content(
-        model="models/embedding-001",
-        content=query,
-        task_type="retrieval_query"
-    )["embedding"]
-
-    if isinstance(category, list):
-        category = category[0] if category else None
-
-    if user_name:
-        user_name = user_name.strip().title()
-    if category:
-        category = category.strip()
-
-    chroma_path = get_data_path("data/chroma_store")
-    chroma_client = chromadb.PersistentClient(path=chroma_path)
-    collection = chroma_client.get_collection("member_messages")
-
-    def run_query(where_filter):
-        results = collection.query(
+def _as_category_list(category):
+    if not category:
+        return []
+    if isinstance(category, str):
+        category = [category]
+    return [c.strip() for c in category if c and c.strip()]
+
+
+class VectorRetriever:
+    """
+    Long-lived handle on the Chroma collection.
+
+    The store is opened once, and a user-scoped search over several
+    categories is answered with a single filtered query (`$in` on category),
+    split by category in Python. The user-only and category-only fallback
+    levels are queried only when the level above comes back empty.
+    """
+
+    def __init__(self, chroma_path="data/chroma_store", collection_name="member_messages", overfetch=2,
+                 embedder=None):
+        import chromadb
+
+        self.embedder = embedder if embedder is not None else default_embedder()
+        self.client = chromadb.PersistentClient(path=get_data_path(chroma_path))
+        self.collection = self.client.get_collection(collection_name)
+        self.overfetch = overfetch
+
+    def embed_query(self, query):
+        return self.embedder.embed_query(query)
+
+    def warm(self):
+        return self.collection.count()
+
+    def _query(self, query_emb, where, n_results):
+        results = self.collection.query(
             query_embeddings=[query_emb],
-            n_results=top_k,
-            where=where_filter if where_filter else {}
+            n_results=n_results,
+            where=where
         )
         docs = results["documents"][0]
         metas = results["metadatas"][0]
-        return [{"message": d, **m} for d, m in zip(docs, metas) if d]
-
-    if user_name and category:
-        where = {
-            "$and": [
-                {"user_name": {"$eq": user_name}},
-                {"category": {"$eq": category}}
-            ]
-        }
-        results = run_query(where)
-        if results:
-            return results
-
-    if user_name:
-        where = {"user_name": {"$eq": user_name}}
-        results = run_query(where)
-        if results:
-            return results
-
-    if category:
-        where = {"category": {"$eq": category}}
-        results = run_query(where)
-        if results:
-            return results
-
-    return []
+        ids = results["ids"][0]
+        distances = results["distances"][0]
+        return [
+            {"message": d, "id": i, **m, "distance": float(dist)}
+            for d, m, i, dist in zip(docs, metas, ids, distances) if d
+        ]
+
+    def search(self, query, user_name=None, category=None, top_k=25, query_embedding=None):
+        """
+        Return up to `top_k` hits per category. A category with no hits for the
+        member falls back to the member's best hits overall; an unknown member
+        falls back to category-only hits.
+        """
+        categories = _as_category_list(category)
+        if not user_name and not categories:
+            return []
+
+        query_emb = query_embedding if query_embedding is not None else self.embed_query(query)
+
+        if user_name:
+            user_filter = {"user_name": {"$eq": user_name.strip().title()}}
+            by_cat = self._search_categories(query_emb, categories, top_k, user_filter)
+            if categories and all(by_cat.values()):
+                return [h for c in categories for h in by_cat[c]]
+
+            user_hits = self._query(query_emb, user_filter, top_k)
+            if user_hits:
+                return [h for c in categories for h in (by_cat[c] or user_hits)] or user_hits
+
+        by_cat = self._search_categories(query_emb, categories, top_k)
+        return [h for c in categories for h in by_cat[c]]
+
+    def _search_categories(self, query_emb, categories, top_k, base_filter=None):
+        """Top hits per category from one `$in` query, re-querying only categories crowded out of it."""
+        def with_base(cat_filter):
+            return {"$and": [base_filter, cat_filter]} if base_filter else cat_filter
+
+        by_cat = {c: [] for c in categories}
+        if not categories:
+            return by_cat
+
+        cat_filter = {"category": {"$eq": categories[0]}} if len(categories) == 1 else {"category": {"$in": categories}}
+        hits = self._query(query_emb, with_base(cat_filter), top_k * len(categories) * self.overfetch)
+        for h in hits:
+            bucket = by_cat.get(h.get("category", "").strip())
+            if bucket is not None and len(bucket) < top_k:
+                bucket.append(h)
+
+        if hits and len(categories) > 1:
+            for c in categories:
+                if not by_cat[c]:
+                    by_cat[c] = self._query(query_emb, with_base({"category": {"$eq": c}}), top_k)
+        return by_cat
+
+
+_default_retriever = None
+
+
+def chroma_search(query, user_name=None, category=None, top_k=25):
+    global _default_retriever
+    if _default_retriever is None:
+        _default_retriever = VectorRetriever()
+    return _default_retriever.search(query, user_name, category, top_k)
+
+
+def make_vector_retriever(backend=None, embedder=None):
+    """Vector backend chosen by VECTOR_BACKEND: "chroma" (default) or "mmap"."""
+    backend = backend or os.getenv("VECTOR_BACKEND", "chroma")
+    if backend == "chroma":
+        return VectorRetriever(embedder=embedder)
+    if backend == "mmap":
+        from src.mmap_vector_index import MmapVectorIndex
+        return MmapVectorIndex(embedder=embedder)
+    raise ValueError(f"Unknown VECTOR_BACKEND '{backend}', expected 'chroma' or 'mmap'")
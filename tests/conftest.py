@@ -0,0 +1,93 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEMBERS = ["Ada Lovelace", "Alan Turing", "Grace Hopper", "Edsger Dijkstra", "Barbara Liskov", "Donald Knuth",
+           "Frances Allen", "John McCarthy"]
+TOPICS = {
+    "Travel & Accommodation": ["hotel suite in Paris", "flight to Tokyo", "villa in Tuscany", "train to Rome"],
+    "Dining & Experiences": ["table at Nobu", "tasting menu at Noma", "concert tickets", "vegan dinner"],
+    "Personal & Wellness": ["spa massage", "personal trainer", "birthday gift", "doctor appointment"],
+    "Account & Finance": ["refund for the invoice", "new card ending 4242", "billing address", "payment failed"],
+}
+
+
+def make_messages(n_per_pair=6, seed=0):
+    """A small deterministic corpus: every member has messages in every category."""
+    rng = random.Random(seed)
+    messages = []
+    for u, user in enumerate(MEMBERS):
+        for category, topics in TOPICS.items():
+            for i in range(n_per_pair):
+                day = rng.randint(1, 28)
+                messages.append({
+                    "id": f"{u}-{len(messages)}",
+                    "user_id": f"u{u}",
+                    "user_name": user,
+                    "timestamp": f"2024-{rng.randint(1, 12):02d}-{day:02d}T{rng.randint(0, 23):02d}:00:00+00:00",
+                    "message": f"Please arrange a {rng.choice(topics)} and {rng.choice(topics)} for me, ref {len(messages)}",
+                    "category": category,
+                })
+    return messages
+
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory):
+    """Prebuilt message store, BM25 index and mmap vector index (hash embeddings) over `make_messages()`."""
+    from src.bm25_retrieval import BM25Index
+    from src.embedding_provider import HashEmbeddingProvider
+    from src.message_store import MessageStore
+    from src.mmap_vector_index import MmapVectorIndex
+
+    root = tmp_path_factory.mktemp("corpus")
+    messages = make_messages()
+    provider = HashEmbeddingProvider(dim=64)
+    MmapVectorIndex.save(str(root / "vector_index"), [m["id"] for m in messages], [m["message"] for m in messages],
+                         [{k: m[k] for k in ("user_id", "user_name", "timestamp", "category")} for m in messages],
+                         provider.embed([m["message"] for m in messages], "retrieval_document"))
+    vectors = MmapVectorIndex(str(root / "vector_index"), embedder=provider)
+    store = vectors.records
+    bm25 = BM25Index.build(store)
+    return {"root": root, "messages": messages, "provider": provider, "store": store, "bm25": bm25,
+            "vectors": vectors}
+
+
+@pytest.fixture
+def make_service(corpus, tmp_path, monkeypatch):
+    """
+    Build a QAService over `corpus` with the stub LLM; keyword arguments are
+    environment overrides (e.g. STUB_LLM_LATENCY, REQUEST_BUDGET).
+    """
+    import json
+
+    from src.answer_cache import AnswerCache, MemoryBackend
+    from src.embedding_cache import CachedEmbedder, EmbeddingCache
+    from src.mmap_vector_index import MmapVectorIndex
+
+    messages_path = tmp_path / "messages_with_categories.json"
+    messages_path.write_text(json.dumps(corpus["messages"]))
+    user_index_path = tmp_path / "user_index.json"
+    user_index_path.write_text(json.dumps(MEMBERS))
+
+    def make(**env):
+        monkeypatch.setenv("LLM_PROVIDER", "stub")
+        monkeypatch.setenv("RETRIEVAL_WORKERS", "0")
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        from src.qa_service import QAService
+
+        # Wrapped as in production, which gives the provider its async query path.
+        vectors = MmapVectorIndex(str(corpus["root"] / "vector_index"),
+                                  embedder=CachedEmbedder(EmbeddingCache(), provider=corpus["provider"]))
+        return QAService(messages_path=str(messages_path), user_index_path=str(user_index_path),
+                         bm25_index_path=str(tmp_path / "bm25_index"),
+                         message_store_dir=str(tmp_path / "message_store"),
+                         category_model_path=str(tmp_path / "category_model.joblib"),
+                         segments_dir=str(tmp_path / "segments"),
+                         analytics_index_path=str(tmp_path / "analytics_index"),
+                         vector_retriever=vectors, answer_cache=AnswerCache(MemoryBackend(max_entries=0)))
+    return make
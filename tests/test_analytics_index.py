@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import make_messages
+
+from src.analytics_index import AnalyticsIndex, extract_entities, format_facts, question_intent
+from src.message_store import MessageStore
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("What is Vikram Desai's latest phone number?", {"temporal"}),
+    ("Which hotel did Layla Kawaguchi book most recently?", {"temporal"}),
+    ("Where is Sophia Al-Farsi currently staying?", {"temporal"}),
+    ("What is Armand Dupont's current address?", {"temporal"}),
+    ("Where did Hans Müller go on his last trip?", {"temporal"}),
+    ("What restaurant did Amira Khalil book recently?", {"temporal"}),
+    ("How many times has Vikram Desai stayed at the Ritz?", {"count"}),
+    ("How often does Layla Kawaguchi fly to Tokyo?", {"count"}),
+    ("Which restaurant does Lorenzo Cavalli book most often?", {"count"}),
+    ("How many different hotels has Thiago Monteiro used?", {"count"}),
+    ("How many times did Fatima El-Tahir change her latest booking?", {"temporal", "count"}),
+])
+def test_analytics_questions(question, intent):
+    assert question_intent(question) == intent
+
+
+@pytest.mark.parametrize("question", [
+    "When is Layla planning her trip to London?",
+    "How many cars does Vikram Desai have?",
+    "How many people is Amira Khalil's dinner reservation for?",
+    "What is Sophia Al-Farsi's favourite restaurant?",
+    "What does Hans usually order for breakfast?",
+    "Can you book Armand a table now?",
+    "Did Lorenzo update his seat preference?",
+    "What is Thiago's last name?",
+    "How much did Fatima spend on the spa?",
+    "Does Vikram count calories?",
+    "",
+])
+def test_ordinary_questions(question):
+    assert question_intent(question) == set()
+
+
+def test_extract_entities():
+    found = extract_entities("Book a table at Nobu Malibu, email me at Ada@Example.com or call +1 (555) 123-4567, "
+                             "and charge the card ending in 4242.")
+    assert ("name", "nobu malibu", "Nobu Malibu") in found
+    assert ("email", "ada@example.com", "Ada@Example.com") in found
+    assert ("phone", "15551234567", "+1 (555) 123-4567") in found
+    assert ("card", "4242", "ending 4242") in found
+
+
+@pytest.mark.parametrize("text, phones", [
+    ("The suite is booked for 2024-05-12.", []),
+    ("Landing 2024-05-12T09:30:00Z, call +1 (555) 123-4567", ["15551234567"]),
+    ("Dinner on 12/05/2024 at 20:00", []),
+    ("Moved from 2024.05.12 to 13.05.2024", []),
+    ("Pick-up at 2024-05-12 14:30, driver on 555-123-4567", ["5551234567"]),
+    ("Her French number is 06.12.34.56.78", ["0612345678"]),
+])
+def test_dates_are_not_phones(text, phones):
+    assert [key for kind, key, _ in extract_entities(text) if kind == "phone"] == phones
+
+
+def test_load_rejects_index_over_other_rows(tmp_path):
+    store = MessageStore.build(make_messages(n_per_pair=2))
+    AnalyticsIndex.build(store).save(str(tmp_path))
+    assert len(AnalyticsIndex.load(str(tmp_path), store)) == len(AnalyticsIndex.build(store))
+    # Same number of rows, different messages.
+    other = MessageStore.build(make_messages(n_per_pair=2, seed=1))
+    assert len(other) == len(store)
+    with pytest.raises(ValueError, match="does not match the message store"):
+        AnalyticsIndex.load(str(tmp_path), other)
+
+
+STATS = {
+    ("name", "Nobu"): {"count": 9, "first": (100, "2024-01-01"), "last": (200, "2024-02-01")},
+    ("name", "Noma"): {"count": 4, "first": (150, "2024-01-15"), "last": (300, "2024-03-01")},
+    ("name", "Le Cinq"): {"count": 1, "first": (400, "2024-04-01"), "last": (400, "2024-04-01")},
+}
+
+
+def test_facts_rank_by_count():
+    assert [line.split(":")[0] for line in format_facts(STATS)] == ["Nobu", "Noma", "Le Cinq"]
+    assert format_facts(STATS)[2] == "Le Cinq: 1 message, first 2024-04-01, latest 2024-04-01"
+
+
+def test_latest_facts_survive_the_limit():
+    assert [line.split(":")[0] for line in format_facts(STATS, limit=1)] == ["Nobu"]
+    assert [line.split(":")[0] for line in format_facts(STATS, limit=1, latest_first=True)] == ["Le Cinq"]
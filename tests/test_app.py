@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app as app_module
+from conftest import MEMBERS
+
+
+@pytest.fixture
+def client(make_service, monkeypatch):
+    """Call the app in process with the given service (ASGI transport runs no startup hook)."""
+    def make(service):
+        monkeypatch.setattr(app_module, "qa_service", service)
+        transport = httpx.ASGITransport(app=app_module.app)
+        return httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30)
+    return make
+
+
+def test_batch_items_get_their_own_budget(make_service, client):
+    # Answered one at a time, the batch takes several budgets end to end.
+    service = make_service(STUB_LLM_LATENCY=0.2, REQUEST_BUDGET=0.5, BATCH_LLM_CONCURRENCY=1)
+    questions = [f"What hotel did {name} book?" for name in MEMBERS[:5]]
+
+    async def run():
+        async with client(service) as http:
+            return await http.post("/questions", json={"questions": questions})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    answers = response.json()["answers"]
+    assert [a["question"] for a in answers] == questions
+    assert all(a["error"] is None and a["answer"] for a in answers)
+
+
+class Disconnected:
+    headers = {}
+
+
+def test_stream_disconnect_is_counted(make_service, monkeypatch):
+    from src.admission import CLIENT_DISCONNECTS
+
+    monkeypatch.setattr(app_module, "qa_service", make_service(STUB_LLM_TOKEN_LATENCY=0.01))
+    before = CLIENT_DISCONNECTS._values.get(("/question/stream",), 0)
+
+    async def run():
+        response = await app_module.stream_question(
+            app_module.QuestionRequest(question=f"What hotel did {MEMBERS[0]} book?"), Disconnected())
+        body = response.body_iterator
+        async for chunk in body:
+            if chunk.startswith("event: token"):
+                break
+        await asyncio.create_task(body.aclose())
+
+    asyncio.run(run())
+    assert CLIENT_DISCONNECTS._values.get(("/question/stream",), 0) == before + 1
+    assert app_module.admission.active == 0
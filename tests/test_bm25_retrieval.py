@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from conftest import MEMBERS
+
+from src.bm25_retrieval import BM25Index, tokenize
+
+QUESTIONS = ["table at Nobu", "flight to Tokyo and villa in Tuscany", "refund for the invoice, please", "spa"]
+
+
+def test_scores_match_okapi(corpus):
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    store, bm25 = corpus["store"], corpus["bm25"]
+    okapi = rank_bm25.BM25Okapi([tokenize(store[row]["message"]) for row in range(len(store))])
+    everything = bm25.candidates()
+    for question in QUESTIONS:
+        np.testing.assert_allclose(bm25.get_scores(question, everything), okapi.get_scores(tokenize(question)),
+                                   rtol=1e-4, atol=1e-4)
+
+
+def test_filters_touch_only_matching_messages(corpus):
+    bm25 = corpus["bm25"]
+    user, category = MEMBERS[2], "Dining & Experiences"
+    hits = bm25.search_scored("table at Nobu", user, category, top_k=50)
+    assert hits and all(h["user_name"] == user and h["category"] == category for h in hits)
+    assert [h["bm25_score"] for h in hits] == sorted((h["bm25_score"] for h in hits), reverse=True)
+    assert all(h["user_name"] == user for h in bm25.search_scored("table at Nobu", user.upper(), None))
+    # A category the member has no messages in falls back to the member's messages.
+    assert {h["user_name"] for h in bm25.search_scored("limousine", user, "Transportation & Logistics")} == {user}
+    assert bm25.search_scored("table at Nobu", "Nobody Known", None) == []
+
+
+def test_batched_search_matches_single_queries(corpus):
+    bm25 = corpus["bm25"]
+    batched = bm25.search_scored_many(QUESTIONS, MEMBERS[3], "Travel & Accommodation")
+    assert batched == [bm25.search_scored(q, MEMBERS[3], "Travel & Accommodation") for q in QUESTIONS]
+
+
+@pytest.mark.parametrize("name", ["bm25_index", "bm25_index.npz"])
+def test_saved_index_answers_the_same(corpus, tmp_path, name):
+    store, bm25 = corpus["store"], corpus["bm25"]
+    bm25.save(str(tmp_path / name))
+    loaded = BM25Index.load(str(tmp_path / name), store)
+    for question in QUESTIONS:
+        assert loaded.search_scored(question, MEMBERS[0]) == bm25.search_scored(question, MEMBERS[0])
+
+
+def test_load_rejects_other_messages(corpus, tmp_path):
+    corpus["bm25"].save(str(tmp_path / "bm25_index"))
+    messages = [{**m, "id": f"x{i}"} for i, m in enumerate(corpus["messages"])]
+    with pytest.raises(ValueError, match="does not match"):
+        BM25Index.load(str(tmp_path / "bm25_index"), messages)
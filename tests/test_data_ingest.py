@@ -0,0 +1,96 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from scripts import data_ingest
+
+
+def message(i):
+    return {"id": f"m{i}", "user_id": "u1", "user_name": "Ada Lovelace",
+            "timestamp": f"2024-01-01T{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}", "message": f"message {i}"}
+
+
+@pytest.fixture
+def source():
+    """A stub of the messages API paging over `server.items` with skip/limit."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            skip, limit = int(query["skip"][0]), int(query["limit"][0])
+            server.requests.append((skip, limit))
+            body = json.dumps({"total": len(server.items), "items": server.items[skip:skip + limit]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.items, server.requests = [message(i) for i in range(1203)], []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/messages"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run(source, tmp_path, **kwargs):
+    out, state = tmp_path / "messages.jsonl", tmp_path / "state.json"
+    fetched = data_ingest.sync(source.url, str(out), str(state), page_size=100, **kwargs)
+    return fetched, [m["id"] for m in data_ingest.iter_messages(out)], json.loads(state.read_text())
+
+
+def test_full_sync_pages_through_the_source(source, tmp_path):
+    fetched, ids, state = run(source, tmp_path)
+    assert fetched == 1203
+    assert ids == [m["id"] for m in source.items]
+    assert state["offset"] == 1203 and state["last_id"] == "m1202"
+    assert max(limit for _, limit in source.requests) <= 101
+
+
+def test_delta_sync_fetches_only_new_messages(source, tmp_path):
+    run(source, tmp_path)
+    source.items += [message(i) for i in range(1203, 1250)]
+    source.requests.clear()
+    fetched, ids, state = run(source, tmp_path)
+    assert fetched == 47
+    assert ids == [m["id"] for m in source.items]
+    assert state["offset"] == 1250
+    assert all(skip >= 1202 for skip, _ in source.requests[1:])
+
+
+def test_unchanged_source_fetches_nothing(source, tmp_path):
+    run(source, tmp_path)
+    fetched, ids, _ = run(source, tmp_path)
+    assert fetched == 0
+    assert len(ids) == len(set(ids)) == 1203
+
+
+def test_insert_below_offset_runs_a_full_sync(source, tmp_path):
+    run(source, tmp_path)
+    source.items.insert(500, message(5000))
+    source.items.append(message(5001))
+    fetched, ids, _ = run(source, tmp_path)
+    assert fetched == 1205
+    assert ids == [m["id"] for m in source.items]
+
+
+def test_shrunk_source_runs_a_full_sync(source, tmp_path):
+    run(source, tmp_path)
+    del source.items[1000:]
+    fetched, ids, _ = run(source, tmp_path)
+    assert fetched == 1000
+    assert ids == [m["id"] for m in source.items]
+
+
+def test_export_json_writes_an_array(source, tmp_path):
+    run(source, tmp_path)
+    data_ingest.export_json(str(tmp_path / "messages.jsonl"), str(tmp_path / "messages.json"))
+    assert json.loads((tmp_path / "messages.json").read_text()) == source.items
@@ -0,0 +1,68 @@
+from conftest import MEMBERS, TOPICS
+
+from src.fusion import fuse_results
+
+
+def hits(field, scores):
+    return [{"id": key, "message": f"message {key}", field: score} for key, score in scores.items()]
+
+
+def fuse(bm25, chroma, **kwargs):
+    sources = {"bm25": (hits("bm25_score", bm25), "bm25_score", True),
+               "chroma": (hits("distance", chroma), "distance", False)}
+    return [r["id"] for r in fuse_results(sources, mmr_lambda=1.0, **kwargs)]
+
+
+def test_hit_found_by_both_sources_leads():
+    assert fuse({"a": 5.0, "b": 9.0}, {"b": 0.2, "c": 0.1})[0] == "b"
+
+
+def test_score_gap_breaks_rank_ties():
+    # b and e are both second in their source, but e is nearly as close as the best vector hit.
+    bm25 = {"a": 10.0, "b": 1.0, "c": 0.5}
+    chroma = {"d": 0.10, "e": 0.12, "f": 1.60}
+    assert fuse(bm25, chroma) == ["a", "d", "e", "b", "c", "f"]
+    # Ranks alone can't tell them apart.
+    assert fuse(bm25, chroma, score_weight=0.0)[2:4] == ["b", "e"]
+
+
+def test_weights_favour_a_source():
+    bm25, chroma = {"a": 1.0, "b": 0.5}, {"c": 0.1, "d": 0.2}
+    assert fuse(bm25, chroma)[0] == "a"
+    assert fuse(bm25, chroma, weights={"chroma": 2.0})[0] == "c"
+
+
+def test_duplicates_keep_their_best_score():
+    sources = {"bm25": (hits("bm25_score", {"a": 1.0}) + hits("bm25_score", {"a": 3.0, "b": 2.0}), "bm25_score", True)}
+    fused = fuse_results(sources)
+    assert [r["id"] for r in fused] == ["a", "b"]
+    assert fused[0]["scores"]["bm25_score"] == 3.0
+
+
+def recall(retrieved, relevant, k):
+    return len(relevant & set(retrieved[:k])) / min(len(relevant), k)
+
+
+def test_fused_context_keeps_single_source_recall(corpus):
+    k = 5
+    runs = {"bm25": [], "vector": [], "rrf": [], "fused": []}
+    for user in MEMBERS:
+        for phrases in TOPICS.values():
+            for phrase in phrases:
+                relevant = {m["id"] for m in corpus["messages"] if m["user_name"] == user and phrase in m["message"]}
+                if not relevant:
+                    continue
+                question = f"Did {user} ask for the {phrase}?"
+                embedding = corpus["provider"].embed([question], "retrieval_query")[0]
+                bm25 = corpus["bm25"].search_scored(question, user, None, 30)
+                vector = corpus["vectors"].search(question, user, None, 25, embedding)
+                sources = {"bm25": (bm25, "bm25_score", True), "chroma": (vector, "distance", False)}
+                runs["bm25"].append(recall([h["id"] for h in bm25], relevant, k))
+                runs["vector"].append(recall([h["id"] for h in vector], relevant, k))
+                runs["rrf"].append(recall([h["id"] for h in fuse_results(sources, top_n=k, score_weight=0.0)],
+                                          relevant, k))
+                runs["fused"].append(recall([h["id"] for h in fuse_results(sources, top_n=k)], relevant, k))
+
+    mean = {name: sum(values) / len(values) for name, values in runs.items()}
+    assert mean["fused"] >= 0.95 * max(mean["bm25"], mean["vector"])
+    assert mean["fused"] >= mean["rrf"]
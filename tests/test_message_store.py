@@ -0,0 +1,59 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import make_messages
+
+from src.message_store import MessageStore, load_or_build_store
+
+
+@pytest.fixture
+def saved(tmp_path):
+    """A messages file and a store saved from it."""
+    messages_path = str(tmp_path / "messages_with_categories.json")
+    with open(messages_path, "w") as f:
+        json.dump(make_messages(n_per_pair=2), f)
+    store_dir = str(tmp_path / "message_store")
+    with open(messages_path) as f:
+        MessageStore.build(json.load(f), source=messages_path).save(store_dir)
+    return messages_path, store_dir
+
+
+def loaded(store):
+    return isinstance(store.ids, np.memmap)
+
+
+def test_store_matching_its_source_is_loaded(saved):
+    messages_path, store_dir = saved
+    assert loaded(load_or_build_store(messages_path, store_dir, build=False))
+
+
+def test_copied_source_with_same_content_still_matches(saved):
+    messages_path, store_dir = saved
+    stat = os.stat(messages_path)
+    os.utime(messages_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert loaded(load_or_build_store(messages_path, store_dir, build=False))
+
+
+def test_store_from_another_source_is_rebuilt_or_refused(saved):
+    messages_path, store_dir = saved
+    messages = make_messages(n_per_pair=2)
+    messages[0]["message"] = "Please cancel my hotel suite in Paris"
+    with open(messages_path, "w") as f:
+        json.dump(messages, f)
+
+    with pytest.raises(FileNotFoundError, match="doesn't match"):
+        load_or_build_store(messages_path, store_dir, build=False)
+    store = load_or_build_store(messages_path, store_dir)
+    assert not loaded(store)
+    assert "Please cancel my hotel suite in Paris" in {store[row]["message"] for row in range(len(store))}
+    assert store.built_from(messages_path)
+
+
+def test_fingerprint_is_saved_and_follows_the_rows(saved):
+    _, store_dir = saved
+    store = MessageStore.load(store_dir)
+    assert store.fingerprint == MessageStore.build(make_messages(n_per_pair=2)).fingerprint
+    assert store.fingerprint != MessageStore.build(make_messages(n_per_pair=2, seed=1)).fingerprint
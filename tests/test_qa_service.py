@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from conftest import MEMBERS
+
+
+class TrackedLLM:
+    """Wraps the stub LLM, recording whether an answer stream was closed."""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.closed = False
+
+    async def ainvoke(self, prompt):
+        return await self.llm.ainvoke(prompt)
+
+    async def astream(self, prompt):
+        try:
+            async for chunk in self.llm.astream(prompt):
+                yield chunk
+        finally:
+            self.closed = True
+
+
+def test_stream_closed_from_another_context_closes_the_llm_stream(make_service):
+    service = make_service(STUB_LLM_TOKEN_LATENCY=0.01)
+    service.llm = TrackedLLM(service.llm)
+
+    async def run():
+        stream = service.stream_answer(f"What hotel did {MEMBERS[0]} book?")
+        events = []
+        async for event, _ in stream:
+            events.append(event)
+            if event == "token":
+                break
+        # As when the server finalizes the stream of a client that went away.
+        await asyncio.create_task(stream.aclose())
+        return events
+
+    assert asyncio.run(run()) == ["metadata", "retrieval", "token"]
+    assert service.llm.closed
+
+
+def test_batch_bounds_extractor_calls(make_service, monkeypatch):
+    import src.qa_service as qa_service
+
+    service = make_service(BATCH_LLM_CONCURRENCY=2)
+    extract = qa_service.aextract_metadata
+    running = peak = 0
+
+    async def counted(query):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.01)
+            return await extract(query)
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(qa_service, "aextract_metadata", counted)
+    questions = [f"What hotel did {name} book?" for name in MEMBERS]
+    answers = asyncio.run(service.answer_batch(questions))
+    assert all("answer" in a for a in answers)
+    assert peak == 2
+
+
+def test_blocking_answers_share_one_event_loop(make_service):
+    service = make_service()
+    loops = []
+
+    class LoopRecorder(TrackedLLM):
+        async def ainvoke(self, prompt):
+            loops.append(asyncio.get_running_loop())
+            return await self.llm.ainvoke(prompt)
+
+    service.llm = LoopRecorder(service.llm)
+    assert service.answer_question(f"What hotel did {MEMBERS[0]} book?")
+    assert service.answer_question(f"What hotel did {MEMBERS[1]} book?")
+    assert len(loops) == 2 and loops[0] is loops[1] and not loops[0].is_closed()
+
+
+def test_session_fetch_keeps_fallback_vector_hits(make_service, corpus):
+    service = make_service()
+    generation = service.live_index.current()
+    question = f"Has {MEMBERS[0]} booked a limousine?"
+    embedding = corpus["provider"].embed([question], "retrieval_query")[0]
+    # A category the member has no messages in: the pipeline falls back to the member's hits in any category.
+    categories = ["Transportation & Logistics", "Travel & Accommodation"]
+    fetched = service._session_fetch(generation, question, MEMBERS[0].lower(), categories, embedding)
+    for category in categories:
+        expected = generation.vector_search(question, MEMBERS[0].lower(), [category], 25, embedding)
+        assert expected
+        assert [h["id"] for h in fetched[category]["chroma"]] == [h["id"] for h in expected]
+
+
+def test_batch_budget_is_per_question(make_service):
+    questions = [f"What hotel did {name} book?" for name in MEMBERS[:4]]
+
+    # One at a time the batch outlasts a budget, but no single question does.
+    service = make_service(STUB_LLM_LATENCY=0.15, REQUEST_BUDGET=0.4, BATCH_LLM_CONCURRENCY=1)
+    assert all("answer" in a for a in asyncio.run(service.answer_batch(questions)))
+
+    # A question slower than the budget is cut off at the budget.
+    service = make_service(STUB_LLM_LATENCY=1.0, REQUEST_BUDGET=0.2)
+    start = time.perf_counter()
+    answers = asyncio.run(service.answer_batch(questions[:1]))
+    assert answers[0]["error"] == "Answer model unavailable, please retry"
+    assert time.perf_counter() - start < 1.0
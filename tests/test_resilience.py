@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+import pytest
+
+from src.fault_injection import FaultInjector
+from src.resilience import (CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientClient, UpstreamError,
+                            request_budget)
+
+
+class Upstream:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        return f"answer to {prompt}"
+
+    async def astream(self, prompt):
+        self.calls += 1
+        for token in ["answer", " to ", prompt]:
+            yield token
+
+
+def make_client(failure_rate=0.0, slow_rate=0.0, slow_latency=1.0, **kwargs):
+    upstream = Upstream()
+    injector = FaultInjector(upstream, failure_rate=failure_rate, slow_rate=slow_rate, slow_latency=slow_latency)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    client = ResilientClient("test", timeout=0.5, retries=0, breaker=breaker, **kwargs)
+    return client, injector, upstream
+
+
+def call(client, injector):
+    return asyncio.run(client.call(lambda: injector.ainvoke("q")))
+
+
+def stream(client, factory):
+    async def consume():
+        return "".join([chunk async for chunk in client.stream(factory)])
+    return asyncio.run(consume())
+
+
+def open_breaker(client, injector):
+    for _ in range(client.breaker.failure_threshold):
+        with pytest.raises(UpstreamError):
+            call(client, injector)
+    assert client.breaker.state == "open"
+
+
+def wait_half_open(client):
+    time.sleep(client.breaker.reset_timeout * 1.5)
+    assert client.breaker.state == "half_open"
+
+
+def test_closed_breaker_passes_calls():
+    client, injector, upstream = make_client()
+    assert call(client, injector) == "answer to q"
+    assert client.breaker.state == "closed"
+    assert upstream.calls == 1
+
+
+def test_consecutive_failures_open_the_breaker():
+    client, injector, upstream = make_client(failure_rate=1.0)
+    open_breaker(client, injector)
+    with pytest.raises(CircuitOpenError):
+        call(client, injector)
+    assert upstream.calls == 0
+
+
+def test_successful_probe_closes_the_breaker():
+    client, injector, _ = make_client(failure_rate=1.0)
+    open_breaker(client, injector)
+    wait_half_open(client)
+    injector.failure_rate = 0.0
+    assert call(client, injector) == "answer to q"
+    assert client.breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker():
+    client, injector, _ = make_client(failure_rate=1.0)
+    open_breaker(client, injector)
+    wait_half_open(client)
+    with pytest.raises(UpstreamError):
+        call(client, injector)
+    assert client.breaker.state == "open"
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_exhausted_budget_does_not_take_the_probe():
+    client, injector, upstream = make_client(failure_rate=1.0)
+    open_breaker(client, injector)
+    wait_half_open(client)
+    with request_budget(0), pytest.raises(DeadlineExceeded):
+        call(client, injector)
+    injector.failure_rate = 0.0
+    assert call(client, injector) == "answer to q"
+    assert client.breaker.state == "closed"
+
+
+def test_stream_factory_raising_records_the_failed_probe():
+    client, injector, _ = make_client(failure_rate=1.0)
+    open_breaker(client, injector)
+    wait_half_open(client)
+
+    def broken():
+        raise ConnectionError("refused")
+
+    with pytest.raises(UpstreamError):
+        stream(client, broken)
+    assert client.breaker.state == "open"
+    wait_half_open(client)
+    injector.failure_rate = 0.0
+    assert stream(client, lambda: injector.astream("q")) == "answer to q"
+    assert client.breaker.state == "closed"
+
+
+def test_stall_past_timeout_is_a_deadline_failure():
+    client, injector, _ = make_client(slow_rate=1.0, slow_latency=1.0)
+    client.timeout = 0.05
+    with pytest.raises(DeadlineExceeded):
+        call(client, injector)
+    assert client.breaker.failures == 1
+
+
+def test_request_budget_caps_the_timeout():
+    client, injector, _ = make_client(slow_rate=1.0, slow_latency=1.0)
+    start = time.monotonic()
+    with request_budget(0.05), pytest.raises(DeadlineExceeded):
+        call(client, injector)
+    assert time.monotonic() - start < 0.4
+
+
+def test_hedge_answers_when_the_first_call_stalls():
+    client, injector, upstream = make_client(max_hedges=1, min_hedge_delay=0.01)
+    client.latencies.extend([0.01] * client.min_samples)
+    attempts = []
+
+    def factory():
+        # Only the first attempt stalls; the hedge sent after the p95 delay answers.
+        injector.slow_rate = 1.0 if not attempts else 0.0
+        attempts.append(1)
+        return injector.ainvoke("q")
+
+    start = time.monotonic()
+    assert asyncio.run(client.call(factory)) == "answer to q"
+    assert time.monotonic() - start < 0.4
+    assert len(attempts) == 2
+    assert upstream.calls == 1
@@ -0,0 +1,53 @@
+import pytest
+
+from src.sharded_retrieval import ShardedRetriever, build_shards, shard_of
+
+from conftest import MEMBERS, TOPICS
+
+QUESTIONS = ["hotel suite in Paris", "table at Nobu for dinner", "refund the invoice", "spa massage and trainer"]
+
+
+@pytest.fixture(scope="module")
+def engine(corpus):
+    shards_dir = str(corpus["root"] / "shards")
+    build_shards(corpus["vectors"], shards_dir, n_shards=3)
+    engine = ShardedRetriever(shards_dir, corpus["bm25"], embedder=corpus["provider"], workers=2)
+    yield engine
+    engine.close()
+
+
+def assert_same_hits(actual, expected, score):
+    """
+    Per query and per category: the same scores in order, and the same ids
+    above the lowest score kept; hits tied at that cut may differ.
+    """
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert len(got) == len(want)
+        for category in {h["category"] for h in want}:
+            got_scores = [round(h[score], 4) for h in got if h["category"] == category]
+            want_scores = [round(h[score], 4) for h in want if h["category"] == category]
+            assert got_scores == want_scores
+            cut = want_scores[-1]
+            assert {h["id"] for h in got if h["category"] == category and round(h[score], 4) != cut} == \
+                {h["id"] for h in want if h["category"] == category and round(h[score], 4) != cut}
+
+
+def test_members_spread_over_shards():
+    assert len({shard_of(member, 3) for member in MEMBERS}) > 1
+
+
+@pytest.mark.parametrize("user_name", [MEMBERS[0], MEMBERS[5], None, "Nobody Known"])
+@pytest.mark.parametrize("categories", [["Travel & Accommodation"], ["Travel & Accommodation", "Dining & Experiences"],
+                                        list(TOPICS), []])
+def test_vector_search_matches_unsharded(corpus, engine, user_name, categories):
+    embeddings = corpus["provider"].embed(QUESTIONS, "retrieval_query")
+    expected = corpus["vectors"].search_many(QUESTIONS, user_name, categories, 5, embeddings)
+    assert_same_hits(engine.search_many(QUESTIONS, user_name, categories, 5, embeddings), expected, "distance")
+
+
+@pytest.mark.parametrize("user_name", [MEMBERS[1], None])
+@pytest.mark.parametrize("category", ["Dining & Experiences", None])
+def test_bm25_search_matches_unsharded(corpus, engine, user_name, category):
+    expected = corpus["bm25"].search_scored_many(QUESTIONS, user_name, category, 10)
+    assert_same_hits(engine.search_scored_many(QUESTIONS, user_name, category, 10), expected, "bm25_score")